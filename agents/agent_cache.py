@@ -10,8 +10,8 @@ Webhook нужен только для:
 - Мониторинга и статистики
 """
 
-from typing import Dict, Optional
-from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+from dataclasses import dataclass, field
 from threading import RLock
 import time
 import hashlib
@@ -28,6 +28,7 @@ class CachedAgent:
     agent_id: str
     user_id: Optional[str]
     config_hash: str
+    tool_ids: FrozenSet[str] = field(default_factory=frozenset)
 
 
 class DynamicAgentCache:
@@ -46,11 +47,16 @@ class DynamicAgentCache:
         Создает хэш с updated_at - автоматически меняется при ЛЮБЫХ изменениях в БД.
         Триггеры уже настроены! Не нужно думать о том, какие поля важны.
         """
+        return self.version_hash(dynamic_agent.agent_id, dynamic_agent.updated_at)
+    
+    @staticmethod
+    def version_hash(agent_id: str, updated_at) -> str:
+        """Хэш версии конфигурации по agent_id и updated_at (используется и при resync)"""
         # Простой подход: используем updated_at как индикатор ЛЮБЫХ изменений
-        updated_at_str = dynamic_agent.updated_at.isoformat() if dynamic_agent.updated_at else "no_date"
+        updated_at_str = updated_at.isoformat() if updated_at else "no_date"
         
         # Хэшируем agent_id + updated_at = уникальный хэш для каждой версии конфигурации
-        hash_data = f"{dynamic_agent.agent_id}|{updated_at_str}"
+        hash_data = f"{agent_id}|{updated_at_str}"
         return hashlib.md5(hash_data.encode()).hexdigest()[:12]
     
     def _make_key(self, agent_id: str, model_id: str, user_id: Optional[str], 
@@ -88,7 +94,8 @@ class DynamicAgentCache:
                 created_at=time.time(),
                 agent_id=agent.agent_id,
                 user_id=user_id,
-                config_hash=config_hash
+                config_hash=config_hash,
+                tool_ids=frozenset(str(tool_id) for tool_id in (getattr(dynamic_agent, "tool_ids", None) or []))
             )
     
     def invalidate_agent(self, agent_id: str) -> int:
@@ -104,6 +111,20 @@ class DynamicAgentCache:
             
             return len(keys_to_remove)
     
+    def invalidate_agents(self, agent_ids: Iterable[str]) -> int:
+        """Инвалидация нескольких агентов за один проход по кэшу"""
+        agent_ids = set(agent_ids)
+        with self._lock:
+            keys_to_remove = [
+                key for key, cached in self._cache.items()
+                if cached.agent_id in agent_ids
+            ]
+            
+            for key in keys_to_remove:
+                del self._cache[key]
+            
+            return len(keys_to_remove)
+    
     def invalidate_user(self, user_id: str) -> int:
         """Инвалидация всех агентов пользователя"""
         with self._lock:
@@ -117,6 +138,23 @@ class DynamicAgentCache:
                 
             return len(keys_to_remove)
     
+    def agents_with_tools(self, tool_ids: Iterable[str]) -> Set[str]:
+        """agent_id закэшированных агентов, собранных с любым из инструментов"""
+        tool_ids = {str(tool_id) for tool_id in tool_ids}
+        with self._lock:
+            return {
+                cached.agent_id for cached in self._cache.values()
+                if cached.tool_ids & tool_ids
+            }
+    
+    def versions(self) -> Dict[str, Set[str]]:
+        """Закэшированные версии конфигураций: agent_id -> хэши версий"""
+        with self._lock:
+            result: Dict[str, Set[str]] = {}
+            for cached in self._cache.values():
+                result.setdefault(cached.agent_id, set()).add(cached.config_hash)
+            return result
+    
     def clear(self) -> int:
         """Очистка всего кэша"""
         with self._lock:
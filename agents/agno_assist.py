@@ -7,10 +7,11 @@ from agno.knowledge.url import UrlKnowledge
 from agno.memory.v2.db.postgres import PostgresMemoryDb
 from agno.memory.v2.memory import Memory
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
 from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.vectordb.pgvector import PgVector, SearchType
 
+from agents.embedding_cache import cached_embedder
+from agents.storage_resolver import get_storage
 from db.session import db_url
 
 
@@ -21,7 +22,7 @@ def get_agno_assist_knowledge() -> AgentKnowledge:
             db_url=db_url,
             table_name="agno_assist_knowledge",
             search_type=SearchType.hybrid,
-            embedder=OpenAIEmbedder(id="text-embedding-3-small"),
+            embedder=cached_embedder(OpenAIEmbedder(id="text-embedding-3-small")),
         ),
     )
 
@@ -105,11 +106,7 @@ def get_agno_assist(
         search_knowledge=True,
         # -*- Storage -*-
         # Storage chat history and session state in a Postgres table
-        storage=PostgresAgentStorage(
-            table_name="sessions", 
-            db_url=db_url,
-            schema="public"
-        ),
+        storage=get_storage("sessions"),
         # -*- History -*-
         # Send the last 3 messages from the chat history
         add_history_to_messages=True,
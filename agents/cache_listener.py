@@ -3,23 +3,75 @@ PostgreSQL LISTEN/NOTIFY система для автоматической ин
 
 Слушает уведомления от триггеров БД и автоматически инвалидирует соответствующие кэши.
 Это устраняет необходимость в webhook'ах для большинства случаев.
+
+Соединение супервизируется: при обрыве (failover, рестарт Postgres) listener
+переподключается с экспоненциальной задержкой, а после переподключения делает
+resync - уведомления за время простоя потеряны, поэтому закэшированные версии
+агентов и инструментов сверяются с БД одним запросом.
+
+Ручные инвалидации (/v1/cache/invalidate, /v1/cache/clear) публикуются в тот
+же канал командой {"operation": "COMMAND"} и применяются всеми воркерами.
+Полная очистка увеличивает epoch в таблице cache_epoch: listener сверяет его
+при каждой проверке соединения, поэтому пропущенная очистка (воркер был
+отключен) применяется не позже чем через CACHE_LISTENER_PROBE_SECONDS.
 """
 
 import json
 import asyncio
 import logging
-from typing import Optional
+import os
+import random
+import socket
+import time
+from datetime import datetime
+from os import getenv
+from typing import Any, Dict, Optional, Set, Tuple
 import asyncpg
 from contextlib import asynccontextmanager
 
 from agents.agent_cache import agent_cache
 from agents.tools_cache import tools_cache  
-from agents.selector import invalidate_available_agents_cache
-from agents.team_manager import invalidate_team_caches
-from db.session import db_url
+from agents.selector import invalidate_available_agents_cache, set_available_agents_event_driven
+from agents.storage_resolver import clear_session_caches
+from agents.team_manager import clear_all_team_caches, invalidate_team_caches, invalidate_team_caches_batch
+from api.utils.response_cache import response_cache
+from db.session import db_engine, db_url
+from sqlalchemy import text
 
 logger = logging.getLogger(__name__)
 
+# Интервал проверки живости соединения (SELECT 1)
+LISTENER_PROBE_INTERVAL = float(getenv("CACHE_LISTENER_PROBE_SECONDS", "30"))
+# Таймаут подключения и проверки
+LISTENER_TIMEOUT = float(getenv("CACHE_LISTENER_TIMEOUT_SECONDS", "10"))
+# Экспоненциальная задержка переподключения
+LISTENER_BACKOFF_INITIAL = float(getenv("CACHE_LISTENER_BACKOFF_INITIAL_SECONDS", "1"))
+LISTENER_BACKOFF_MAX = float(getenv("CACHE_LISTENER_BACKOFF_MAX_SECONDS", "60"))
+
+# Окно накопления уведомлений перед применением пачкой
+LISTENER_DEBOUNCE_SECONDS = float(getenv("CACHE_LISTENER_DEBOUNCE_MS", "200")) / 1000
+
+LISTEN_CHANNEL = "cache_invalidation"
+
+# Идентификатор воркера: свои команды уже применены до публикации
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Инструментов в одной команде (лимит payload pg_notify ~8000 байт)
+COMMAND_MAX_TOOL_IDS = 100
+
+# Колонки agents, от которых зависит список доступных агентов
+AGENTS_LIST_COLUMNS = {"is_active", "agent_id"}
+
+EPOCH_QUERY = "SELECT epoch FROM cache_epoch WHERE id = 1"
+
+# Текущие версии закэшированных агентов и инструментов - один запрос
+RESYNC_QUERY = """
+    SELECT 'agents' AS kind, agent_id AS key, updated_at, is_active
+    FROM agents WHERE agent_id = ANY($1::text[])
+    UNION ALL
+    SELECT 'tools' AS kind, id::text AS key, updated_at, is_active
+    FROM tools WHERE id = ANY($2::uuid[])
+"""
+
 
 def convert_sqlalchemy_url_to_asyncpg(sqlalchemy_url: str) -> str:
     """
@@ -66,107 +118,488 @@ def convert_sqlalchemy_url_to_asyncpg(sqlalchemy_url: str) -> str:
     return url
 
 
+def apply_cache_command(command: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Применяет команду инвалидации к кэшам текущего воркера.
+
+    Команды:
+    - {"action": "invalidate_agent", "agent_id": ...}
+    - {"action": "invalidate_user", "user_id": ...}
+    - {"action": "invalidate_tools", "tool_ids": [...]}
+    - {"action": "clear"}
+    """
+    action = command.get("action")
+    if action == "invalidate_agent":
+        agent_id = command["agent_id"]
+        result = {
+            "agents": agent_cache.invalidate_agent(agent_id),
+            "teams": invalidate_team_caches_batch([agent_id]),
+        }
+        invalidate_available_agents_cache()
+        return result
+    if action == "invalidate_user":
+        return {"agents": agent_cache.invalidate_user(command["user_id"])}
+    if action == "invalidate_tools":
+        return {"tools": tools_cache.invalidate_tools(command["tool_ids"])}
+    if action == "clear":
+        result = {
+            "agents": agent_cache.clear(),
+            "tools": tools_cache.clear(),
+            "sessions": clear_session_caches(),
+            "responses": response_cache.clear(),
+        }
+        clear_all_team_caches()
+        invalidate_available_agents_cache()
+        return result
+    raise ValueError(f"Unknown cache command: {action}")
+
+
+def _publish_cache_command(command: Dict[str, Any]) -> Optional[int]:
+    # pg_notify транзакционный - уведомление уходит вместе с увеличением epoch
+    epoch = None
+    with db_engine.begin() as conn:
+        if command["action"] == "clear":
+            epoch = conn.execute(text(
+                "UPDATE cache_epoch SET epoch = epoch + 1, updated_at = now() WHERE id = 1 RETURNING epoch"
+            )).scalar()
+
+        commands = [command]
+        if command["action"] == "invalidate_tools":
+            tool_ids = [str(tool_id) for tool_id in command["tool_ids"]]
+            commands = [
+                dict(command, tool_ids=tool_ids[i:i + COMMAND_MAX_TOOL_IDS])
+                for i in range(0, len(tool_ids), COMMAND_MAX_TOOL_IDS)
+            ]
+        for item in commands:
+            payload = dict(item, operation="COMMAND", origin=WORKER_ID, epoch=epoch, ts=time.time())
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": LISTEN_CHANNEL, "payload": json.dumps(payload)},
+            )
+    return epoch
+
+
 class CacheInvalidationListener:
     """
     Слушает PostgreSQL NOTIFY события и автоматически инвалидирует кэши.
     
     Работает через механизм LISTEN/NOTIFY PostgreSQL:
-    1. Триггеры в БД отправляют NOTIFY при INSERT/DELETE
-    2. Этот listener получает уведомления
-    3. Автоматически инвалидирует соответствующие кэши
+    1. Триггеры в БД отправляют NOTIFY при INSERT/UPDATE/DELETE
+    2. Этот listener получает уведомления и копит их LISTENER_DEBOUNCE_SECONDS
+    3. Инвалидирует соответствующие кэши одной пачкой
     """
     
     def __init__(self, database_url: str):
         self.database_url = database_url
         self.connection: Optional[asyncpg.Connection] = None
         self.is_listening = False
+        self._stopping = False
+        self._stop_event = asyncio.Event()
+        self._connection_lost = asyncio.Event()
+        # Статистика для /v1/cache/stats
+        self._connected_at: Optional[float] = None
+        self._down_since: Optional[float] = time.time()
+        self._connects = 0
+        self._failures = 0
+        self._last_error: Optional[str] = None
+        self._last_probe_at: Optional[float] = None
+        self._last_probe_latency: Optional[float] = None
+        self._notifications = 0
+        self._last_notification_at: Optional[float] = None
+        self._last_notification_lag: Optional[float] = None
+        self._resyncs = 0
+        self._last_resync: Optional[Dict[str, Any]] = None
+        # Буфер уведомлений: (table, id) -> операции
+        self._pending: Dict[Tuple[str, str], Set[str]] = {}
+        # (table, id) -> измененные колонки и новая версия (UPDATE)
+        self._pending_changes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._pending_tables: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._pending_notifications = 0
+        # Epoch полной очистки, известный воркеру (None - еще не прочитан)
+        self._epoch: Optional[int] = None
+        self._epoch_supported = True
+        self._commands = 0
+        self._published = 0
+        self._batches = 0
+        self._coalesced = 0
         
     async def start_listening(self):
-        """Запускает прослушивание уведомлений от PostgreSQL"""
+        """
+        Слушает уведомления до stop_listening(), переподключаясь при ошибках.
+
+        Задержка между попытками растет экспоненциально (с jitter, чтобы воркеры
+        не переподключались одновременно) и сбрасывается после успешного подключения.
+        """
+        self._stopping = False
+        self._stop_event.clear()
+        backoff = LISTENER_BACKOFF_INITIAL
+        while not self._stopping:
+            try:
+                await self._connect()
+                backoff = LISTENER_BACKOFF_INITIAL
+                await self._watch_connection()
+            except asyncio.CancelledError:
+                await self._close_connection()
+                raise
+            except Exception as e:
+                self._failures += 1
+                self._last_error = str(e)
+                logger.error(f"Error in cache listener: {e}")
+
+            await self._close_connection()
+            if self._stopping:
+                break
+
+            delay = backoff * random.uniform(0.5, 1.0)
+            logger.warning(f"Cache listener reconnecting in {delay:.1f}s")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, LISTENER_BACKOFF_MAX)
+
+    async def _connect(self):
+        self._connection_lost.clear()
+        self.connection = await asyncpg.connect(self.database_url, timeout=LISTENER_TIMEOUT)
+        self.connection.add_termination_listener(self._on_connection_terminated)
+        await self.connection.add_listener(LISTEN_CHANNEL, self._handle_cache_notification)
+
+        reconnect = self._connects > 0
+        self._connects += 1
+        self.is_listening = True
+        self._connected_at = time.time()
+        logger.info("Cache invalidation listener started successfully")
+
+        await self._check_epoch()
+        if reconnect:
+            # Уведомления за время простоя потеряны - сверяем кэши с БД
+            await self.resync()
+        self._down_since = None
+        # Список мог закэшироваться до LISTEN - дальше он меняется только по событиям
+        invalidate_available_agents_cache()
+        set_available_agents_event_driven(True)
+
+    def _on_connection_terminated(self, connection):
+        self._connection_lost.set()
+
+    async def _watch_connection(self):
+        """Держит соединение, проверяя его живость; возвращается при обрыве"""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._connection_lost.wait(), timeout=LISTENER_PROBE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return
+            if self._connection_lost.is_set() or self.connection is None or self.connection.is_closed():
+                raise ConnectionError("Listener connection closed")
+
+            # Полуоткрытое соединение (сеть пропала без FIN) обнаруживается только запросом
+            started = time.monotonic()
+            await self._check_epoch()
+            self._last_probe_at = time.time()
+            self._last_probe_latency = time.monotonic() - started
+
+    async def _check_epoch(self):
+        """Проверка соединения и epoch: пропущенная полная очистка применяется здесь"""
+        connection = self.connection
+        if connection is None:
+            raise ConnectionError("Listener connection closed")
+        if not self._epoch_supported:
+            await asyncio.wait_for(connection.fetchval("SELECT 1"), timeout=LISTENER_TIMEOUT)
+            return
         try:
-            self.connection = await asyncpg.connect(self.database_url)
-            await self.connection.add_listener('cache_invalidation', self._handle_cache_notification)
-            self.is_listening = True
-            logger.info("Cache invalidation listener started successfully")
-            
-            # Держим соединение активным
-            while self.is_listening:
-                await asyncio.sleep(1)
-                
+            epoch = await asyncio.wait_for(connection.fetchval(EPOCH_QUERY), timeout=LISTENER_TIMEOUT)
+        except asyncpg.UndefinedTableError:
+            # Миграция cache_epoch не применена - только проверка соединения
+            logger.warning("cache_epoch table not found, cross-worker cache clear is not checked")
+            self._epoch_supported = False
+            return
+        if epoch is None:
+            return
+        if self._epoch is not None and epoch > self._epoch:
+            logger.info(f"Cache epoch changed {self._epoch} -> {epoch}, clearing caches")
+            apply_cache_command({"action": "clear"})
+        self._epoch = max(epoch, self._epoch or 0)
+
+    async def publish(self, command: Dict[str, Any]) -> bool:
+        """
+        Публикует команду инвалидации для остальных воркеров.
+
+        Текущий воркер применяет команду сам (apply_cache_command) до публикации.
+        """
+        try:
+            epoch = await asyncio.to_thread(_publish_cache_command, command)
+        except Exception as e:
+            logger.error(f"Error publishing cache command {command.get('action')}: {e}")
+            return False
+        if epoch is not None:
+            self._epoch = max(epoch, self._epoch or 0)
+        self._published += 1
+        return True
+
+    async def _close_connection(self):
+        # Без listener'а изменения не приходят - кэш списка агентов снова с TTL
+        set_available_agents_event_driven(False)
+        if self.is_listening or self.connection is not None:
+            self._down_since = self._down_since or time.time()
+        self.is_listening = False
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        try:
+            if not connection.is_closed():
+                await connection.remove_listener(LISTEN_CHANNEL, self._handle_cache_notification)
+                await asyncio.wait_for(connection.close(), timeout=LISTENER_TIMEOUT)
         except Exception as e:
-            logger.error(f"Error in cache listener: {e}")
-            await self.stop_listening()
+            logger.debug(f"Error closing cache listener connection: {e}")
+            connection.terminate()
+
+    async def resync(self) -> Dict[str, Any]:
+        """
+        Сверяет закэшированные версии агентов и инструментов с БД одним запросом.
+
+        Удаленные, деактивированные и измененные записи инвалидируются
+        (вместе с командами агента); кэш списка агентов сбрасывается всегда.
+        """
+        agent_versions = agent_cache.versions()
+        tool_versions = tools_cache.versions()
+
+        rows = []
+        if (agent_versions or tool_versions) and self.connection is not None:
+            rows = await asyncio.wait_for(
+                self.connection.fetch(RESYNC_QUERY, list(agent_versions), list(tool_versions)),
+                timeout=LISTENER_TIMEOUT,
+            )
+
+        current: Dict[str, Dict[str, Any]] = {"agents": {}, "tools": {}}
+        for row in rows:
+            if row["is_active"]:
+                current[row["kind"]][row["key"]] = row["updated_at"]
+
+        stale_agents = [
+            agent_id for agent_id, hashes in agent_versions.items()
+            if agent_id not in current["agents"]
+            or hashes != {agent_cache.version_hash(agent_id, current["agents"][agent_id])}
+        ]
+        for agent_id in stale_agents:
+            agent_cache.invalidate_agent(agent_id)
+            invalidate_team_caches(agent_id)
+
+        stale_tools = [
+            tool_id for tool_id, hashes in tool_versions.items()
+            if tool_id not in current["tools"]
+            or hashes != {tools_cache.version_hash(tool_id, current["tools"][tool_id])}
+        ]
+        for tool_id in stale_tools:
+            tools_cache.invalidate_tool(tool_id)
+
+        invalidate_available_agents_cache()
+
+        self._resyncs += 1
+        self._last_resync = {
+            "at": time.time(),
+            "checked_agents": len(agent_versions),
+            "checked_tools": len(tool_versions),
+            "invalidated_agents": len(stale_agents),
+            "invalidated_tools": len(stale_tools),
+        }
+        logger.info(f"Cache resync: {self._last_resync}")
+        return self._last_resync
     
     async def stop_listening(self):
         """Останавливает прослушивание"""
-        self.is_listening = False
-        if self.connection:
-            try:
-                await self.connection.remove_listener('cache_invalidation', self._handle_cache_notification)
-                await self.connection.close()
-            except Exception as e:
-                logger.error(f"Error stopping cache listener: {e}")
-            finally:
-                self.connection = None
+        self._stopping = True
+        self._stop_event.set()
+        self._connection_lost.set()
+        await self._close_connection()
+        if self._flush_handle is not None:
+            # Накопленные уведомления применяем сразу, не дожидаясь таймера
+            self._flush_handle.cancel()
+            self._flush_pending()
         logger.info("Cache invalidation listener stopped")
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние listener'а для /v1/cache/stats"""
+        now = time.time()
+        return {
+            "state": "up" if self.is_listening else "down",
+            "connected_since": self._connected_at if self.is_listening else None,
+            "down_seconds": round(now - self._down_since, 1) if self._down_since else 0.0,
+            "connects": self._connects,
+            "failures": self._failures,
+            "last_error": self._last_error,
+            "last_probe_at": self._last_probe_at,
+            "probe_latency_ms": round(self._last_probe_latency * 1000, 1) if self._last_probe_latency is not None else None,
+            "notifications": self._notifications,
+            "last_notification_at": self._last_notification_at,
+            "notification_lag_ms": round(self._last_notification_lag * 1000, 1) if self._last_notification_lag is not None else None,
+            "pending": len(self._pending) + len(self._pending_tables),
+            "batches": self._batches,
+            "coalesced": self._coalesced,
+            "epoch": self._epoch,
+            "commands_applied": self._commands,
+            "commands_published": self._published,
+            "resyncs": self._resyncs,
+            "last_resync": self._last_resync,
+        }
     
     async def _handle_cache_notification(self, connection, pid, channel, payload):
         """
-        Обрабатывает уведомления от PostgreSQL триггеров.
+        Принимает уведомление от PostgreSQL триггеров и добавляет его в буфер.
+
+        Массовые операции (импорт тысяч агентов, деактивация инструментов) дают
+        всплеск уведомлений - они копятся LISTENER_DEBOUNCE_SECONDS, дедуплицируются
+        по (table, id) и применяются одной пачкой в _flush_pending().
         
-        Payload format:
+        Payload format (statement-level триггеры):
         {
             "operation": "INSERT|DELETE",
-            "table": "agents|tools", 
-            "id": "uuid",
-            "agent_id": "string" (только для agents)
+            "table": "agents|tools",
+            "ids": ["uuid", ...],
+            "agent_ids": ["string", ...] (только для agents),
+            "truncated": true (строк слишком много для payload - инвалидировать всю таблицу),
+            "ts": время отправки (epoch)
+        }
+        {
+            "operation": "UPDATE",
+            "table": "agents|tools",
+            "rows": [{"id", "agent_id", "old_agent_id", "changed": [колонки], "is_active", "version": updated_at}],
+            "ts": время отправки (epoch)
         }
+        Старый row-level формат ({"id": ..., "agent_id": ...}) тоже поддерживается.
         """
         try:
             data = json.loads(payload)
+            self._notifications += 1
+            self._last_notification_at = time.time()
+            if data.get('ts'):
+                # Время отправки из триггера (если передается) - задержка доставки
+                self._last_notification_lag = max(self._last_notification_at - float(data['ts']), 0.0)
             operation = data.get('operation')
             table = data.get('table')
-            record_id = data.get('id')
-            agent_id = data.get('agent_id')
+
+            if operation == 'COMMAND':
+                self._handle_command(data)
+                return
             
-            logger.debug(f"Cache invalidation: {operation} on {table}, id={record_id}")
+            logger.debug(f"Cache invalidation: {operation} on {table}, {data.get('count', 1)} rows")
             
-            if table == 'agents':
-                if operation == 'INSERT':
-                    # Новый агент создан - инвалидируем кэш списка агентов
-                    invalidate_available_agents_cache()
-                    logger.info(f"Invalidated available agents cache due to INSERT: {agent_id}")
-                    
-                elif operation == 'DELETE':
-                    # Агент удален - инвалидируем конкретного агента + список + команды
-                    if agent_id:
-                        invalidated_count = agent_cache.invalidate_agent(agent_id)
-                        logger.info(f"Invalidated agent cache: {agent_id} ({invalidated_count} entries)")
-                        
-                        # Инвалидируем все команды, в которых участвует этот агент
-                        invalidate_team_caches(agent_id)
-                        logger.info(f"Invalidated team caches for agent: {agent_id}")
-                        
-                    invalidate_available_agents_cache()
-                    logger.info(f"Invalidated available agents cache due to DELETE: {agent_id}")
-            
-            elif table == 'tools':
-                if operation == 'INSERT':
-                    # Новый инструмент создан - можно добавить кэш списка инструментов если нужно
-                    logger.info(f"New tool created: {record_id}")
-                    
-                elif operation == 'DELETE':
-                    # Инструмент удален - инвалидируем из кэша инструментов
-                    try:
-                        from uuid import UUID
-                        tool_uuid = UUID(record_id)
-                        invalidated_count = tools_cache.invalidate_tool(tool_uuid)
-                        logger.info(f"Invalidated tool cache: {record_id} ({invalidated_count} entries)")
-                    except ValueError:
-                        logger.warning(f"Invalid UUID for tool: {record_id}")
+            self._pending_notifications += 1
+            if data.get('truncated'):
+                self._pending_tables.add(table)
+            elif operation == 'UPDATE':
+                for row in data.get('rows') or []:
+                    key = row.get('agent_id') if table == 'agents' else row.get('id')
+                    self._pending.setdefault((table, key), set()).add(operation)
+                    change = self._pending_changes.setdefault((table, key), {"changed": set(), "version": None})
+                    change["changed"].update(row.get('changed') or [])
+                    change["version"] = row.get('version')
+                    if row.get('old_agent_id'):
+                        # agent_id переименован - старый agent_id для кэша удален
+                        self._pending.setdefault((table, row['old_agent_id']), set()).add('DELETE')
+            else:
+                ids = data.get('ids') or ([data['id']] if data.get('id') else [])
+                agent_ids = data.get('agent_ids') or ([data['agent_id']] if data.get('agent_id') else [])
+                keys = agent_ids if table == 'agents' else ids
+                for key in keys:
+                    self._pending.setdefault((table, key), set()).add(operation)
                         
         except Exception as e:
             logger.error(f"Error handling cache notification: {e}, payload: {payload}")
+            return
+
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(LISTENER_DEBOUNCE_SECONDS, self._flush_pending)
+
+    def _handle_command(self, data: Dict[str, Any]):
+        """Команда инвалидации из /v1/cache/* другого воркера"""
+        if data.get('epoch') is not None:
+            self._epoch = max(int(data['epoch']), self._epoch or 0)
+        if data.get('origin') == WORKER_ID:
+            return
+        self._commands += 1
+        result = apply_cache_command(data)
+        logger.info(f"Applied cache command {data.get('action')} from {data.get('origin')}: {result}")
+
+    @staticmethod
+    def _agent_is_stale(agent_id: str, change: Dict[str, Any], cached_versions: Dict[str, Set[str]]) -> bool:
+        """Нужно ли инвалидировать агента после UPDATE"""
+        if 'is_active' in change["changed"]:
+            return True
+        hashes = cached_versions.get(agent_id)
+        if not hashes:
+            # Агент не закэширован в этом воркере
+            return False
+        if change["version"]:
+            # Воркер уже пересобрал агента с новой версией
+            version = datetime.fromisoformat(change["version"])
+            return hashes != {agent_cache.version_hash(agent_id, version)}
+        return True
+
+    def _flush_pending(self) -> Dict[str, int]:
+        """Применяет накопленные инвалидации одной пачкой"""
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        changes, self._pending_changes = self._pending_changes, {}
+        tables, self._pending_tables = self._pending_tables, set()
+        notifications, self._pending_notifications = self._pending_notifications, 0
+
+        result = {"agents": 0, "teams": 0, "tools": 0}
+        try:
+            cached_versions = agent_cache.versions() if changes else {}
+            stale_agents: Set[str] = set()
+            stale_tools: Set[str] = set()
+            agents_list = 'agents' in tables
+            for (table, key), operations in pending.items():
+                if table == 'agents':
+                    if operations & {'INSERT', 'DELETE'}:
+                        agents_list = True
+                    if 'DELETE' in operations:
+                        stale_agents.add(key)
+                    elif 'UPDATE' in operations:
+                        change = changes[(table, key)]
+                        if change["changed"] & AGENTS_LIST_COLUMNS:
+                            agents_list = True
+                        if self._agent_is_stale(key, change, cached_versions):
+                            stale_agents.add(key)
+                elif operations & {'UPDATE', 'DELETE'}:
+                    stale_tools.add(key)
+
+            if 'tools' in tables:
+                result["tools"] = tools_cache.clear()
+                # Собранные агенты держат экземпляры инструментов
+                stale_agents.update(cached_versions or agent_cache.versions())
+            elif stale_tools:
+                result["tools"] = tools_cache.invalidate_tools(stale_tools)
+                stale_agents.update(agent_cache.agents_with_tools(stale_tools))
+
+            if 'agents' in tables:
+                # Изменено слишком много строк - сбрасываем кэши агентов целиком
+                result["agents"] = agent_cache.clear()
+                clear_all_team_caches()
+            elif stale_agents:
+                # Агент удален, деактивирован или изменен - инвалидируем агентов + команды
+                result["agents"] = agent_cache.invalidate_agents(stale_agents)
+                result["teams"] = invalidate_team_caches_batch(stale_agents)
+
+            if agents_list:
+                # Список активных агентов изменился - один сброс на пачку
+                invalidate_available_agents_cache()
+        except Exception as e:
+            logger.error(f"Error applying cache invalidations: {e}")
+
+        self._batches += 1
+        # Уведомления, примененные вместе с другими вместо отдельной обработки
+        self._coalesced += max(notifications - 1, 0)
+        logger.info(
+            f"Applied cache invalidations: {notifications} notifications, {len(pending)} records, "
+            f"full tables: {sorted(tables) or '-'}, "
+            f"invalidated: {result}"
+        )
+        return result
 
 
 # Глобальный экземпляр listener'а
@@ -191,11 +624,23 @@ async def cache_listener_context():
                 pass
 
 
+_listener_task: Optional[asyncio.Task] = None
+
+
 async def start_cache_listener_background():
     """Запускает cache listener в фоновом режиме (для использования в FastAPI)"""
-    asyncio.create_task(cache_listener.start_listening())
+    global _listener_task
+    _listener_task = asyncio.create_task(cache_listener.start_listening())
 
 
 async def stop_cache_listener_background():
     """Останавливает фоновый cache listener"""
-    await cache_listener.stop_listening() 
\ No newline at end of file
+    global _listener_task
+    await cache_listener.stop_listening()
+    if _listener_task is not None and not _listener_task.done():
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+    _listener_task = None 
\ No newline at end of file
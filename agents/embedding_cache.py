@@ -0,0 +1,152 @@
+"""
+Кэш эмбеддингов для knowledge и семантического кэша ответов.
+
+Загрузка knowledge (aload(upsert=True)) заново эмбеддит каждый чанк, даже
+если он не изменился, а каждый поиск по knowledge эмбеддит запрос - это
+вызов API эмбеддингов на каждый чанк и на каждый поиск.
+
+CachedEmbedder оборачивает embedder agno и хранит эмбеддинги по ключу
+SHA-256(модель, размерность, текст) в общем LRU кэше процесса:
+- агенты с одной моделью эмбеддингов используют общие записи
+- эмбеддинг зависит только от текста и модели - инвалидация не нужна
+- значения хранятся как float32 (pgvector хранит vector в float32)
+
+Кэш ограничен объемом (embedding_cache_max_mb), вытеснение - LRU.
+"""
+
+import hashlib
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from agno.embedder.base import Embedder
+
+from api.settings import api_settings
+
+
+class EmbeddingCache:
+    """LRU кэш эмбеддингов процесса с ограничением объема"""
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[str, array]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return embedding.tolist()
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        value = array("f", embedding)
+        size = value.itemsize * len(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.itemsize * len(previous)
+            self._entries[key] = value
+            self._total_bytes += size
+            while self._total_bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.itemsize * len(evicted)
+                self._evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": api_settings.embedding_cache_enabled,
+                "entries": len(self._entries),
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_mb": api_settings.embedding_cache_max_mb,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+
+# Глобальный кэш эмбеддингов процесса (общий для всех агентов)
+embedding_cache = EmbeddingCache(max_bytes=api_settings.embedding_cache_max_mb * 1024 * 1024)
+
+
+@dataclass
+class CachedEmbedder(Embedder):
+    """
+    Embedder agno с кэшем эмбеддингов по хэшу текста.
+
+    Args:
+        embedder (Embedder): Embedder, вызываемый при промахе кэша.
+    """
+
+    embedder: Optional[Embedder] = None
+
+    def __post_init__(self):
+        if self.embedder is None:
+            raise ValueError("CachedEmbedder requires an embedder")
+        self._embedder: Embedder = self.embedder
+        # PgVector создает колонку по dimensions embedder'а
+        self.dimensions = self.embedder.dimensions
+        model_id = getattr(self.embedder, "id", None)
+        self._namespace = f"{type(self.embedder).__name__}|{model_id}|{self.dimensions}"
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self._namespace}\x00{text}".encode()).hexdigest()
+
+    def get_embedding(self, text: str) -> List[float]:
+        key = self._key(text)
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            return cached
+        embedding = self._embedder.get_embedding(text)
+        # Пустой эмбеддинг - ошибка API, не кэшируется
+        if embedding:
+            embedding_cache.put(key, embedding)
+        return embedding
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        key = self._key(text)
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            # Из кэша - без обращения к API, usage нет
+            return cached, None
+        embedding, usage = self._embedder.get_embedding_and_usage(text)
+        if embedding:
+            embedding_cache.put(key, embedding)
+        return embedding, usage
+
+
+def cached_embedder(embedder: Optional[Embedder] = None) -> Embedder:
+    """
+    Embedder с кэшем эмбеддингов.
+
+    Без аргумента - OpenAIEmbedder по умолчанию (как у PgVector без embedder).
+    При embedding_cache_enabled=false embedder возвращается без обертки.
+    """
+    if embedder is None:
+        from agno.embedder.openai import OpenAIEmbedder
+
+        embedder = OpenAIEmbedder()
+    if not api_settings.embedding_cache_enabled or isinstance(embedder, CachedEmbedder):
+        return embedder
+    return CachedEmbedder(embedder=embedder)
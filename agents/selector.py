@@ -1,11 +1,9 @@
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
 
-# Существующие статические агенты (не трогаем)
-from agents.agno_assist import get_agno_assist
-from agents.finance_agent import get_finance_agent
-from agents.web_agent import get_web_agent
+# Статические агенты импортируются при первом запросе (get_agent):
+# agno_assist тянет OpenAI embedder и pgvector, finance_agent - yfinance и pandas
 
 # Новая функциональность для динамических агентов
 from agents.tools_loader import load_tools_for_agent
@@ -13,24 +11,33 @@ from agents.agent_cache import agent_cache  # ← КЭШ С УЧЕТОМ КОН
 from agents.tool_hooks import get_tool_hooks
 from agents.response_models import get_response_model
 from agents.team_manager import get_team_manager
+from agents.storage_resolver import get_storage
 from db.models.agent import DynamicAgent
 from db.session import get_db
 
 # Нативные agno классы
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
 from db.session import db_url
 
-# Простой кэш для списка агентов (TTL 5 минут)
-_available_agents_cache = {"data": None, "expires_at": 0}
+# Кэш списка агентов: сбрасывается listener'ом по INSERT/DELETE и изменению
+# is_active/agent_id. Пока listener подключен, кэш не устаревает по времени;
+# без listener'а (соединение потеряно) действует страховочный TTL.
+AVAILABLE_AGENTS_FALLBACK_TTL = 300
+_available_agents_cache: Dict[str, Any] = {"data": None, "expires_at": 0, "generation": 0, "event_driven": False}
 
 
 def invalidate_available_agents_cache():
-    """Принудительная инвалидация кэша списка агентов (для CREATE/DELETE операций)"""
+    """Принудительная инвалидация кэша списка агентов (INSERT/DELETE и смена is_active/agent_id)"""
     global _available_agents_cache
     _available_agents_cache["data"] = None
     _available_agents_cache["expires_at"] = 0
+    _available_agents_cache["generation"] += 1
+
+
+def set_available_agents_event_driven(enabled: bool):
+    """Listener подключен (enabled) - кэш списка агентов хранится до инвалидации"""
+    _available_agents_cache["event_driven"] = enabled
 
 
 class AgentType(Enum):
@@ -43,10 +50,13 @@ def get_available_agents(db: Optional[Session] = None) -> List[str]:
     """Возвращает список всех доступных агентов (статических + динамических)"""
     import time
     
-    # Проверяем кэш (TTL 5 минут для списка агентов)
+    # Проверяем кэш (до инвалидации listener'ом или страховочный TTL)
     now = time.time()
-    if _available_agents_cache["data"] and now < _available_agents_cache["expires_at"]:
+    if _available_agents_cache["data"] is not None and (
+        _available_agents_cache["event_driven"] or now < _available_agents_cache["expires_at"]
+    ):
         return _available_agents_cache["data"]
+    generation = _available_agents_cache["generation"]
     
     # Статические агенты
     static_agents = [agent.value for agent in AgentType]
@@ -63,9 +73,10 @@ def get_available_agents(db: Optional[Session] = None) -> List[str]:
         
         result = static_agents + dynamic_agent_ids
         
-        # Кэшируем результат на 5 минут
-        _available_agents_cache["data"] = result
-        _available_agents_cache["expires_at"] = now + 300  # 5 минут
+        # Инвалидация во время запроса - результат мог устареть, не кэшируем
+        if generation == _available_agents_cache["generation"]:
+            _available_agents_cache["data"] = result
+            _available_agents_cache["expires_at"] = now + AVAILABLE_AGENTS_FALLBACK_TTL
         
         return result
     except Exception:
@@ -73,6 +84,31 @@ def get_available_agents(db: Optional[Session] = None) -> List[str]:
         return static_agents
 
 
+def get_agent_company_id(agent_id: str, user_id: Optional[str] = None, db: Optional[Session] = None) -> Optional[str]:
+    """
+    Возвращает company_id динамического агента без построения самого агента.
+    Для статических и глобальных агентов без компании возвращает None.
+    """
+    if agent_id in {agent.value for agent in AgentType}:
+        return None
+
+    if db is None:
+        db = next(get_db())
+
+    # Тот же приоритет, что и в get_agent: пользовательский агент, потом глобальный
+    row = db.query(DynamicAgent.company_id).filter(
+        DynamicAgent.agent_id == agent_id,
+        DynamicAgent.is_active == True
+    ).order_by(
+        DynamicAgent.user_id == user_id,
+        DynamicAgent.user_id.is_(None)
+    ).first()
+
+    if not row or not row.company_id:
+        return None
+    return str(row.company_id)
+
+
 def get_agent(
     model_id: str = "gpt-4.1-mini-2025-04-14",
     agent_id: Optional[str] = None,
@@ -85,10 +121,13 @@ def get_agent(
     
     # 1. Сначала проверяем статические агенты (не трогаем, без кэша)
     if agent_id == AgentType.WEB_AGENT.value:
+        from agents.web_agent import get_web_agent
         return get_web_agent(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
     elif agent_id == AgentType.AGNO_ASSIST.value:
+        from agents.agno_assist import get_agno_assist
         return get_agno_assist(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
     elif agent_id == AgentType.FINANCE_AGENT.value:
+        from agents.finance_agent import get_finance_agent
         return get_finance_agent(model_id=model_id, user_id=user_id, session_id=session_id, debug_mode=debug_mode)
     
     # 2. Динамические агенты - получаем конфигурацию из БД
@@ -173,11 +212,8 @@ def _create_agent_from_db(
     if storage_config is not None:  # Секция storage есть в конфиге
         if storage_config.get("enabled", True):  # enabled по умолчанию True ТОЛЬКО если секция storage указана
             storage_table = storage_config.get("table_name", "sessions")
-            storage = PostgresAgentStorage(
-                table_name=storage_table, 
-                db_url=db_url,
-                schema="public"
-            )
+            # Общий storage таблицы с кэшем активных сессий (agents/session_storage.py)
+            storage = get_storage(storage_table)
     
     # Memory (КРИТИЧНО для continue endpoint!)
     memory = None
@@ -207,25 +243,30 @@ def _create_agent_from_db(
         if knowledge_type == "url" and knowledge_config.get("urls"):
             from agno.knowledge.url import UrlKnowledge
             from agno.vectordb.pgvector import PgVector
+            from agents.embedding_cache import cached_embedder
             
             knowledge = UrlKnowledge(
                 urls=knowledge_config["urls"],
                 vector_db=PgVector(
                     db_url=db_url,
                     table_name=knowledge_config.get("table_name", "knowledge"),
-                    schema="public"
+                    schema="public",
+                    # Повторная загрузка и поиск не эмбеддят тот же текст заново
+                    embedder=cached_embedder(),
                 )
             )
         elif knowledge_type == "pdf" and knowledge_config.get("pdf_paths"):
             from agno.knowledge.pdf import PDFKnowledge
             from agno.vectordb.pgvector import PgVector
+            from agents.embedding_cache import cached_embedder
             
             knowledge = PDFKnowledge(
                 path=knowledge_config["pdf_paths"],
                 vector_db=PgVector(
                     db_url=db_url,
                     table_name=knowledge_config.get("table_name", "knowledge"),
-                    schema="public"
+                    schema="public",
+                    embedder=cached_embedder(),
                 )
             )
     
@@ -0,0 +1,244 @@
+"""
+PostgresAgentStorage с кэшем активных сессий в памяти процесса.
+
+Каждый ход диалога читает строку сессии (memory с runs - самый большой JSON)
+и после запуска записывает ее обратно, а PostgresStorage.upsert() еще и
+перечитывает строку целиком. Для активных чатов это одни и те же строки
+каждые несколько секунд.
+
+Кэш хранит последнюю прочитанную/записанную версию строки и ограничен числом
+сессий (session_cache_max_entries) и объемом (session_cache_max_mb) - размер
+записи оценивается по длине JSON строки сессии, вытеснение - LRU:
+- read: сверяет версию строки (системная колонка xmin, меняется при любом
+  UPDATE - в том числе из другой реплики или SQL) - один маленький запрос
+  по первичному ключу вместо передачи и разбора JSON сессии
+- upsert: INSERT ... ON CONFLICT ... RETURNING - без повторного чтения;
+  запись без изменений относительно кэша пропускается
+
+Запись не откладывается: отложенная запись потеряла бы данные при падении
+воркера и отдала бы другим репликам устаревшую сессию.
+
+Вместе с таблицей сессий создаются индексы списка сессий (db/sessions.py) -
+agno создает таблицу лениво, в том числе для table_name из конфигурации агента.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from agno.storage.agent.postgres import PostgresAgentStorage
+from agno.storage.session import Session as StoredSession
+from agno.storage.session.agent import AgentSession
+from agno.utils.log import log_debug, log_warning
+from sqlalchemy import Label, literal_column, select
+from sqlalchemy.dialects import postgresql
+
+from api.settings import api_settings
+from db.sessions import ensure_session_list_indexes
+
+# Колонки сессии, которые пишет PostgresStorage.upsert (mode="agent")
+UPSERT_COLUMNS = ("agent_id", "team_session_id", "user_id", "memory", "agent_data", "session_data", "extra_data")
+
+_VERSION: Label[Any] = literal_column("xmin::text").label("row_version")
+
+
+@dataclass
+class _CachedSession:
+    row: Dict[str, Any]
+    version: str
+    checked_at: float
+    size: int
+
+
+class IndexedPostgresAgentStorage(PostgresAgentStorage):
+    """PostgresAgentStorage, создающий индексы списка сессий вместе с таблицей"""
+
+    def create(self) -> None:
+        super().create()
+        self.ensure_indexes()
+
+    def ensure_indexes(self) -> None:
+        """Индексы списка сессий существующей таблицы; ошибка не мешает работе storage"""
+        try:
+            if self.table_exists():
+                ensure_session_list_indexes(self.db_engine, self.table_name)
+        except Exception as e:
+            log_warning(f"Could not create session list indexes for {self.table_name}: {e}")
+
+
+class CachedPostgresAgentStorage(IndexedPostgresAgentStorage):
+    """
+    Storage сессий агента с кэшем последних версий строк.
+
+    Args:
+        max_entries (int): Максимум сессий в кэше.
+        max_bytes (int): Максимальный объем кэша (по длине JSON строк сессий).
+        trust_seconds (float): Окно без проверки версии после последней проверки.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_entries: int = api_settings.session_cache_max_entries,
+        max_bytes: int = api_settings.session_cache_max_mb * 1024 * 1024,
+        trust_seconds: float = api_settings.session_cache_trust_seconds,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.trust_seconds = trust_seconds
+        self._entries: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self._evictions = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._writes = 0
+        self._skipped_writes = 0
+
+    def __deepcopy__(self, memo):
+        # Agent.deep_copy() копирует storage - экземпляр общий, кэш должен оставаться одним
+        return self
+
+    def _session(self, row: Dict[str, Any]) -> Optional[StoredSession]:
+        # Агент изменяет session_data/memory полученной сессии - отдаем копию
+        return AgentSession.from_dict(deepcopy(row))
+
+    def _remember(self, row: Dict[str, Any], version: str) -> None:
+        session_id = row["session_id"]
+        size = len(json.dumps(row, default=str))
+        if size > self.max_bytes:
+            # Сессия больше всего кэша - только убираем устаревшую версию
+            self.evict(session_id)
+            return
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._entries[session_id] = _CachedSession(row=row, version=version, checked_at=time.monotonic(), size=size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size
+                self._evictions += 1
+
+    def _cached(self, session_id: str) -> Optional[_CachedSession]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def evict(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+
+    def clear_cache(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+            return count
+
+    def _current_version(self, session_id: str) -> Optional[str]:
+        with self.Session() as sess:
+            return sess.execute(
+                select(_VERSION).select_from(self.table).where(self.table.c.session_id == session_id)
+            ).scalar()
+
+    def read(self, session_id: str, user_id: Optional[str] = None) -> Optional[StoredSession]:
+        entry = self._cached(session_id)
+        if entry is not None and (not user_id or entry.row.get("user_id") == user_id):
+            try:
+                now = time.monotonic()
+                if now - entry.checked_at < self.trust_seconds or self._current_version(session_id) == entry.version:
+                    entry.checked_at = now
+                    self._hits += 1
+                    return self._session(entry.row)
+                self._stale += 1
+            except Exception as e:
+                log_debug(f"Session version check failed: {e}")
+            self.evict(session_id)
+
+        self._misses += 1
+        try:
+            with self.Session() as sess:
+                stmt = select(self.table, _VERSION).where(self.table.c.session_id == session_id)
+                if user_id:
+                    stmt = stmt.where(self.table.c.user_id == user_id)
+                result = sess.execute(stmt).fetchone()
+        except Exception:
+            # Таблица не создана и прочие ошибки - исходная обработка agno
+            return super().read(session_id, user_id)
+
+        if result is None:
+            return None
+        row = dict(result._mapping)
+        version = row.pop("row_version")
+        self._remember(row, version)
+        return self._session(row)
+
+    def upsert(self, session: StoredSession, create_and_retry: bool = True) -> Optional[StoredSession]:
+        if self.mode != "agent" or (self.auto_upgrade_schema and not self._schema_up_to_date):
+            self.evict(session.session_id)
+            return super().upsert(session, create_and_retry=create_and_retry)
+
+        values = {name: getattr(session, name, None) for name in UPSERT_COLUMNS}
+        entry = self._cached(session.session_id)
+        if entry is not None and all(entry.row.get(name) == value for name, value in values.items()):
+            # Сессия не изменилась с последнего чтения/записи - запись не нужна
+            self._skipped_writes += 1
+            return self._session(entry.row)
+
+        try:
+            with self.Session() as sess, sess.begin():
+                stmt = postgresql.insert(self.table).values(session_id=session.session_id, **values)
+                upsert = stmt.on_conflict_do_update(
+                    index_elements=["session_id"],
+                    set_=dict(values, updated_at=int(time.time())),
+                )
+                result = sess.execute(upsert.returning(*self.table.c, _VERSION)).fetchone()
+        except Exception:
+            # Создание таблицы и повтор - исходная обработка agno
+            self.evict(session.session_id)
+            return super().upsert(session, create_and_retry=create_and_retry)
+
+        self._writes += 1
+        row = dict(result._mapping)
+        version = row.pop("row_version")
+        self._remember(row, version)
+        return self._session(row)
+
+    def delete_session(self, session_id: Optional[str] = None):
+        if session_id:
+            self.evict(session_id)
+        return super().delete_session(session_id)
+
+    def drop(self) -> None:
+        self.clear_cache()
+        super().drop()
+
+    def stats(self) -> Dict[str, Any]:
+        reads = self._hits + self._misses
+        return {
+            "table": self.table_name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "evictions": self._evictions,
+            "hits": self._hits,
+            "misses": self._misses,
+            "stale": self._stale,
+            "hit_rate": round(self._hits / reads, 3) if reads else 0.0,
+            "writes": self._writes,
+            "skipped_writes": self._skipped_writes,
+        }
@@ -0,0 +1,205 @@
+"""
+Доступ к storage и memory агента без построения самого агента.
+
+Эндпоинты сессий и памяти (чтение, переименование, удаление сессии, память
+пользователя) раньше вызывали get_agent() только ради agent.storage / agent.memory.
+При промахе кэша это строит агента целиком: инструменты, MCP подключения,
+команду, knowledge. Здесь читается только секция storage/memory конфигурации
+агента, а бэкенды (PostgresAgentStorage / PostgresMemoryDb) создаются один раз
+на таблицу и используют общий пул соединений db_engine.
+
+Те же общие storage используют статические агенты и _create_agent_from_db,
+поэтому кэш активных сессий (agents/session_storage.py) у них общий.
+"""
+
+from dataclasses import dataclass, field
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+from agno.memory.v2.db.postgres import PostgresMemoryDb
+from agno.memory.v2.schema import UserMemory
+from agno.storage.agent.postgres import PostgresAgentStorage
+from sqlalchemy.orm import Session
+
+from agents.session_storage import CachedPostgresAgentStorage, IndexedPostgresAgentStorage
+from api.settings import api_settings
+from db.models.agent import DynamicAgent
+from db.session import db_engine, get_db
+
+# Схема таблиц storage/memory (как в статических и динамических агентах)
+STORAGE_SCHEMA = "public"
+DEFAULT_STORAGE_TABLE = "sessions"
+DEFAULT_MEMORY_TABLE = "user_memories"
+
+# agent_id статических агентов в таблице сессий (задается в конструкторе Agent)
+STATIC_STORAGE_AGENT_IDS = {
+    "web_agent": "web_search_agent",
+    "agno_assist": "agno_assist",
+    "finance_agent": "finance_agent",
+}
+
+
+@dataclass(frozen=True)
+class AgentStorageConfig:
+    """
+    Таблицы storage/memory агента.
+
+    storage_agent_id: agent_id, под которым agno пишет сессии
+    storage_table: таблица сессий или None, если storage выключен
+    memory_table: таблица памяти или None, если memory выключена
+    enable_session_summaries: agno хранит summary сессии (memory.summaries)
+    retention: секция retention конфигурации (переопределение настроек компактизации)
+    """
+
+    storage_agent_id: str
+    storage_table: Optional[str]
+    memory_table: Optional[str]
+    enable_session_summaries: bool = False
+    retention: Dict[str, Any] = field(default_factory=dict)
+
+
+_storages: Dict[str, PostgresAgentStorage] = {}
+_memory_dbs: Dict[str, PostgresMemoryDb] = {}
+_lock = Lock()
+
+
+def get_agent_storage_config(
+    agent_id: str, user_id: Optional[str] = None, db: Optional[Session] = None
+) -> AgentStorageConfig:
+    """
+    Конфигурация storage/memory агента (читается только agent_config).
+
+    Raises:
+        ValueError: агент не найден
+    """
+    if agent_id in STATIC_STORAGE_AGENT_IDS:
+        return AgentStorageConfig(
+            storage_agent_id=STATIC_STORAGE_AGENT_IDS[agent_id],
+            storage_table=DEFAULT_STORAGE_TABLE,
+            memory_table=DEFAULT_MEMORY_TABLE,
+        )
+
+    if db is None:
+        db = next(get_db())
+
+    # Тот же приоритет, что и в get_agent: пользовательский агент, потом глобальный
+    row = (
+        db.query(DynamicAgent.agent_config)
+        .filter(DynamicAgent.agent_id == agent_id, DynamicAgent.is_active == True)
+        .order_by(DynamicAgent.user_id == user_id, DynamicAgent.user_id.is_(None))
+        .first()
+    )
+
+    if not row:
+        raise ValueError(f"Agent: {agent_id} not found")
+
+    return _config_from_agent_config(agent_id, row.agent_config or {})
+
+
+def list_agent_storage_configs(db: Optional[Session] = None) -> List[AgentStorageConfig]:
+    """Конфигурации storage всех статических и активных динамических агентов"""
+    configs = [get_agent_storage_config(agent_id) for agent_id in STATIC_STORAGE_AGENT_IDS]
+
+    if db is None:
+        db = next(get_db())
+
+    rows = db.query(DynamicAgent.agent_id, DynamicAgent.agent_config).filter(DynamicAgent.is_active == True).all()
+    # Пользовательский и глобальный агент с одним agent_id могут писать в разные таблицы
+    seen = {(config.storage_table, config.storage_agent_id) for config in configs}
+    for row in rows:
+        config = _config_from_agent_config(row.agent_id, row.agent_config or {})
+        if (config.storage_table, config.storage_agent_id) not in seen:
+            seen.add((config.storage_table, config.storage_agent_id))
+            configs.append(config)
+    return configs
+
+
+def _config_from_agent_config(agent_id: str, agent_config: Dict[str, Any]) -> AgentStorageConfig:
+    # Та же логика, что при построении storage/memory в _create_agent_from_db
+    storage_table = None
+    storage_config = agent_config.get("storage")
+    if storage_config is not None and storage_config.get("enabled", True):
+        storage_table = storage_config.get("table_name", DEFAULT_STORAGE_TABLE)
+
+    memory_table = None
+    memory_config = agent_config.get("memory", {})
+    if memory_config.get("enabled", False):
+        memory_table = memory_config.get("table_name", DEFAULT_MEMORY_TABLE)
+
+    return AgentStorageConfig(
+        storage_agent_id=agent_id,
+        storage_table=storage_table,
+        memory_table=memory_table,
+        enable_session_summaries=bool(agent_config.get("enable_session_summaries", False)),
+        retention=agent_config.get("retention") or {},
+    )
+
+
+def get_agent_storage_table(
+    agent_id: str, user_id: Optional[str] = None, db: Optional[Session] = None
+) -> Tuple[Optional[str], str]:
+    """
+    Таблица сессий агента и agent_id, под которым agno пишет сессии.
+
+    Returns:
+        (table_name или None если storage выключен, storage agent_id)
+
+    Raises:
+        ValueError: агент не найден
+    """
+    config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
+    return config.storage_table, config.storage_agent_id
+
+
+def get_storage(table_name: str) -> PostgresAgentStorage:
+    """
+    Общий PostgresAgentStorage для таблицы сессий (с кэшем сессий, если session_cache_enabled).
+
+    При первом обращении к таблице в фоне проверяются индексы списка сессий -
+    таблица могла быть создана agno до их появления.
+    """
+    with _lock:
+        storage = _storages.get(table_name)
+        if storage is not None:
+            return storage
+        storage_class = (
+            CachedPostgresAgentStorage if api_settings.session_cache_enabled else IndexedPostgresAgentStorage
+        )
+        indexed = storage_class(table_name=table_name, db_engine=db_engine, schema=STORAGE_SCHEMA)
+        _storages[table_name] = indexed
+    Thread(target=indexed.ensure_indexes, name=f"session-indexes-{table_name}", daemon=True).start()
+    return indexed
+
+
+def session_cache_stats() -> List[Dict[str, Any]]:
+    """Статистика кэша сессий по таблицам"""
+    with _lock:
+        storages = list(_storages.values())
+    return [storage.stats() for storage in storages if isinstance(storage, CachedPostgresAgentStorage)]
+
+
+def clear_session_caches() -> int:
+    """Очищает кэш сессий всех таблиц"""
+    with _lock:
+        storages = list(_storages.values())
+    return sum(storage.clear_cache() for storage in storages if isinstance(storage, CachedPostgresAgentStorage))
+
+
+def get_memory_db(table_name: str) -> PostgresMemoryDb:
+    """Общий PostgresMemoryDb для таблицы памяти"""
+    with _lock:
+        memory_db = _memory_dbs.get(table_name)
+        if memory_db is None:
+            memory_db = PostgresMemoryDb(table_name=table_name, db_engine=db_engine, schema=STORAGE_SCHEMA)
+            _memory_dbs[table_name] = memory_db
+        return memory_db
+
+
+def read_user_memories(memory_db: PostgresMemoryDb, user_id: str) -> List[UserMemory]:
+    """
+    Память пользователя напрямую из таблицы.
+
+    Memory.get_user_memories() делает то же самое, но накапливает память всех
+    пользователей в объекте Memory - для общего обработчика это не подходит.
+    """
+    return [UserMemory.from_dict(row.memory) for row in memory_db.read_memories(user_id=user_id) if row.memory]
@@ -0,0 +1,101 @@
+"""
+Хранилище крупных таблиц (CSV/Excel), загруженных пользователями.
+
+Большие таблицы не вставляются в промпт целиком: конвертер кладет сводку,
+а исходный файл сохраняется здесь под table_id. Агент читает данные через
+TabularQueryTools (agents/tabular_tools.py).
+
+table_id привязан к владельцу загрузки (user_id, без него - session_id):
+первая половина - хэш владельца, вторая - префикс SHA-256 содержимого.
+find_table находит таблицу только для того же владельца, поэтому агент другого
+пользователя не прочитает таблицу, даже если узнает ее table_id.
+
+Модуль без зависимостей от agno/FastAPI - используется в процессах пула конвертации.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import List, Optional
+
+from api.settings import api_settings
+
+# Каталог хранилища (общий для воркеров одного хоста)
+TABLE_STORE_DIR = api_settings.table_store_dir or os.path.join(tempfile.gettempdir(), "crafty_table_store")
+# Максимальный объем хранилища, старые таблицы удаляются первыми
+TABLE_STORE_MAX_BYTES = api_settings.table_store_max_mb * 1024 * 1024
+
+# Длина table_id: hex хэш владельца + hex префикс SHA-256 файла
+TABLE_ID_LENGTH = 16
+_OWNER_TAG_LENGTH = 8
+
+TABLE_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+
+def _owner_tag(owner: str) -> str:
+    return hashlib.sha256(f"table-owner:{owner}".encode()).hexdigest()[:_OWNER_TAG_LENGTH]
+
+
+def make_table_id(content_hash: str, owner: str) -> str:
+    """table_id владельца загрузки (user_id или session_id) из SHA-256 содержимого файла"""
+    return _owner_tag(owner) + content_hash[: TABLE_ID_LENGTH - _OWNER_TAG_LENGTH]
+
+
+def find_table(table_id: str, owner: Optional[str]) -> Optional[str]:
+    """Путь к файлу таблицы владельца или None (чужая или неизвестная таблица)"""
+    # table_id приходит от LLM - допускаем только hex
+    if not table_id or len(table_id) != TABLE_ID_LENGTH or any(c not in "0123456789abcdef" for c in table_id):
+        return None
+    if not owner or not table_id.startswith(_owner_tag(owner)):
+        return None
+    for extension in TABLE_EXTENSIONS:
+        path = os.path.join(TABLE_STORE_DIR, f"{table_id}{extension}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def store_table(source_path: str, table_id: str, extension: str) -> str:
+    """
+    Сохраняет файл таблицы (повторная загрузка того же файла - no-op).
+
+    Returns:
+        Путь к сохраненному файлу
+    """
+    os.makedirs(TABLE_STORE_DIR, exist_ok=True)
+    path = os.path.join(TABLE_STORE_DIR, f"{table_id}{extension}")
+    if os.path.exists(path):
+        os.utime(path)  # Обновляем mtime - таблица снова используется
+        return path
+
+    fd, tmp_path = tempfile.mkstemp(dir=TABLE_STORE_DIR, suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, path)
+    _prune()
+    return path
+
+
+def _prune() -> None:
+    """Удаляет самые старые таблицы сверх TABLE_STORE_MAX_BYTES"""
+    entries: List[tuple] = []
+    for name in os.listdir(TABLE_STORE_DIR):
+        if not name.endswith(TABLE_EXTENSIONS):
+            continue
+        path = os.path.join(TABLE_STORE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= TABLE_STORE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,275 @@
+"""
+Инструменты агента для запросов к большим таблицам, загруженным пользователем.
+
+Конвертер передает в промпт только сводку большой CSV/Excel таблицы и table_id
+(agents/table_store.py). Эти инструменты дают агенту отфильтровать, отсортировать
+и агрегировать полные данные. CSV читается чанками - таблица целиком в память не грузится.
+
+Подключение: builtin инструмент с configuration {"class": "TabularQueryTools"}.
+
+Таблица доступна только владельцу загрузки: agno передает в инструмент агента
+запуска, владелец - его user_id (без него - session_id), как при загрузке файла.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from agno.tools import Toolkit
+from agno.utils.log import log_debug
+
+from agents.table_store import find_table
+
+# Размер чанка чтения CSV (строк)
+QUERY_CHUNK_ROWS = 50_000
+# Максимум строк/групп в ответе инструмента
+MAX_RESULT_ROWS = 200
+
+FILTER_OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "contains", "in")
+AGGREGATIONS = ("sum", "mean", "min", "max", "count")
+
+
+class TabularQueryTools(Toolkit):
+    """
+    Запросы к полным данным больших таблиц по table_id из сводки документа.
+
+    Args:
+        max_rows (int): Максимум строк/групп в одном ответе.
+    """
+
+    def __init__(self, max_rows: int = MAX_RESULT_ROWS, **kwargs):
+        self.max_rows = max_rows
+        tools: List[Any] = [self.describe_table, self.query_table, self.aggregate_table]
+        super().__init__(name="tabular_query", tools=tools, **kwargs)
+
+    def describe_table(self, table_id: str, sheet: str = "", agent: Optional[Any] = None) -> str:
+        """Use this function to get the columns, column types and row count of an uploaded table.
+
+        Args:
+            table_id (str): Table ID from the document summary.
+            sheet (optional): Excel sheet name. Empty for CSV or the first sheet.
+
+        Returns:
+            JSON with columns, dtypes and row count.
+        """
+        try:
+            rows = 0
+            dtypes: Dict[str, str] = {}
+            for frame in self._iter_frames(agent, table_id, sheet):
+                rows += len(frame)
+                if not dtypes:
+                    dtypes = {str(column): str(dtype) for column, dtype in frame.dtypes.items()}
+            return json.dumps({"table_id": table_id, "rows": rows, "columns": dtypes}, ensure_ascii=False)
+        except Exception as e:
+            return f"Error: {e}"
+
+    def query_table(
+        self,
+        table_id: str,
+        columns: str = "",
+        filters: str = "",
+        sort_by: str = "",
+        descending: bool = False,
+        limit: int = 20,
+        sheet: str = "",
+        agent: Optional[Any] = None,
+    ) -> str:
+        """Use this function to select rows from an uploaded table.
+
+        Args:
+            table_id (str): Table ID from the document summary.
+            columns (optional): Comma-separated columns to return. Empty for all columns.
+            filters (optional): JSON list of conditions, e.g. [{"column": "city", "op": "==", "value": "Almaty"}].
+                Operators: ==, !=, >, >=, <, <=, contains, in (value is a list).
+            sort_by (optional): Column to sort by.
+            descending (optional): Sort in descending order.
+            limit (optional, default=20): Maximum number of rows to return.
+            sheet (optional): Excel sheet name. Empty for CSV or the first sheet.
+
+        Returns:
+            JSON with matched row count and the rows.
+        """
+        try:
+            import pandas as pd
+
+            limit = max(1, min(int(limit), self.max_rows))
+            conditions = _parse_filters(filters)
+            selected = [column.strip() for column in columns.split(",") if column.strip()]
+
+            matched = 0
+            kept: List[Any] = []
+            for frame in self._iter_frames(agent, table_id, sheet):
+                frame = _apply_filters(frame, conditions)
+                matched += len(frame)
+                if frame.empty:
+                    continue
+                if sort_by:
+                    frame = frame.sort_values(sort_by, ascending=not descending).head(limit)
+                    kept.append(frame)
+                elif sum(len(part) for part in kept) < limit:
+                    kept.append(frame.head(limit))
+
+            result = pd.concat(kept) if kept else pd.DataFrame()
+            if sort_by and not result.empty:
+                result = result.sort_values(sort_by, ascending=not descending)
+            result = result.head(limit)
+            if selected and not result.empty:
+                result = result[selected]
+
+            log_debug(f"query_table {table_id}: {matched} rows matched")
+            return json.dumps(
+                {"matched_rows": matched, "rows": json.loads(result.to_json(orient="records", date_format="iso"))},
+                ensure_ascii=False,
+            )
+        except Exception as e:
+            return f"Error: {e}"
+
+    def aggregate_table(
+        self,
+        table_id: str,
+        column: str,
+        agg: str = "sum",
+        group_by: str = "",
+        filters: str = "",
+        limit: int = 50,
+        sheet: str = "",
+        agent: Optional[Any] = None,
+    ) -> str:
+        """Use this function to aggregate a column of an uploaded table, optionally grouped by another column.
+
+        Args:
+            table_id (str): Table ID from the document summary.
+            column (str): Column to aggregate.
+            agg (optional, default=sum): One of sum, mean, min, max, count.
+            group_by (optional): Column to group by. Empty for a single total.
+            filters (optional): JSON list of conditions, same format as in query_table.
+            limit (optional, default=50): Maximum number of groups to return (largest values first).
+            sheet (optional): Excel sheet name. Empty for CSV or the first sheet.
+
+        Returns:
+            JSON with aggregated values.
+        """
+        try:
+            import pandas as pd
+
+            if agg not in AGGREGATIONS:
+                return f"Error: agg must be one of {', '.join(AGGREGATIONS)}"
+            limit = max(1, min(int(limit), self.max_rows))
+            conditions = _parse_filters(filters)
+
+            # Частичные агрегаты по чанкам: mean = sum / count
+            partials: List[Any] = []
+            for frame in self._iter_frames(agent, table_id, sheet):
+                frame = _apply_filters(frame, conditions)
+                if frame.empty:
+                    continue
+                values = frame[column]
+                keys = frame[group_by] if group_by else pd.Series(0, index=frame.index)
+                grouped = values.groupby(keys)
+                partials.append(
+                    pd.DataFrame(
+                        {
+                            "sum": grouped.sum(numeric_only=True) if agg in ("sum", "mean") else None,
+                            "count": grouped.count(),
+                            "min": grouped.min() if agg == "min" else None,
+                            "max": grouped.max() if agg == "max" else None,
+                        }
+                    )
+                )
+
+            if not partials:
+                return json.dumps({"groups": []})
+
+            combined = (
+                pd.concat(partials).groupby(level=0).agg({"sum": "sum", "count": "sum", "min": "min", "max": "max"})
+            )
+            if agg == "mean":
+                result = combined["sum"] / combined["count"]
+            else:
+                result = combined[agg]
+
+            if not group_by:
+                return json.dumps({agg: _to_json_value(result.iloc[0])}, ensure_ascii=False)
+
+            result = result.sort_values(ascending=False).head(limit)
+            groups = [{group_by: _to_json_value(key), agg: _to_json_value(value)} for key, value in result.items()]
+            return json.dumps({"groups": groups}, ensure_ascii=False)
+        except Exception as e:
+            return f"Error: {e}"
+
+    def _iter_frames(self, agent: Optional[Any], table_id: str, sheet: str = "") -> Iterator[Any]:
+        """Таблица владельца запуска по частям: CSV - чанками, Excel - лист целиком"""
+        import pandas as pd
+
+        path = find_table(table_id, table_owner(agent))
+        if path is None:
+            raise ValueError(f"Table {table_id} not found (it may have expired, ask the user to upload it again)")
+
+        if path.endswith(".csv"):
+            yield from pd.read_csv(path, encoding="utf-8", chunksize=QUERY_CHUNK_ROWS)
+        else:
+            yield pd.read_excel(path, sheet_name=sheet or 0)
+
+
+def _parse_filters(filters: str) -> List[Dict[str, Any]]:
+    if not filters:
+        return []
+    conditions = json.loads(filters)
+    if isinstance(conditions, dict):
+        conditions = [conditions]
+    for condition in conditions:
+        if condition.get("op", "==") not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {condition.get('op')}")
+    return conditions
+
+
+def _apply_filters(frame: Any, conditions: List[Dict[str, Any]]) -> Any:
+    """Векторная фильтрация: маска по всем условиям (AND)"""
+    if not conditions:
+        return frame
+
+    mask = None
+    for condition in conditions:
+        column = frame[condition["column"]]
+        op = condition.get("op", "==")
+        value = condition.get("value")
+
+        if op == "contains":
+            current = column.astype(str).str.contains(str(value), case=False, regex=False, na=False)
+        elif op == "in":
+            current = column.isin(value if isinstance(value, list) else [value])
+        elif op == "==":
+            current = column == value
+        elif op == "!=":
+            current = column != value
+        elif op == ">":
+            current = column > value
+        elif op == ">=":
+            current = column >= value
+        elif op == "<":
+            current = column < value
+        else:
+            current = column <= value
+
+        mask = current if mask is None else mask & current
+    return frame[mask]
+
+
+def _to_json_value(value: Any) -> Optional[Any]:
+    """numpy/pandas скаляры → JSON совместимые значения"""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+
+
+def table_owner(agent: Optional[Any]) -> Optional[str]:
+    """Владелец таблиц запуска: user_id агента, без него - session_id"""
+    if agent is None:
+        return None
+    return getattr(agent, "user_id", None) or getattr(agent, "session_id", None)
+
+
+def has_table_query_tools(agent: Any) -> bool:
+    """Подключены ли к агенту TabularQueryTools - без них ссылка table_id в сводке таблицы бесполезна"""
+    return any(isinstance(tool, TabularQueryTools) for tool in agent.tools or [])
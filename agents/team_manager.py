@@ -3,7 +3,7 @@
 Позволяет создавать команды через agent_id ссылки.
 """
 
-from typing import List, Optional, Dict
+from typing import Iterable, List, Optional, Dict
 from sqlalchemy.orm import Session
 from agno.agent import Agent
 from agno.utils.log import log_warning, log_debug
@@ -106,6 +106,17 @@ class TeamManager:
             del self._team_cache[key]
             log_debug(f"Invalidated team cache key: {key}")
     
+    def invalidate_team_cache_batch(self, agent_ids: Iterable[str]) -> int:
+        """Инвалидировать кэш команд для нескольких агентов за один проход"""
+        agent_ids = set(agent_ids)
+        keys_to_remove = [
+            cache_key for cache_key in self._team_cache.keys()
+            if any(agent_id in cache_key.split(':')[0] for agent_id in agent_ids)
+        ]
+        for key in keys_to_remove:
+            del self._team_cache[key]
+        return len(keys_to_remove)
+    
     def clear_cache(self):
         """Очистить весь кэш команд"""
         cleared_count = len(self._team_cache)
@@ -152,6 +163,19 @@ def invalidate_team_caches(agent_id: str):
         manager.invalidate_team_cache(agent_id)
 
 
+def invalidate_team_caches_batch(agent_ids: Iterable[str]) -> int:
+    """
+    Инвалидировать кэши команд для нескольких агентов (один проход по каждому менеджеру)
+    
+    Args:
+        agent_ids: ID измененных агентов
+    """
+    agent_ids = set(agent_ids)
+    if not agent_ids:
+        return 0
+    return sum(manager.invalidate_team_cache_batch(agent_ids) for manager in _team_managers.values())
+
+
 def clear_all_team_caches():
     """Очистить все кэши команд"""
     for manager in _team_managers.values():
@@ -10,7 +10,7 @@ Webhook нужен только для:
 - Мониторинга и статистики
 """
 
-from typing import Dict, List, Union, Tuple
+from typing import Dict, Iterable, List, Set, Union, Tuple
 from uuid import UUID
 from threading import RLock
 import time
@@ -35,11 +35,16 @@ class ToolsCache:
         Создает хэш с updated_at - автоматически меняется при ЛЮБЫХ изменениях в БД.
         Триггеры уже настроены! Не нужно думать о том, какие поля важны.
         """
+        return self.version_hash(tool.id, tool.updated_at)
+    
+    @staticmethod
+    def version_hash(tool_id, updated_at) -> str:
+        """Хэш версии конфигурации по id и updated_at (используется и при resync)"""
         # Простой подход: используем updated_at как индикатор ЛЮБЫХ изменений
-        updated_at_str = tool.updated_at.isoformat() if tool.updated_at else "no_date"
+        updated_at_str = updated_at.isoformat() if updated_at else "no_date"
         
         # Хэшируем tool_id + updated_at = уникальный хэш для каждой версии конфигурации
-        hash_data = f"{tool.id}|{updated_at_str}"
+        hash_data = f"{tool_id}|{updated_at_str}"
         return hashlib.md5(hash_data.encode()).hexdigest()[:12]
     
     def _make_cache_key(self, tool_id: UUID, config_hash: str) -> str:
@@ -97,7 +102,7 @@ class ToolsCache:
                     result[tool_id] = tool
         return result
     
-    def invalidate_tool(self, tool_id: UUID) -> int:
+    def invalidate_tool(self, tool_id: Union[UUID, str]) -> int:
         """Инвалидация всех версий инструмента"""
         count = 0
         with self._lock:
@@ -112,12 +117,27 @@ class ToolsCache:
                 
         return count
     
-    def invalidate_tools(self, tool_ids: List[UUID]) -> int:
-        """Инвалидация нескольких инструментов"""
-        count = 0
-        for tool_id in tool_ids:
-            count += self.invalidate_tool(tool_id)
-        return count
+    def invalidate_tools(self, tool_ids: Iterable[Union[UUID, str]]) -> int:
+        """Инвалидация нескольких инструментов за один проход по кэшу"""
+        prefixes = {str(tool_id) for tool_id in tool_ids}
+        with self._lock:
+            keys_to_remove = [
+                key for key in self._cache.keys()
+                if key.split("|", 1)[0] in prefixes
+            ]
+            
+            for key in keys_to_remove:
+                del self._cache[key]
+                
+        return len(keys_to_remove)
+    
+    def versions(self) -> Dict[str, Set[str]]:
+        """Закэшированные версии конфигураций: tool_id -> хэши версий"""
+        with self._lock:
+            result: Dict[str, Set[str]] = {}
+            for key, (_, _, config_hash) in self._cache.items():
+                result.setdefault(key.split("|", 1)[0], set()).add(config_hash)
+            return result
     
     def clear(self) -> int:
         """Очистка всего кэша"""
@@ -3,19 +3,22 @@
 Автоматически учитывает изменения конфигураций через хэширование.
 """
 
-from typing import List, Union, Dict, Tuple
+from typing import TYPE_CHECKING, List, Union, Dict, Tuple
 from uuid import UUID
 from sqlalchemy.orm import Session
 
 # Нативные agno классы
+# Классы инструментов (DuckDuckGo, FileTools, MCP SDK) импортируются при создании
+# первого инструмента своего типа - большинству воркеров нужны не все
 from agno.tools import Toolkit, Function
-from agno.tools.duckduckgo import DuckDuckGoTools
-from agno.tools.file import FileTools
-from agno.tools.mcp import MCPTools
+
+if TYPE_CHECKING:
+    from agno.tools.mcp import MCPTools
 
 # Модели проекта
 from db.models.tool import Tool
 from agents.tools_cache import tools_cache  # ← КЭШ С УЧЕТОМ КОНФИГУРАЦИЙ
+from agents.tabular_tools import TabularQueryTools  # ← ЗАПРОСЫ К БОЛЬШИМ ТАБЛИЦАМ
 
 
 def load_tools_for_agent(db: Session, tool_ids: List[UUID]) -> List[Union[Toolkit, Function]]:
@@ -87,16 +90,23 @@ def _create_builtin_tool(config: dict) -> Toolkit:
     
     # Простой маппинг встроенных классов
     if tool_class == "DuckDuckGoTools":
+        from agno.tools.duckduckgo import DuckDuckGoTools
         return DuckDuckGoTools(**params)
     elif tool_class == "FileTools":
+        from agno.tools.file import FileTools
         return FileTools(**params)
+    elif tool_class == "TabularQueryTools":
+        return TabularQueryTools(**params)
     else:
         # Fallback
+        from agno.tools.duckduckgo import DuckDuckGoTools
         return DuckDuckGoTools()
 
 
-def _create_mcp_tool(config: dict) -> MCPTools:
+def _create_mcp_tool(config: dict) -> "MCPTools":
     """Создает MCP инструмент через нативный agno MCPTools"""
+    from agno.tools.mcp import MCPTools
+
     return MCPTools(
         command=config.get("command"),
         url=config.get("url"),
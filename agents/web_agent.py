@@ -5,9 +5,9 @@ from agno.agent import Agent
 from agno.memory.v2.db.postgres import PostgresMemoryDb
 from agno.memory.v2.memory import Memory
 from agno.models.openai import OpenAIChat
-from agno.storage.agent.postgres import PostgresAgentStorage
 from agno.tools.duckduckgo import DuckDuckGoTools
 
+from agents.storage_resolver import get_storage
 from db.session import db_url
 
 
@@ -75,11 +75,7 @@ def get_web_agent(
         add_state_in_messages=True,
         # -*- Storage -*-
         # Storage chat history and session state in a Postgres table
-        storage=PostgresAgentStorage(
-            table_name="sessions", 
-            db_url=db_url,
-            schema="public"
-        ),
+        storage=get_storage("sessions"),
         # -*- History -*-
         # Send the last 3 messages from the chat history
         add_history_to_messages=True,
@@ -4,6 +4,9 @@ from contextlib import asynccontextmanager
 
 from api.routes.v1_router import v1_router
 from api.settings import api_settings
+from api.utils.conversion_pool import conversion_pool
+from api.utils.retention import retention_job
+from api.utils.warmup import warmup_job
 from agents.cache_listener import start_cache_listener_background, stop_cache_listener_background
 
 
@@ -12,9 +15,17 @@ async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     # Startup: запускаем cache listener
     await start_cache_listener_background()
+    # Фоновая компактизация сессий (если retention_enabled)
+    retention_job.start()
+    # Прогрев кэшей агентов и инструментов (/v1/ready - после прогрева)
+    warmup_job.start()
     yield
+    await warmup_job.stop()
+    await retention_job.stop()
     # Shutdown: останавливаем cache listener
     await stop_cache_listener_background()
+    # Останавливаем процессы пула конвертации документов
+    conversion_pool.shutdown()
 
 
 def create_app() -> FastAPI:
@@ -40,6 +51,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Retry-After", "X-Response-Cache"],
     )
 
     return app
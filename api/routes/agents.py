@@ -1,23 +1,57 @@
 from enum import Enum
+from functools import partial
 from logging import getLogger
-from typing import AsyncGenerator, List, Optional
+from typing import AsyncGenerator, Dict, List, Optional
+import asyncio
 import json
 import time
+from uuid import uuid4
 
 from agno.agent import Agent, AgentKnowledge
 from agno.media import Image, Audio, Video, File as FileMedia
-from fastapi import APIRouter, HTTPException, status, Depends, Form, File, UploadFile, Query
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from agno.storage.session.agent import AgentSession
+from fastapi import APIRouter, HTTPException, status, Depends, Form, File, UploadFile, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
 
-from agents.agno_assist import get_agno_assist_knowledge
-from agents.selector import AgentType, get_agent, get_available_agents
+from agents.selector import (
+    AgentType,
+    get_agent,
+    get_agent_company_id,
+    get_available_agents,
+)
+from agents.storage_resolver import (
+    get_agent_storage_config,
+    get_agent_storage_table,
+    get_memory_db,
+    get_storage,
+    read_user_memories,
+)
 from agents.tool_hooks import list_available_hooks, get_hook_descriptions
 from agents.response_models import list_available_models, get_models_info, get_model_schema
+from agents.tabular_tools import has_table_query_tools, table_owner
 from agents.team_manager import get_all_cache_stats, clear_all_team_caches
-from api.utils.file_processing import process_files
-from db.session import get_db
+from api.settings import api_settings
+from api.utils.admission import AdmissionRejected, AdmissionTicket, run_admission
+from api.utils.file_processing import cleanup_spooled_files, hash_upload, process_files
+from api.utils.response_cache import (
+    RESPONSE_CACHE_HEADER,
+    get_response_cache_policy,
+    is_complete_response,
+    rebind_response,
+    record_stream,
+    replay_stream,
+    response_cache,
+    response_cache_key,
+)
+from api.utils.semantic_cache import semantic_cache
+from db.session import db_engine, get_db
+from db.session_transfer import import_lines, iter_export_chunks, iter_export_lines, open_ndjson
+from db.sessions import list_session_summaries
 
 logger = getLogger(__name__)
 
@@ -141,6 +175,55 @@ async def clear_team_cache():
     }
 
 
+@agents_router.get("/admission/stats")
+async def get_admission_stats():
+    """
+    Получить метрики admission control запусков агентов на этом воркере.
+
+    Returns:
+        Активные запуски, глубина очередей по ключам и счетчики отказов
+    """
+    return run_admission.stats()
+
+
+async def admit_agent_run(agent_id: str, user_id: Optional[str], db: Session) -> AdmissionTicket:
+    """
+    Занимает слот запуска агента или отвечает 429/503 с Retry-After.
+
+    Returns:
+        AdmissionTicket, который нужно освободить после завершения запуска
+    """
+    company_id = get_agent_company_id(agent_id, user_id=user_id, db=db)
+    try:
+        return await run_admission.acquire(agent_id=agent_id, user_id=user_id, company_id=company_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def finish_agent_run(ticket: AdmissionTicket, spooled_paths: Optional[List[str]] = None) -> None:
+    """Освобождает слот запуска и удаляет временные файлы загрузок"""
+    ticket.release()
+    if spooled_paths:
+        cleanup_spooled_files(spooled_paths)
+
+
+async def release_after_stream(
+    stream: AsyncGenerator,
+    ticket: AdmissionTicket,
+    spooled_paths: Optional[List[str]] = None,
+) -> AsyncGenerator:
+    """Освобождает слот запуска после завершения (или обрыва) стрима"""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        finish_agent_run(ticket, spooled_paths)
+
+
 async def chat_response_streamer(
     agent: Agent, 
     message: str,
@@ -245,6 +328,7 @@ async def create_agent_run(
     session_id: Optional[str] = Form(None),
     user_id: Optional[str] = Form(None),
     files: Optional[List[UploadFile]] = File(None),  # ← ФАЙЛЫ
+    pdf_pages: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     """
@@ -258,6 +342,7 @@ async def create_agent_run(
         session_id: ID сессии (опционально)
         user_id: ID пользователя (опционально)
         files: Список загружаемых файлов (опционально)
+        pdf_pages: Диапазон страниц PDF, например "1-5,8,10-" (опционально, извлекается текст страниц)
         db: Сессия БД
 
     Returns:
@@ -265,24 +350,72 @@ async def create_agent_run(
     """
     logger.debug(f"Agent run: agent_id={agent_id}, message={message[:50]}..., files_count={len(files) if files else 0}")
 
-    # Обработка файлов (1 строка)
-    images, audios, videos, input_files = process_files(files)
-    
-    # Получение агента (как было)
+    # Кэш ответов детерминированных агентов - попадание не занимает слот запуска
+    cache_key = None
+    store_semantic = None
+    cache_policy = get_response_cache_policy(agent_id, user_id, db)
+    if cache_policy is not None:
+        file_hashes = [await asyncio.to_thread(hash_upload, file) for file in files or []]
+        cache_key = response_cache_key(cache_policy, model, message, file_hashes, pdf_pages, stream)
+        cached = response_cache.get(cache_key)
+        cache_status = "hit"
+        semantic_threshold = cache_policy.semantic_threshold
+        if cached is None and semantic_threshold is not None and not files:
+            # Перефразированный запрос - ближайший сохраненный ответ той же версии агента
+            semantic_hit, embedding = await semantic_cache.lookup(
+                cache_policy, semantic_threshold, model, stream, message
+            )
+            if semantic_hit is not None:
+                cached, cache_status = semantic_hit.response, "semantic-hit"
+                response_cache.put(cache_key, cached, cache_policy.ttl_seconds)
+            elif embedding is not None:
+                store_semantic = partial(semantic_cache.store, cache_policy, model, stream, message, embedding)
+        if cached is not None:
+            hit_headers = {RESPONSE_CACHE_HEADER: cache_status}
+            # Ответ первого запроса - с session_id/run_id текущего
+            if stream:
+                return StreamingResponse(
+                    replay_stream(cached, session_id), media_type="text/event-stream", headers=hit_headers
+                )
+            return JSONResponse(rebind_response(cached, session_id), headers=hit_headers)
+
+    # Admission control - быстрый 429/503 до обработки файлов и построения агента
+    ticket = await admit_agent_run(agent_id, user_id, db)
+    release_now = True
+    # Временные файлы крупных загрузок, удаляются после запуска
+    spooled_paths: List[str] = []
+    if files and not user_id and not session_id:
+        # Таблицы загрузки привязываются к владельцу (user_id или session_id) - сессия
+        # нужна до запуска, agno создал бы ее сам при запуске
+        session_id = str(uuid4())
     try:
-        agent: Agent = get_agent(
-            model_id=model,
-            agent_id=agent_id,
-            user_id=user_id,
-            session_id=session_id,
-            db=db
+        # Получение агента (как было)
+        try:
+            agent: Agent = get_agent(
+                model_id=model,
+                agent_id=agent_id,
+                user_id=user_id,
+                session_id=session_id,
+                db=db
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+        # Обработка файлов: ссылки на полные данные таблиц - только если агент может их запросить
+        # Сессия агента со storage сохраняет пути файлов - временные файлы удаляются
+        # после запуска, поэтому без постоянного media_store загрузки передаются байтами
+        images, audios, videos, input_files = await process_files(
+            files,
+            spooled_paths if agent.storage is None else None,
+            pdf_pages,
+            table_owner=table_owner(agent) if has_table_query_tools(agent) else None,
+            keep_in_history=agent.storage is not None,
         )
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
-    if stream:
-        return StreamingResponse(
-            chat_response_streamer(
+        if stream:
+            # Слот освобождается когда стрим завершится
+            release_now = False
+            events = chat_response_streamer(
                 agent, message,
                 session_id=session_id,
                 user_id=user_id,
@@ -290,22 +423,184 @@ async def create_agent_run(
                 audio=audios if audios else None,
                 videos=videos if videos else None,
                 files=input_files if input_files else None,
-            ),
-            media_type="text/event-stream",
+            )
+            headers: Optional[Dict[str, str]] = None
+            if cache_key is not None and cache_policy is not None:
+                events = record_stream(events, cache_key, cache_policy, on_complete=store_semantic)
+                headers = {RESPONSE_CACHE_HEADER: "miss"}
+            return StreamingResponse(
+                release_after_stream(events, ticket, spooled_paths),
+                media_type="text/event-stream",
+                headers=headers,
+                background=BackgroundTask(finish_agent_run, ticket, spooled_paths),
+            )
+        else:
+            response = await agent.arun(
+                message,
+                session_id=session_id,
+                user_id=user_id,
+                images=images if images else None,
+                audio=audios if audios else None,
+                videos=videos if videos else None,
+                files=input_files if input_files else None,
+                stream=False,
+            )
+            # ✅ ПОЛНАЯ структура вместо только content
+            result = response.to_dict() if hasattr(response, 'to_dict') else response.content
+            if (
+                cache_key is not None and cache_policy is not None
+                and isinstance(result, dict) and is_complete_response(result)
+            ):
+                result = jsonable_encoder(result)
+                response_cache.put(cache_key, result, cache_policy.ttl_seconds)
+                return JSONResponse(
+                    result,
+                    headers={RESPONSE_CACHE_HEADER: "miss"},
+                    background=BackgroundTask(store_semantic, result) if store_semantic else None,
+                )
+            return result
+    finally:
+        if release_now:
+            finish_agent_run(ticket, spooled_paths)
+
+
+class BatchRunItem(BaseModel):
+    """Одно сообщение в batch запуске"""
+    message: str
+    item_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+class BatchRunRequest(BaseModel):
+    """Запрос на batch запуск агента"""
+    items: List[BatchRunItem] = Field(..., min_length=1)
+    model: str = "gpt-4.1-mini-2025-04-14"
+    user_id: Optional[str] = None
+    concurrency: int = Field(4, ge=1)
+
+
+async def batch_run_streamer(
+    agent: Agent,
+    agent_key: str,
+    items: List[BatchRunItem],
+    user_id: Optional[str],
+    company_id: Optional[str],
+    concurrency: int,
+) -> AsyncGenerator:
+    """
+    Выполняет сообщения batch запроса с ограниченной параллельностью.
+
+    Каждый запуск работает на своей копии агента (agent.deep_copy), чтобы
+    параллельные arun не делили состояние одного экземпляра из кэша.
+
+    Yields:
+        NDJSON строки с результатом каждого элемента в порядке завершения
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(index: int, item: BatchRunItem) -> dict:
+        async with semaphore:
+            started_at = time.time()
+            result = {
+                "index": index,
+                "item_id": item.item_id,
+                "session_id": item.session_id,
+            }
+            ticket = None
+            try:
+                # Элементы batch проходят тот же admission control, что и одиночные запуски
+                ticket = await run_admission.acquire(
+                    agent_id=agent_key,
+                    user_id=user_id,
+                    company_id=company_id,
+                )
+                item_agent = agent.deep_copy() if hasattr(agent, 'deep_copy') else agent
+                response = await item_agent.arun(
+                    item.message,
+                    session_id=item.session_id,
+                    user_id=user_id,
+                    stream=False,
+                )
+                result["status"] = "success"
+                result["response"] = response.to_dict() if hasattr(response, 'to_dict') else response.content
+            except AdmissionRejected as e:
+                result["status"] = "rejected"
+                result["error"] = e.detail
+                result["error_type"] = type(e).__name__
+                result["retry_after"] = e.retry_after
+            except Exception as e:
+                logger.error(f"Batch item {index} failed for agent {getattr(agent, 'agent_id', '')}: {e}")
+                result["status"] = "error"
+                result["error"] = str(e)
+                result["error_type"] = type(e).__name__
+            finally:
+                if ticket is not None:
+                    ticket.release()
+            result["duration_ms"] = int((time.time() - started_at) * 1000)
+            return result
+
+    tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            result = await completed
+            yield json.dumps(result, default=str) + "\n"
+    finally:
+        # Клиент отключился или генератор закрыт - отменяем незавершенные запуски
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+@agents_router.post("/{agent_id}/runs/batch", status_code=status.HTTP_200_OK)
+async def create_agent_batch_run(
+    agent_id: str,
+    body: BatchRunRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Отправляет много сообщений одному агенту в одном запросе.
+
+    Агент резолвится один раз, сообщения выполняются с ограниченной
+    параллельностью, результаты стримятся как NDJSON в порядке завершения.
+    Ошибка одного элемента не прерывает остальные.
+
+    Args:
+        agent_id: ID агента
+        body: Список сообщений и параметры запуска
+        db: Сессия БД
+
+    Returns:
+        Потоковый NDJSON ответ (одна строка на элемент)
+    """
+    if len(body.items) > api_settings.batch_run_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many items in batch: {len(body.items)} (max {api_settings.batch_run_max_items})"
         )
-    else:
-        response = await agent.arun(
-            message,
-            session_id=session_id,
-            user_id=user_id,
-            images=images if images else None,
-            audio=audios if audios else None,
-            videos=videos if videos else None,
-            files=input_files if input_files else None,
-            stream=False,
+
+    logger.debug(f"Batch run: agent_id={agent_id}, items={len(body.items)}, concurrency={body.concurrency}")
+
+    try:
+        agent: Agent = get_agent(
+            model_id=body.model,
+            agent_id=agent_id,
+            user_id=body.user_id,
+            db=db
         )
-        # ✅ ПОЛНАЯ структура вместо только content
-        return response.to_dict() if hasattr(response, 'to_dict') else response.content
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    concurrency = min(body.concurrency, api_settings.batch_run_max_concurrency)
+    company_id = get_agent_company_id(agent_id, user_id=body.user_id, db=db)
+    return StreamingResponse(
+        batch_run_streamer(
+            agent, agent_id, body.items,
+            user_id=body.user_id,
+            company_id=company_id,
+            concurrency=concurrency,
+        ),
+        media_type="application/x-ndjson",
+    )
 
 
 @agents_router.post("/{agent_id}/runs/{run_id}/continue", status_code=status.HTTP_200_OK)
@@ -352,37 +647,49 @@ async def continue_agent_run(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid structure or content for tools: {str(e)}")
     
-    # Получение агента (наша логика)
+    # Admission control - continue тоже запускает модель и инструменты
+    ticket = await admit_agent_run(agent_id, user_id, db)
+    release_now = True
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, user_id=user_id, session_id=session_id, db=db)
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
-    
-    # Используем agno continue если есть, fallback если нет
-    if hasattr(agent, 'acontinue_run'):
-        if stream:
-            return StreamingResponse(
-                continue_response_streamer(agent, run_id, updated_tools, session_id, user_id),
-                media_type="text/event-stream",
-            )
-        else:
-            try:
-                response = await agent.acontinue_run(
-                    run_id=run_id,
-                    updated_tools=updated_tools,
-                    session_id=session_id,
-                    user_id=user_id,
-                    stream=False,
+        # Получение агента (наша логика)
+        try:
+            agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, user_id=user_id, session_id=session_id, db=db)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        
+        # Используем agno continue если есть, fallback если нет
+        if hasattr(agent, 'acontinue_run'):
+            if stream:
+                release_now = False
+                return StreamingResponse(
+                    release_after_stream(
+                        continue_response_streamer(agent, run_id, updated_tools, session_id, user_id),
+                        ticket,
+                    ),
+                    media_type="text/event-stream",
+                    background=BackgroundTask(ticket.release),
                 )
-                return response.to_dict() if hasattr(response, 'to_dict') else response.content
-            except RuntimeError as e:
-                if "No runs found for run ID" in str(e):
-                    raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
-                raise HTTPException(status_code=500, detail=f"Continue run failed: {str(e)}")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Continue run error: {str(e)}")
-    else:
-        raise HTTPException(status_code=501, detail="Continue run not supported by this agent")
+            else:
+                try:
+                    response = await agent.acontinue_run(
+                        run_id=run_id,
+                        updated_tools=updated_tools,
+                        session_id=session_id,
+                        user_id=user_id,
+                        stream=False,
+                    )
+                    return response.to_dict() if hasattr(response, 'to_dict') else response.content
+                except RuntimeError as e:
+                    if "No runs found for run ID" in str(e):
+                        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+                    raise HTTPException(status_code=500, detail=f"Continue run failed: {str(e)}")
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Continue run error: {str(e)}")
+        else:
+            raise HTTPException(status_code=501, detail="Continue run not supported by this agent")
+    finally:
+        if release_now:
+            ticket.release()
 
 
 # Простой стример для continue (копия основного стримера)
@@ -440,38 +747,153 @@ async def continue_response_streamer(agent, run_id, updated_tools, session_id, u
 @agents_router.get("/{agent_id}/sessions")
 async def get_all_agent_sessions(
     agent_id: str, 
+    response: Response,
     user_id: Optional[str] = Query(None, min_length=1),
+    limit: Optional[int] = Query(
+        None, ge=1, le=api_settings.sessions_page_max_size,
+        description="Размер страницы; без limit и cursor возвращаются все сессии",
+    ),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
     db: Session = Depends(get_db)
 ):
-    """Получение всех сессий агента"""
+    """
+    Получение сессий агента, новые первыми.
+
+    Читает только session_id, имя и created_at (без memory/session_data JSON).
+    Без limit и cursor возвращаются все сессии (как раньше). С limit или cursor -
+    keyset пагинация: курсор следующей страницы возвращается в заголовке
+    X-Next-Cursor, размер страницы по умолчанию - sessions_page_size.
+    """
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, db=db)
+        table_name, storage_agent_id = get_agent_storage_table(agent_id, user_id=user_id, db=db)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
-    if not hasattr(agent, 'storage') or agent.storage is None:
+    if table_name is None:
         raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
+
+    # Без limit и cursor - все сессии (прежний контракт), курсор без limit - страница по умолчанию
+    if limit is None and cursor is not None:
+        limit = api_settings.sessions_page_size
     
     try:
-        all_sessions = agent.storage.get_all_sessions(user_id=user_id, entity_id=agent_id)
-        return [
-            {
-                "session_id": session.session_id,
-                "session_name": session.session_data.get("session_name") if session.session_data else None,
-                "created_at": session.created_at,
-                "title": f"Session {session.session_id[:8]}"  # Простой title без playground зависимостей
-            }
-            for session in all_sessions
-        ]
-    except HTTPException:
-        raise  # Пропускаем HTTP ошибки без изменения
+        sessions, next_cursor = list_session_summaries(
+            db,
+            table_name=table_name,
+            agent_id=storage_agent_id,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProgrammingError as e:
+        # Таблица сессий еще не создана agno (ни одного запуска со storage)
+        if "does not exist" in str(e):
+            return []
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
     except Exception as e:
-        # Проверяем на ошибки "не найдено" от agno  
-        error_msg = str(e).lower()
-        if "404" in str(e) or "not found" in error_msg:
-            raise HTTPException(status_code=404, detail="Sessions not found")
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        {
+            **session,
+            "title": f"Session {session['session_id'][:8]}"  # Простой title без playground зависимостей
+        }
+        for session in sessions
+    ]
+
+
+@agents_router.get("/{agent_id}/sessions/export")
+async def export_agent_sessions(
+    agent_id: str,
+    user_id: Optional[str] = Query(None, min_length=1),
+    include_memories: bool = Query(True, description="Выгрузить память пользователей этих сессий"),
+    compress: bool = Query(False, description="Сжать ответ gzip"),
+    db: Session = Depends(get_db)
+):
+    """
+    Потоковый экспорт сессий агента (и памяти их пользователей) в NDJSON.
+
+    Строки читаются серверным курсором пачками - память не зависит от числа сессий.
+    Результат загружается обратно через POST /agents/{agent_id}/sessions/import.
+    """
+    try:
+        config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    if config.storage_table is None:
+        raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
+
+    lines = iter_export_lines(
+        db_engine,
+        table_name=config.storage_table,
+        agent_id=config.storage_agent_id,
+        user_id=user_id,
+        memory_table=config.memory_table if include_memories else None,
+        batch_size=api_settings.sessions_transfer_batch_size,
+    )
+    filename = f"{agent_id}_sessions.ndjson" + (".gz" if compress else "")
+    return StreamingResponse(
+        iter_export_chunks(lines, compress=compress),  # Синхронный генератор - Starlette читает его в threadpool
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@agents_router.post("/{agent_id}/sessions/import")
+async def import_agent_sessions(
+    agent_id: str,
+    file: UploadFile = File(..., description="NDJSON экспорта (можно gzip)"),
+    user_id: Optional[str] = Form(None, description="Записать сессии и память под этого пользователя"),
+    db: Session = Depends(get_db)
+):
+    """
+    Импорт NDJSON экспорта в сессии агента одной транзакцией.
+
+    Сессии записываются под agent_id целевого агента (и под user_id, если он
+    задан). Существующие сессии и память с теми же ключами перезаписываются,
+    только если принадлежат тому же агенту и пользователю - остальные
+    записи пропускаются (skipped).
+    """
+    try:
+        config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    storage_table = config.storage_table
+    if storage_table is None:
+        raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
+
+    def _import():
+        # Таблицы создаются agno лениво - до первого запуска агента их может не быть
+        get_storage(storage_table).create()
+        if config.memory_table:
+            get_memory_db(config.memory_table).create()
+        return import_lines(
+            db_engine,
+            open_ndjson(file.file),
+            table_name=storage_table,
+            agent_id=config.storage_agent_id,
+            user_id=user_id,
+            memory_table=config.memory_table,
+            batch_size=api_settings.sessions_transfer_batch_size,
+        )
+
+    try:
+        counts = await asyncio.to_thread(_import)
+    except (ValueError, OSError, EOFError) as e:
+        # Некорректный JSON, обрезанный gzip, не UTF-8
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing sessions: {str(e)}")
+
+    logger.info(f"Imported into {agent_id}: {counts}")
+    return {"agent_id": agent_id, **counts}
+
 
 @agents_router.get("/{agent_id}/sessions/{session_id}")
 async def get_agent_session(
@@ -480,18 +902,18 @@ async def get_agent_session(
     user_id: Optional[str] = Query(None, min_length=1),
     db: Session = Depends(get_db)
 ):
-    """Получение конкретной сессии агента"""
+    """Получение конкретной сессии агента (без построения агента)"""
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, db=db)
+        config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
-    if not hasattr(agent, 'storage') or agent.storage is None:
+    if config.storage_table is None:
         raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
     
     try:
-        session = agent.storage.read(session_id, user_id)
-        if not session:
+        session = get_storage(config.storage_table).read(session_id, user_id)
+        if not isinstance(session, AgentSession) or session.agent_id != config.storage_agent_id:
             raise HTTPException(status_code=404, detail="Session not found")
         return session.to_dict()
     except HTTPException:
@@ -516,21 +938,25 @@ async def rename_agent_session(
     body: SessionRenameRequest,
     db: Session = Depends(get_db)
 ):
-    """Переименование сессии агента"""
+    """Переименование сессии агента (session_data.session_name, как Agent.rename_session)"""
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, db=db)
+        config = get_agent_storage_config(agent_id, user_id=body.user_id, db=db)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
-    if not hasattr(agent, 'storage') or agent.storage is None:
+    if config.storage_table is None:
         raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
     
     try:
-        if hasattr(agent, 'rename_session'):
-            agent.rename_session(body.name, session_id=session_id)
-            return {"message": f"Successfully renamed session {session_id}"}
-        else:
-            raise HTTPException(status_code=501, detail="Session renaming not supported by this agent")
+        storage = get_storage(config.storage_table)
+        session = storage.read(session_id, body.user_id)
+        if not isinstance(session, AgentSession) or session.agent_id != config.storage_agent_id:
+            raise HTTPException(status_code=404, detail="Session not found")
+        session.session_data = {**(session.session_data or {}), "session_name": body.name}
+        storage.upsert(session)
+        return {"message": f"Successfully renamed session {session_id}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error renaming session: {str(e)}")
 
@@ -544,15 +970,15 @@ async def delete_agent_session(
 ):
     """Удаление сессии агента"""
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, db=db)
+        config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
-    if not hasattr(agent, 'storage') or agent.storage is None:
+    if config.storage_table is None:
         raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
     
     try:
-        agent.delete_session(session_id)
+        get_storage(config.storage_table).delete_session(session_id)
         return {"message": f"Successfully deleted session {session_id}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
@@ -566,27 +992,23 @@ async def get_agent_memories(
 ):
     """Получение памяти агента для пользователя"""
     try:
-        agent = get_agent(model_id="gpt-4.1-mini-2025-04-14", agent_id=agent_id, db=db)
+        config = get_agent_storage_config(agent_id, user_id=user_id, db=db)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     
-    if not hasattr(agent, 'memory') or agent.memory is None:
+    if config.memory_table is None:
         raise HTTPException(status_code=404, detail="Agent does not have memory enabled.")
     
     try:
-        # Простая реализация без зависимостей от playground
-        if hasattr(agent.memory, 'get_user_memories'):
-            memories = agent.memory.get_user_memories(user_id=user_id)
-            return [
-                {
-                    "memory": memory.memory if hasattr(memory, 'memory') else str(memory),
-                    "topics": memory.topics if hasattr(memory, 'topics') else [],
-                    "last_updated": memory.last_updated if hasattr(memory, 'last_updated') else None
-                }
-                for memory in memories
-            ]
-        else:
-            return []
+        memories = read_user_memories(get_memory_db(config.memory_table), user_id)
+        return [
+            {
+                "memory": memory.memory,
+                "topics": memory.topics or [],
+                "last_updated": memory.last_updated
+            }
+            for memory in memories
+        ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving memories: {str(e)}")
 
@@ -606,6 +1028,7 @@ async def load_agent_knowledge(agent_id: str):  # Изменил тип на str
     agent_knowledge: Optional[AgentKnowledge] = None
 
     if agent_id == AgentType.AGNO_ASSIST.value:
+        from agents.agno_assist import get_agno_assist_knowledge
         agent_knowledge = get_agno_assist_knowledge()
     else:
         raise HTTPException(
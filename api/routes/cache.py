@@ -5,16 +5,27 @@
 
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from uuid import UUID
 
 from agents.agent_cache import agent_cache
+from agents.cache_listener import apply_cache_command, cache_listener
+from agents.embedding_cache import embedding_cache
 from agents.tools_cache import tools_cache  # ← НОВЫЙ КЭШ ИНСТРУМЕНТОВ
-from agents.selector import invalidate_available_agents_cache  # ← КЭШ СПИСКА АГЕНТОВ
+from agents.storage_resolver import session_cache_stats
+from api.utils.conversion_cache import conversion_cache
+from api.utils.media_store import media_store
+from api.utils.response_cache import response_cache
+from api.utils.semantic_cache import semantic_cache
 
 cache_router = APIRouter(prefix="/cache", tags=["Cache Management"])
 
 
+class SemanticFalseHitRequest(BaseModel):
+    """Отметка ложного попадания семантического кэша"""
+    entry_id: int
+
+
 class CacheInvalidateRequest(BaseModel):
     """Запрос на инвалидацию кэша"""
     agent_id: Optional[str] = None
@@ -32,46 +43,30 @@ async def invalidate_cache(request: CacheInvalidateRequest):
     - Изменении конфигурации агента/инструмента
     - Деактивации агента/инструмента
     - Изменении инструментов агента
+
+    Инвалидация применяется в текущем воркере и публикуется через
+    pg_notify - остальные воркеры и реплики применяют ее в своем listener'е.
     """
-    invalidated_count = 0
-    
+    command: Dict[str, Any]
     if request.agent_id:
-        # Инвалидация конкретного агента (все его версии)
-        invalidated_count = agent_cache.invalidate_agent(request.agent_id)
-        # Также инвалидируем кэш списка агентов (для CREATE/DELETE случаев)
-        invalidate_available_agents_cache()
-        return {
-            "message": f"Invalidated agent: {request.agent_id}",
-            "invalidated_count": invalidated_count,
-            "type": "agent"
-        }
+        # Инвалидация конкретного агента (все его версии, команды и список агентов)
+        command = {"action": "invalidate_agent", "agent_id": request.agent_id}
+        message, cache_type = f"Invalidated agent: {request.agent_id}", "agent"
     
     elif request.user_id:
         # Инвалидация всех агентов пользователя
-        invalidated_count = agent_cache.invalidate_user(request.user_id)
-        return {
-            "message": f"Invalidated user agents: {request.user_id}",
-            "invalidated_count": invalidated_count,
-            "type": "user_agents"
-        }
+        command = {"action": "invalidate_user", "user_id": request.user_id}
+        message, cache_type = f"Invalidated user agents: {request.user_id}", "user_agents"
     
     elif request.tool_id:
         # Инвалидация конкретного инструмента
-        invalidated = tools_cache.invalidate_tool(request.tool_id)
-        return {
-            "message": f"Invalidated tool: {request.tool_id}",
-            "invalidated_count": 1 if invalidated else 0,
-            "type": "tool"
-        }
+        command = {"action": "invalidate_tools", "tool_ids": [str(request.tool_id)]}
+        message, cache_type = f"Invalidated tool: {request.tool_id}", "tool"
     
     elif request.tool_ids:
         # Инвалидация нескольких инструментов
-        invalidated_count = tools_cache.invalidate_tools(request.tool_ids)
-        return {
-            "message": f"Invalidated {len(request.tool_ids)} tools",
-            "invalidated_count": invalidated_count,
-            "type": "tools"
-        }
+        command = {"action": "invalidate_tools", "tool_ids": [str(tool_id) for tool_id in request.tool_ids]}
+        message, cache_type = f"Invalidated {len(request.tool_ids)} tools", "tools"
     
     else:
         raise HTTPException(
@@ -79,21 +74,36 @@ async def invalidate_cache(request: CacheInvalidateRequest):
             detail="Either agent_id, user_id, tool_id, or tool_ids must be provided"
         )
 
+    result = apply_cache_command(command)
+    published = await cache_listener.publish(command)
+    return {
+        "message": message,
+        "invalidated_count": result.get("agents", 0) + result.get("tools", 0),
+        "type": cache_type,
+        "published": published
+    }
+
 
 @cache_router.post("/clear")
 async def clear_cache():
-    """Полная очистка кэша (для админов)"""
-    agents_cleared = agent_cache.clear()
-    tools_cleared = tools_cache.clear()
-    # Также очищаем кэш списка агентов
-    invalidate_available_agents_cache()
+    """
+    Полная очистка кэша (для админов) во всех воркерах.
+
+    Увеличивает epoch в cache_epoch - воркер, пропустивший уведомление,
+    очистит кэш при следующей проверке соединения listener'а.
+    """
+    result = apply_cache_command({"action": "clear"})
+    published = await cache_listener.publish({"action": "clear"})
     
     return {
         "message": "All caches cleared completely",
-        "agents_cleared": agents_cleared,
-        "tools_cleared": tools_cleared,
+        "agents_cleared": result["agents"],
+        "tools_cleared": result["tools"],
+        "sessions_cleared": result["sessions"],
+        "responses_cleared": result["responses"],
         "available_agents_cache_cleared": True,
-        "total_cleared": agents_cleared + tools_cleared
+        "total_cleared": result["agents"] + result["tools"],
+        "published": published
     }
 
 
@@ -112,5 +122,36 @@ async def get_cache_stats():
             **tools_stats,
             "ttl_seconds": 7200
         },
+        "listener": cache_listener.stats(),
+        "session_cache": session_cache_stats(),
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "conversion_cache": conversion_cache.stats(),
+        "media_store": media_store.stats(),
         "total_cached_objects": agent_stats["total"] + tools_stats["total"]
-    } 
\ No newline at end of file
+    }
+
+
+@cache_router.get("/semantic/samples")
+async def get_semantic_cache_samples():
+    """
+    Выборка попаданий семантического кэша для ручной проверки.
+
+    Доля попаданий в выборке - semantic_cache_sample_rate. Запрос и сохраненный
+    запрос с близостью позволяют оценить, не слишком ли низкий порог.
+    """
+    return {"samples": semantic_cache.samples()}
+
+
+@cache_router.post("/semantic/false-hit")
+async def report_semantic_false_hit(request: SemanticFalseHitRequest):
+    """Отметить попадание из выборки ложным - запись удаляется из семантического кэша"""
+    try:
+        deleted = await semantic_cache.report_false_hit(request.entry_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Semantic cache is unavailable: {e}"
+        )
+    return {"entry_id": request.entry_id, "deleted": deleted}
@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from api.utils.warmup import warmup_job
 
 ######################################################
 ## Routes for the API Health
@@ -14,3 +17,17 @@ def get_health():
     return {
         "status": "success",
     }
+
+
+@health_router.get("/ready")
+def get_ready():
+    """Readiness probe: 503 пока идет прогрев кэшей агентов и инструментов"""
+
+    warmup = warmup_job.stats()
+    return JSONResponse(
+        status_code=200 if warmup["ready"] else 503,
+        content={
+            "status": "ready" if warmup["ready"] else "warming_up",
+            "warmup": warmup,
+        },
+    )
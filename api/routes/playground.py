@@ -1,20 +1,96 @@
-from agno.playground import Playground
+import asyncio
+from threading import Lock
+from typing import Callable, List
+from uuid import uuid4
 
-from agents.agno_assist import get_agno_assist
-from agents.finance_agent import get_finance_agent
-from agents.web_agent import get_web_agent
+from agno.agent import Agent
+from agno.app.playground.async_router import get_async_playground_router
+from fastapi import APIRouter, Depends
+
+from api.settings import api_settings
 
 ######################################################
 ## Routes for the Playground Interface
 ######################################################
 
-# Get Agents to serve in the playground
-web_agent = get_web_agent(debug_mode=True)
-agno_assist = get_agno_assist(debug_mode=True)
-finance_agent = get_finance_agent(debug_mode=True)
+# Роутер подключается только при playground_enabled (api/routes/v1_router.py).
+# Агенты строятся при первом запросе к playground, а не при импорте модуля:
+# статические агенты импортируют yfinance, knowledge base и OpenAI embedder.
+# Playground() не используется - его конструктор инициализирует агентов сразу.
+# Построение (импорты, подключение к БД) идет в потоке через зависимость роутера,
+# обработчики agno перебирают уже загруженный список.
+
+PLAYGROUND_APP_ID = str(uuid4())
+
+
+def _build_agents() -> List[Agent]:
+    from agents.selector import AgentType, get_agent
+
+    # Agents to serve in the playground - тот же путь, что у API (selector.get_agent)
+    debug_mode = api_settings.playground_debug_mode
+    agents = [get_agent(agent_id=agent_type.value, debug_mode=debug_mode) for agent_type in AgentType]
+    # Та же подготовка, что в Playground.__init__ (он перебирает агентов сразу)
+    for agent in agents:
+        if not agent.app_id:
+            agent.app_id = PLAYGROUND_APP_ID
+        agent.initialize_agent()
+        # Required for playground to work
+        agent.store_events = True
+    return agents
+
+
+class LazyAgentList(list):
+    """
+    Список агентов, который строится при первом обращении.
+
+    Роутер playground agno хранит переданный список и перебирает его только
+    в обработчиках запросов - построение откладывается до первого запроса.
+    """
+
+    def __init__(self, factory: Callable[[], List[Agent]]):
+        super().__init__()
+        self._factory = factory
+        self._loaded = False
+        self._lock = Lock()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                super().extend(self._factory())
+                self._loaded = True
+
+    async def aload(self) -> None:
+        """Строит агентов вне event loop (повторный вызов после загрузки ничего не делает)"""
+        if not self._loaded:
+            await asyncio.to_thread(self._load)
+
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._load()
+        return super().__getitem__(index)
+
+    def __bool__(self):
+        # Пустой до загрузки список не должен считаться "агентов нет"
+        return True
+
+
+playground_agents = LazyAgentList(_build_agents)
+
+
+async def load_playground_agents() -> None:
+    """Зависимость роутера: агенты строятся до входа в обработчик agno"""
+    await playground_agents.aload()
 
-# Create a playground instance
-playground = Playground(agents=[web_agent, agno_assist, finance_agent])
 
 # Get the router for the playground
-playground_router = playground.get_async_router()
+playground_router = APIRouter(dependencies=[Depends(load_playground_agents)])
+playground_router.include_router(get_async_playground_router(agents=playground_agents, active_app_id=PLAYGROUND_APP_ID))
@@ -0,0 +1,62 @@
+"""
+Endpoints компактизации и retention сессий: запуск прохода и отчеты об объеме.
+"""
+
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+
+from agents.storage_resolver import get_agent_storage_config
+from api.utils.retention import retention_job
+from db.retention import memory_size_report, session_size_report
+from db.session import db_engine
+
+retention_router = APIRouter(prefix="/retention", tags=["Retention"])
+
+
+@retention_router.post("/run")
+async def run_retention(agent_id: Optional[str] = Query(None, description="Только один агент")):
+    """Внеочередной проход компактизации (обрезка runs и архивирование старых сессий)"""
+    try:
+        results = await retention_job.run(agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return {"results": results}
+
+
+@retention_router.get("/report/{agent_id}")
+async def get_retention_report(
+    agent_id: str,
+    by_user: bool = Query(False, description="Добавить пользователей с наибольшим объемом"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Объем сессий агента (и архива), при by_user - по пользователям вместе с их памятью"""
+    try:
+        config = get_agent_storage_config(agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    storage_table = config.storage_table
+    if storage_table is None:
+        raise HTTPException(status_code=404, detail="Agent does not have storage enabled.")
+
+    def _report():
+        report = session_size_report(db_engine, storage_table, config.storage_agent_id, by_user=by_user, limit=limit)
+        users = report.get("users")
+        if users and config.memory_table:
+            memories = memory_size_report(db_engine, config.memory_table, [user["user_id"] for user in users])
+            for user in users:
+                user.update(memories.get(user["user_id"], {"memories": 0, "memory_bytes": 0}))
+        return report
+
+    try:
+        return await asyncio.to_thread(_report)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building report: {str(e)}")
+
+
+@retention_router.get("/stats")
+async def get_retention_stats():
+    """Состояние фоновой задачи и результат последнего прохода"""
+    return retention_job.stats()
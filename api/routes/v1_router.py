@@ -2,9 +2,10 @@ from fastapi import APIRouter
 
 from api.routes.agents import agents_router
 from api.routes.health import health_router
-from api.routes.playground import playground_router
 from api.routes.tools import tools_router
 from api.routes.cache import cache_router
+from api.routes.retention import retention_router
+from api.settings import api_settings
 
 v1_router = APIRouter(prefix="/v1")
 
@@ -12,4 +13,10 @@ v1_router.include_router(health_router)
 v1_router.include_router(agents_router)
 v1_router.include_router(tools_router)
 v1_router.include_router(cache_router)
-v1_router.include_router(playground_router)
+v1_router.include_router(retention_router)
+
+# Playground только для разработки - включается playground_enabled
+if api_settings.playground_enabled:
+    from api.routes.playground import playground_router
+
+    v1_router.include_router(playground_router)
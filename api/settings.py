@@ -14,6 +14,149 @@ class ApiSettings(BaseSettings):
     # Set to False to disable docs at /docs and /redoc
     docs_enabled: bool = True
 
+    # Agno Playground (/v1/playground) - для разработки, в продакшене выключен
+    playground_enabled: bool = False
+    # debug_mode агентов playground
+    playground_debug_mode: bool = True
+
+    # Batch runs (POST /v1/agents/{agent_id}/runs/batch)
+    # Максимальное количество сообщений в одном batch запросе
+    batch_run_max_items: int = 1000
+    # Верхняя граница параллельных запусков агента внутри одного batch
+    batch_run_max_concurrency: int = 16
+
+    # Admission control для запусков агентов (0 = без ограничения)
+    # Лимиты одновременных agent.arun на воркер по agent_id / company_id / user_id
+    run_concurrency_per_agent: int = 0
+    run_concurrency_per_company: int = 0
+    run_concurrency_per_user: int = 0
+    # Максимум запусков в очереди одного ключа, сверх - сразу 429
+    run_max_queue_size: int = 100
+    # Максимальное ожидание слота в очереди, после - 503
+    run_max_queue_wait_seconds: float = 30.0
+    # Значение заголовка Retry-After для 429/503
+    run_retry_after_seconds: int = 5
+
+    # Загрузка файлов (api/utils/file_processing.py)
+    # Лимиты размера по типу файла, сверх лимита - 413 до любой обработки
+    upload_max_image_bytes: int = 20 * 1024 * 1024
+    upload_max_audio_bytes: int = 25 * 1024 * 1024
+    upload_max_video_bytes: int = 200 * 1024 * 1024
+    upload_max_document_bytes: int = 50 * 1024 * 1024
+    # Медиа и документы больше этого размера передаются в agno по пути к файлу, а не bytes
+    upload_inline_max_bytes: int = 4 * 1024 * 1024
+    # Каталог для временных файлов загрузок (None - системный temp)
+    upload_spool_dir: Optional[str] = None
+
+    # Пул процессов конвертации документов (CSV/Excel/Word/PowerPoint)
+    conversion_pool_workers: int = 2
+    # Таймаут конвертации одного файла; зависший процесс убивается
+    conversion_timeout_seconds: float = 60.0
+    # Лимит памяти процесса конвертации (0 - без лимита)
+    conversion_memory_limit_mb: int = 1024
+
+    # Content-addressed кэш конвертированных документов (SHA-256 содержимого)
+    conversion_cache_enabled: bool = True
+    # Каталог кэша (None - <tmp>/crafty_conversion_cache), может быть общим для воркеров
+    conversion_cache_dir: Optional[str] = None
+    # Максимальный объем кэша на диске, LRU вытеснение
+    conversion_cache_max_mb: int = 512
+
+    # Бюджет токенов текста одной CSV/Excel таблицы; большие таблицы передаются сводкой
+    tabular_token_budget: int = 4000
+    # Таблицы до этого числа строк выводятся целиком, если помещаются в бюджет
+    tabular_inline_max_rows: int = 500
+    # Хранилище больших таблиц для TabularQueryTools (None - <tmp>/crafty_table_store)
+    table_store_dir: Optional[str] = None
+    # Максимальный объем хранилища таблиц, старые таблицы удаляются первыми
+    table_store_max_mb: int = 2048
+
+    # Извлекать текст всех PDF вместо нативной передачи в agno
+    # (с диапазоном страниц pdf_pages текст извлекается всегда)
+    pdf_extract_text: bool = False
+    # Бюджет токенов текста одного PDF; извлечение останавливается на бюджете
+    pdf_token_budget: int = 20000
+
+    # Предобработка изображений: уменьшение до рабочего разрешения модели и перекодирование
+    image_preprocess_enabled: bool = True
+    # Длинная/короткая сторона после уменьшения (0 - без ограничения)
+    image_max_long_side: int = 2048
+    image_max_short_side: int = 768
+    image_jpeg_quality: int = 85
+
+    # Content-addressed хранилище медиа: в run/сессии передается путь вместо байтов
+    media_store_enabled: bool = True
+    # Каталог хранилища (None - <tmp>/crafty_media_store); в продакшене - общий volume.
+    # Без него агенты со storage получают загрузки байтами: временный каталог не
+    # переживает рестарт, а пути из него остались бы в истории сессий
+    media_store_dir: Optional[str] = None
+    # Максимальный объем хранилища, давно не использованные файлы удаляются
+    media_store_max_mb: int = 10240
+
+    # Кэш ответов детерминированных агентов (включается секцией response_cache агента)
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 1000
+    response_cache_max_mb: int = 128
+    # TTL записи, если в секции response_cache агента не указан ttl_seconds
+    response_cache_ttl_seconds: int = 3600
+
+    # Семантический кэш ответов в pgvector (включается секцией response_cache.semantic агента)
+    semantic_cache_enabled: bool = True
+    # Модель эмбеддингов запросов (размерность - как в таблице response_semantic_cache)
+    semantic_cache_embedder_model: str = "text-embedding-3-small"
+    # Минимальная косинусная близость запроса к сохраненному, если порог не задан в агенте
+    semantic_cache_threshold: float = 0.92
+    # Максимум записей в области поиска (агент, версия, модель, stream) - старые удаляются при записи
+    semantic_cache_max_scope_entries: int = 2000
+    # Доля попаданий, сохраняемых для ручной проверки ложных попаданий (/v1/cache/semantic/samples)
+    semantic_cache_sample_rate: float = 0.05
+    semantic_cache_max_samples: int = 100
+
+    # Кэш эмбеддингов knowledge и семантического кэша в памяти процесса (agents/embedding_cache.py)
+    embedding_cache_enabled: bool = True
+    # Максимальный объем кэша эмбеддингов процесса
+    embedding_cache_max_mb: int = 256
+
+    # Размер страницы списка сессий (GET /agents/{agent_id}/sessions)
+    sessions_page_size: int = 100
+    sessions_page_max_size: int = 1000
+    # Размер пачки строк при экспорте/импорте сессий (NDJSON)
+    sessions_transfer_batch_size: int = 500
+
+    # Кэш активных сессий в памяти процесса (agents/session_storage.py)
+    session_cache_enabled: bool = True
+    # Максимум сессий в кэше процесса (LRU)
+    session_cache_max_entries: int = 1000
+    # Максимальный объем кэша сессий процесса (по длине JSON строк сессий)
+    session_cache_max_mb: int = 256
+    # Сколько секунд после проверки версии сессия отдается без запроса к БД (0 - проверять всегда)
+    session_cache_trust_seconds: float = 0
+
+    # Компактизация и retention сессий (фоновая задача, переопределяется секцией retention агента)
+    retention_enabled: bool = False
+    retention_interval_seconds: int = 3600
+    # Сколько последних runs хранить в сессии
+    retention_keep_runs: int = 50
+    # Сколько runs хранить, если у сессии есть summary (enable_session_summaries)
+    retention_summary_keep_runs: int = 10
+    # Через сколько дней без обновлений сессия переносится в архивную таблицу (0 - не переносить)
+    retention_archive_after_days: int = 90
+    retention_batch_size: int = 200
+
+    # Прогрев кэшей агентов и инструментов при старте воркера (/v1/ready - после прогрева)
+    warmup_enabled: bool = True
+    # Явный список agent_id (через запятую); пусто - по активности сессий за warmup_usage_window_hours
+    warmup_agent_ids: Optional[str] = None
+    warmup_usage_window_hours: int = 24
+    # Сколько самых активных пар (agent_id, user_id) и самых используемых инструментов прогревать
+    warmup_max_agents: int = 20
+    warmup_max_tools: int = 50
+    # Модель, с которой строятся агенты (как значение по умолчанию в /runs)
+    warmup_model_id: str = "gpt-4.1-mini-2025-04-14"
+    warmup_concurrency: int = 4
+    # После таймаута /v1/ready отвечает ready, прогрев продолжается в фоне
+    warmup_timeout_seconds: float = 120.0
+
     # Cors origin list to allow requests from.
     # This list is set using the set_cors_origin_list validator
     # which uses the runtime_env variable to set the
@@ -0,0 +1,228 @@
+"""
+Admission control для запусков агентов.
+Ограничивает число одновременных agent.arun на воркере по agent_id, company_id и user_id.
+
+Каждый ключ (scope, value) имеет свой лимит и FIFO очередь ожидания:
+- очередь ключа переполнена → сразу 429 (Retry-After)
+- ожидание слота дольше max_queue_wait → 503 (Retry-After)
+
+Лимиты работают в пределах одного процесса (одного event loop воркера).
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from agno.utils.log import logger
+
+from api.settings import api_settings
+
+
+class AdmissionRejected(Exception):
+    """Запуск отклонен admission control (перегрузка)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _KeyLimiter:
+    """Лимит параллельности для одного ключа с честной FIFO очередью"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self.waiters
+
+    async def acquire(self, timeout: float, max_queue_size: int) -> bool:
+        """
+        Занимает слот. Возвращает False если очередь переполнена.
+        Бросает asyncio.TimeoutError если слот не освободился за timeout.
+        """
+        # Свободный слот и никто не ждет - проходим сразу (без обгона очереди)
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return True
+
+        if len(self.waiters) >= max_queue_size:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if future.done() and not future.cancelled():
+                # Слот был передан нам одновременно с таймаутом - возвращаем его
+                self.release()
+            else:
+                try:
+                    self.waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+        return True
+
+    def release(self) -> None:
+        """Освобождает слот и передает его первому в очереди"""
+        self.active -= 1
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+                break
+
+
+class AdmissionTicket:
+    """Занятые слоты одного запуска. release() можно вызывать несколько раз."""
+
+    def __init__(self, controller: "RunAdmissionController", keys: List[Tuple[str, str]]):
+        self._controller = controller
+        self._keys = keys
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._finish(self._keys)
+
+
+class RunAdmissionController:
+    """
+    Ограничение параллельных запусков агентов по agent_id / company_id / user_id.
+    Лимит 0 означает отсутствие ограничения для scope.
+    """
+
+    # Порядок захвата слотов фиксирован - исключает взаимные блокировки
+    SCOPES = ("agent", "company", "user")
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        max_queue_size: int = 100,
+        max_queue_wait_seconds: float = 30.0,
+        retry_after_seconds: int = 5,
+    ):
+        self._limits = limits
+        self._max_queue_size = max_queue_size
+        self._max_queue_wait = max_queue_wait_seconds
+        self._retry_after = retry_after_seconds
+        self._limiters: Dict[Tuple[str, str], _KeyLimiter] = {}
+        self._admitted = 0
+        self._active_runs = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+
+    async def acquire(
+        self,
+        agent_id: str,
+        user_id: Optional[str] = None,
+        company_id: Optional[str] = None,
+    ) -> AdmissionTicket:
+        """Занимает слоты для запуска или бросает AdmissionRejected"""
+        values = {"agent": agent_id, "company": company_id, "user": user_id}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_queue_wait
+        acquired: List[Tuple[str, str]] = []
+
+        try:
+            for scope in self.SCOPES:
+                value = values[scope]
+                limit = self._limits.get(scope, 0)
+                if not value or limit <= 0:
+                    continue
+
+                key = (scope, value)
+                limiter = self._limiters.get(key)
+                if limiter is None:
+                    limiter = self._limiters[key] = _KeyLimiter(limit)
+
+                timeout = max(deadline - loop.time(), 0)
+                try:
+                    admitted = await limiter.acquire(timeout, self._max_queue_size)
+                except asyncio.TimeoutError:
+                    self._rejected_timeout += 1
+                    logger.warning(f"Run admission timeout for {scope}={value}")
+                    raise AdmissionRejected(
+                        status_code=503,
+                        detail=f"Run queue wait exceeded for {scope} {value}",
+                        retry_after=self._retry_after,
+                    )
+                if not admitted:
+                    self._drop_if_idle(key)
+                    self._rejected_queue_full += 1
+                    logger.warning(f"Run admission queue full for {scope}={value}")
+                    raise AdmissionRejected(
+                        status_code=429,
+                        detail=f"Too many concurrent runs for {scope} {value}",
+                        retry_after=self._retry_after,
+                    )
+                acquired.append(key)
+        except BaseException:
+            self._release_keys(acquired)
+            raise
+
+        self._admitted += 1
+        self._active_runs += 1
+        return AdmissionTicket(self, acquired)
+
+    def _finish(self, keys: List[Tuple[str, str]]) -> None:
+        self._active_runs -= 1
+        self._release_keys(keys)
+
+    def _release_keys(self, keys: List[Tuple[str, str]]) -> None:
+        for key in keys:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                continue
+            limiter.release()
+            self._drop_if_idle(key)
+
+    def _drop_if_idle(self, key: Tuple[str, str]) -> None:
+        """Удаляет лимитер без активных запусков, чтобы словарь не рос бесконечно"""
+        limiter = self._limiters.get(key)
+        if limiter is not None and limiter.idle:
+            del self._limiters[key]
+
+    def stats(self) -> Dict:
+        """Метрики активных запусков и глубины очередей"""
+        per_scope: Dict[str, Dict[str, Dict[str, int]]] = {scope: {} for scope in self.SCOPES}
+        for (scope, value), limiter in self._limiters.items():
+            per_scope[scope][value] = {
+                "active": limiter.active,
+                "queued": len(limiter.waiters),
+                "limit": limiter.limit,
+            }
+
+        return {
+            "limits": dict(self._limits),
+            "max_queue_size": self._max_queue_size,
+            "max_queue_wait_seconds": self._max_queue_wait,
+            "active_runs": self._active_runs,
+            "total_queued": sum(len(limiter.waiters) for limiter in self._limiters.values()),
+            "admitted": self._admitted,
+            "rejected_queue_full": self._rejected_queue_full,
+            "rejected_timeout": self._rejected_timeout,
+            "keys": per_scope,
+        }
+
+
+# Глобальный контроллер запусков воркера
+run_admission = RunAdmissionController(
+    limits={
+        "agent": api_settings.run_concurrency_per_agent,
+        "company": api_settings.run_concurrency_per_company,
+        "user": api_settings.run_concurrency_per_user,
+    },
+    max_queue_size=api_settings.run_max_queue_size,
+    max_queue_wait_seconds=api_settings.run_max_queue_wait_seconds,
+    retry_after_seconds=api_settings.run_retry_after_seconds,
+)
@@ -0,0 +1,208 @@
+"""
+Content-addressed кэш конвертированных документов (и обработанных изображений).
+
+Ключ - SHA-256 байтов файла + тип конвертера + CONVERTER_VERSION, поэтому
+повторная загрузка того же файла (в любой сессии, под любым именем) не
+парсится заново. Записи хранятся на локальном диске, общий объем каталога
+ограничен conversion_cache_max_mb.
+
+Каталог может быть общим для нескольких воркеров и процессов пула конвертации:
+запись атомарная (tmp + os.replace), чтение обновляет mtime записи, вытеснение
+сканирует каталог и удаляет записи с самым старым mtime (как MediaStore).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from logging import getLogger
+from threading import Lock
+from typing import Dict, Optional
+
+from api.settings import api_settings
+from api.utils.document_converters import CONVERTER_VERSION
+
+logger = getLogger(__name__)
+
+# Текстовые записи (JSON) и бинарные (изображения)
+ENTRY_EXTENSIONS = (".json", ".bin")
+
+
+def conversion_cache_key(content_hash: str, kind: str, variant: str = "") -> str:
+    """Ключ записи: хэш содержимого + конвертер + версия конвертеров + параметры вывода (variant)"""
+    return hashlib.sha256(f"{content_hash}:{kind}:{CONVERTER_VERSION}:{variant}".encode()).hexdigest()
+
+
+class ConversionCache:
+    """Ограниченный дисковый кэш текста документов с LRU вытеснением по mtime"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._enabled = enabled and max_bytes > 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        # Первая запись процесса сразу сверяет объем каталога
+        self._bytes_since_prune = max_bytes
+        # Состояние каталога на момент последнего сканирования
+        self._entries = 0
+        self._total_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def _path(self, key: str, extension: str = ".json") -> str:
+        return os.path.join(self._dir, key[:2], f"{key}{extension}")
+
+    def _prune(self) -> None:
+        """
+        Удаляет давно не использованные записи сверх лимита объема.
+
+        Каталог общий для воркеров и процессов пула конвертации - объем
+        считается сканированием каталога, а не по записям текущего процесса.
+        """
+        entries = []
+        for root, _, names in os.walk(self._dir):
+            for name in names:
+                if os.path.splitext(name)[1] not in ENTRY_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                # Уже удалена другим процессом
+                pass
+        with self._lock:
+            self._evictions += removed
+            self._entries = len(entries) - removed
+            self._total_bytes = total
+        if removed:
+            logger.info(f"Conversion cache evicted {removed} entries, {total} bytes left")
+
+    def _read(self, key: str, extension: str) -> Optional[bytes]:
+        """Читает запись; mtime обновляется - запись используется и вытесняется последней"""
+        path = self._path(key, extension)
+        try:
+            with open(path, "rb") as cached:
+                data = cached.read()
+            os.utime(path)
+        except OSError:
+            # Нет записи (или вытеснена другим процессом)
+            with self._lock:
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return data
+
+    def _write(self, key: str, extension: str, data: bytes) -> None:
+        """Атомарно записывает запись; каждые ~10% лимита записанных байт - вытеснение"""
+        if len(data) > self._max_bytes:
+            return
+
+        path = self._path(key, extension)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to store conversion cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._stores += 1
+            self._bytes_since_prune += len(data)
+            need_prune = self._bytes_since_prune > self._max_bytes // 10
+            if need_prune:
+                self._bytes_since_prune = 0
+        if need_prune:
+            self._prune()
+
+    def get(self, key: str, filename: str) -> Optional[str]:
+        """
+        Текст документа из кэша или None.
+        Имя файла в заголовке текста подменяется на имя текущей загрузки.
+        """
+        if not self._enabled:
+            return None
+
+        data = self._read(key, ".json")
+        if data is None:
+            return None
+
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            return None
+
+        text = entry.get("text", "")
+        cached_filename = entry.get("filename")
+        if cached_filename and filename and cached_filename != filename:
+            header, separator, body = text.partition("\n")
+            text = header.replace(cached_filename, filename, 1) + separator + body
+        return text
+
+    def put(self, key: str, filename: str, text: str) -> None:
+        """Сохраняет текст документа и вытесняет давно не используемые записи"""
+        if not self._enabled:
+            return
+
+        data = json.dumps({"filename": filename, "text": text}, ensure_ascii=False).encode("utf-8")
+        self._write(key, ".json", data)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Бинарная запись (обработанное изображение) или None"""
+        if not self._enabled:
+            return None
+        return self._read(key, ".bin")
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        """Сохраняет бинарную запись"""
+        if not self._enabled:
+            return
+        self._write(key, ".bin", data)
+
+    def stats(self) -> Dict:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self._enabled,
+            "directory": self._dir,
+            # Объем каталога на момент последнего вытеснения
+            "entries": self._entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "stores": self._stores,
+            "evictions": self._evictions,
+            "converter_version": CONVERTER_VERSION,
+        }
+
+
+# Глобальный кэш конвертаций воркера
+conversion_cache = ConversionCache(
+    cache_dir=api_settings.conversion_cache_dir or os.path.join(tempfile.gettempdir(), "crafty_conversion_cache"),
+    max_bytes=api_settings.conversion_cache_max_mb * 1024 * 1024,
+    enabled=api_settings.conversion_cache_enabled,
+)
@@ -0,0 +1,197 @@
+"""
+Пул процессов для конвертации документов.
+
+pypdf/openpyxl/python-docx/python-pptx - CPU-тяжелые парсеры на чистом Python.
+В async обработчике они блокируют event loop воркера, поэтому конвертация
+выполняется в отдельных процессах:
+- ограниченное число процессов (conversion_pool_workers), процессы переиспользуются
+- таймаут на файл отсчитывается с момента, когда процесс взял файл (ожидание
+  свободного процесса в таймаут не входит); зависший процесс убивается один,
+  конвертации в остальных процессах не затрагиваются
+- лимит памяти процесса (RLIMIT_AS), MemoryError → fallback текст
+"""
+
+import asyncio
+import multiprocessing
+from logging import getLogger
+from multiprocessing.connection import Connection
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api.settings import api_settings
+from api.utils.document_converters import conversion_fallback_text, convert_path, limit_worker_memory
+
+logger = getLogger(__name__)
+
+
+def _worker_main(conn: Connection, memory_limit_bytes: int) -> None:
+    """Цикл процесса конвертации: задание из канала → (статус, результат) в канал"""
+    limit_worker_memory(memory_limit_bytes)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            conn.send(("ok", convert_path(*job)))
+        except MemoryError:
+            conn.send(("memory", None))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class ConversionTimeout(Exception):
+    """Процесс не вернул результат за таймаут"""
+
+
+class _Worker:
+    """Процесс конвертации с собственным каналом - убивается независимо от остальных"""
+
+    def __init__(self, memory_limit_bytes: int):
+        # spawn - процесс не наследует event loop и потоки API процесса
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit_bytes), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, job: Tuple[Any, ...], timeout: float) -> Tuple[str, Any]:
+        """Блокирующий запуск задания (вызывается в потоке); EOFError/OSError - процесс упал"""
+        self._conn.send(job)
+        if not self._conn.poll(timeout):
+            raise ConversionTimeout()
+        return self._conn.recv()
+
+    def stop(self) -> None:
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._conn.close()
+
+    def kill(self) -> None:
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        self._conn.close()
+
+
+class ConversionPool:
+    """Ленивый пул процессов конвертации с таймаутом на файл"""
+
+    def __init__(self, max_workers: int, timeout_seconds: float, memory_limit_mb: int):
+        self._max_workers = max(max_workers, 1)
+        self._timeout = timeout_seconds
+        self._memory_limit_bytes = memory_limit_mb * 1024 * 1024
+        # Файлы сверх числа процессов ждут свободный процесс, таймаут при этом не идет
+        self._slots = asyncio.Semaphore(self._max_workers)
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+        self._lock = Lock()
+        self._completed = 0
+        self._timeouts = 0
+        self._failures = 0
+        self._killed = 0
+
+    def _acquire(self) -> _Worker:
+        """Свободный процесс или новый (запуск процесса - в потоке)"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                self._workers.discard(worker)
+        worker = _Worker(self._memory_limit_bytes)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _release(self, worker: _Worker) -> None:
+        with self._lock:
+            self._idle.append(worker)
+
+    def _kill(self, worker: _Worker) -> None:
+        """Убивает только процесс этого файла; следующий файл запустит новый"""
+        with self._lock:
+            self._workers.discard(worker)
+            self._killed += 1
+        worker.kill()
+
+    async def convert(
+        self, kind: str, path: str, filename: str, options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, bool]:
+        """
+        Конвертирует файл в процессе пула.
+
+        Returns:
+            (текст документа, True) или (fallback текст, False) при ошибке
+            парсера/таймауте/нехватке памяти/падении процесса
+        """
+        async with self._slots:
+            try:
+                worker = await asyncio.to_thread(self._acquire)
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"Could not start conversion process for {filename}: {e}")
+                return conversion_fallback_text(kind, filename, str(e)), False
+
+            try:
+                status, payload = await asyncio.to_thread(worker.run, (kind, path, filename, options), self._timeout)
+            except ConversionTimeout:
+                self._timeouts += 1
+                logger.error(f"Conversion of {filename} timed out after {self._timeout}s")
+                self._kill(worker)
+                return conversion_fallback_text(kind, filename, f"timed out after {self._timeout:.0f}s"), False
+            except (EOFError, OSError) as e:
+                self._failures += 1
+                logger.error(f"Conversion process crashed while converting {filename}: {e!r}")
+                self._kill(worker)
+                return conversion_fallback_text(kind, filename, "converter process crashed"), False
+            except BaseException:
+                # Запрос отменен - процесс мог не дочитать результат, канал больше не используется
+                self._kill(worker)
+                raise
+
+        if status == "ok":
+            self._release(worker)
+            self._completed += 1
+            return payload
+        self._failures += 1
+        if status == "memory":
+            # После MemoryError процесс не переиспользуется
+            self._kill(worker)
+            logger.error(f"Conversion of {filename} exceeded memory limit")
+            return conversion_fallback_text(kind, filename, "memory limit exceeded"), False
+        self._release(worker)
+        logger.error(f"Error converting {filename} in pool: {payload}")
+        return conversion_fallback_text(kind, filename, payload), False
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._workers, self._idle = self._workers, set(), []
+        for worker in workers:
+            worker.stop()
+            worker.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self._max_workers,
+            "processes": len(self._workers),
+            "idle": len(self._idle),
+            "completed": self._completed,
+            "timeouts": self._timeouts,
+            "failures": self._failures,
+            "killed": self._killed,
+        }
+
+
+# Глобальный пул конвертации воркера
+conversion_pool = ConversionPool(
+    max_workers=api_settings.conversion_pool_workers,
+    timeout_seconds=api_settings.conversion_timeout_seconds,
+    memory_limit_mb=api_settings.conversion_memory_limit_mb,
+)
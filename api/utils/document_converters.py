@@ -0,0 +1,385 @@
+"""
+Конвертеры документов (CSV, Excel, Word, PowerPoint, PDF) в текст для LLM.
+
+Функции принимают путь к файлу или бинарный файловый объект и не зависят от
+FastAPI/agno - модуль импортируется в процессах пула конвертации
+(api/utils/conversion_pool.py), поэтому тяжелые парсеры импортируются внутри функций.
+"""
+
+import re
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from api.utils.tabular import CHARS_PER_TOKEN
+
+# Путь к файлу на диске или бинарный файловый объект
+DocumentSource = Union[str, BinaryIO]
+
+# Версия формата текста конвертеров - входит в ключ кэша конвертаций.
+# Увеличивать при любом изменении вывода конвертеров.
+CONVERTER_VERSION = "3"
+
+# Бюджет токенов и порог полного вывода таблиц по умолчанию (см. api/utils/tabular.py)
+DEFAULT_TABLE_TOKEN_BUDGET = 4000
+DEFAULT_TABLE_INLINE_MAX_ROWS = 500
+# Бюджет токенов текста PDF по умолчанию
+DEFAULT_PDF_TOKEN_BUDGET = 20000
+
+
+# Строка-ссылка на полные данные в сводке таблицы (см. _table_note)
+TABLE_NOTE_PATTERN = re.compile(r"^Table ID: \S+ \(only a summary is shown - [^\n]*\)\n", re.MULTILINE)
+TABLE_ID_PATTERN = re.compile(r"^Table ID: \S+ (?=\(only a summary is shown - )", re.MULTILINE)
+
+
+def replace_table_id(text: str, table_id: str) -> str:
+    """Подставляет table_id текущей загрузки в сводку из кэша конвертаций (кэш общий для владельцев)"""
+    return TABLE_ID_PATTERN.sub(f"Table ID: {table_id} ", text)
+
+
+def _table_note(table_id: Optional[str], target: str = "table_id") -> str:
+    if not table_id:
+        return ""
+    return (
+        f"Table ID: {table_id} (only a summary is shown - query the full data "
+        f"with the tabular query tools using this {target})"
+    )
+
+
+def strip_table_notes(text: str) -> str:
+    """
+    Убирает из сводок таблиц ссылки на полные данные.
+
+    Текст конвертера (и кэш конвертаций) всегда содержит ссылку - убирается
+    при обработке файлов запуска, если у агента нет TabularQueryTools.
+    """
+    return TABLE_NOTE_PATTERN.sub("", text)
+
+
+def _store_large_table(source: DocumentSource, table_id: Optional[str], extension: str, summarized: bool) -> None:
+    """Сохраняет файл большой таблицы для запросов через TabularQueryTools"""
+    if summarized and table_id and isinstance(source, str):
+        from agents.table_store import store_table
+
+        store_table(source, table_id, extension)
+
+
+def convert_csv(
+    source: DocumentSource,
+    filename: str,
+    token_budget: int = DEFAULT_TABLE_TOKEN_BUDGET,
+    inline_max_rows: int = DEFAULT_TABLE_INLINE_MAX_ROWS,
+    table_id: Optional[str] = None,
+) -> str:
+    """
+    Конвертирует CSV файл в структурированный текст в пределах бюджета токенов.
+    Маленькая таблица выводится целиком, большая - сводкой (профиль колонок + выборка строк).
+    """
+    from api.utils.tabular import summarize_csv
+
+    text, summarized = summarize_csv(
+        source, f"CSV Table: {filename}", token_budget, inline_max_rows, _table_note(table_id)
+    )
+    _store_large_table(source, table_id, ".csv", summarized)
+    return text
+
+
+def convert_excel(
+    source: DocumentSource,
+    filename: str,
+    token_budget: int = DEFAULT_TABLE_TOKEN_BUDGET,
+    inline_max_rows: int = DEFAULT_TABLE_INLINE_MAX_ROWS,
+    table_id: Optional[str] = None,
+) -> str:
+    """Конвертирует Excel файл (все листы) в текст, бюджет токенов делится между листами"""
+    import pandas as pd
+
+    from api.utils.tabular import summarize_frame
+
+    excel_data = pd.read_excel(source, sheet_name=None)
+    sheet_budget = max(token_budget // max(len(excel_data), 1), 1)
+
+    parts = [f"Excel File: {filename}\n", f"Sheets: {len(excel_data)}\n"]
+    note = _table_note(table_id, "table_id and the sheet name")
+    any_summarized = False
+    if note:
+        parts.append(f"{note}\n")
+    parts.append("\n")
+
+    for sheet_name, df in excel_data.items():
+        text, summarized = summarize_frame(df, f"=== Sheet: {sheet_name} ===", sheet_budget, inline_max_rows)
+        any_summarized = any_summarized or summarized
+        parts.append(f"{text}\n\n")
+
+    extension = ".xls" if filename and filename.lower().endswith(".xls") else ".xlsx"
+    _store_large_table(source, table_id, extension, any_summarized)
+    if not any_summarized and note:
+        # Все листы выведены целиком - таблица не сохранялась, ссылка на нее не нужна
+        parts.pop(2)
+    return "".join(parts)
+
+
+def convert_docx(source: DocumentSource, filename: str, **_options: Any) -> str:
+    """Конвертирует Word документ в текст (параграфы + таблицы)"""
+    from docx import Document
+
+    doc = Document(source)
+
+    parts = [f"Word Document: {filename}\n\n"]
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            parts.append(f"{paragraph.text}\n")
+
+    # Добавляем таблицы если есть
+    if doc.tables:
+        parts.append("\n=== Tables ===\n")
+        for i, table in enumerate(doc.tables):
+            parts.append(f"\nTable {i + 1}:\n")
+            for row in table.rows:
+                row_text = " | ".join([cell.text.strip() for cell in row.cells])
+                parts.append(f"{row_text}\n")
+
+    return "".join(parts)
+
+
+def convert_pptx(source: DocumentSource, filename: str, **_options: Any) -> str:
+    """Конвертирует PowerPoint презентацию в текст по слайдам"""
+    from pptx import Presentation
+
+    prs = Presentation(source)
+
+    parts = [f"PowerPoint Presentation: {filename}\n", f"Slides: {len(prs.slides)}\n\n"]
+    for i, slide in enumerate(prs.slides):
+        parts.append(f"=== Slide {i + 1} ===\n")
+        for shape in slide.shapes:
+            if hasattr(shape, "text") and shape.text.strip():
+                parts.append(f"{shape.text}\n")
+        parts.append("\n")
+
+    return "".join(parts)
+
+
+def parse_page_ranges(spec: Optional[str]) -> Optional[List[Tuple[int, Optional[int]]]]:
+    """
+    Разбирает диапазон страниц вида "1-5,8,10-" (нумерация с 1, границы включительно).
+
+    Returns:
+        Список (start, end) где end=None - до конца документа, или None если spec пустой
+
+    Raises:
+        ValueError: некорректный диапазон
+    """
+    if not spec or not spec.strip():
+        return None
+
+    ranges: List[Tuple[int, Optional[int]]] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, dash, end_text = part.partition("-")
+        try:
+            start = int(start_text) if start_text.strip() else 1
+            end = (int(end_text) if end_text.strip() else None) if dash else start
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}")
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Invalid page range: {part}")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError(f"Invalid page range: {spec}")
+    return ranges
+
+
+def _select_pages(ranges: Optional[List[Tuple[int, Optional[int]]]], page_count: int) -> List[int]:
+    """Номера страниц (с 0) в порядке диапазонов, без повторов и выхода за документ"""
+    if ranges is None:
+        return list(range(page_count))
+
+    selected: List[int] = []
+    seen = set()
+    for start, end in ranges:
+        for number in range(start, min(end or page_count, page_count) + 1):
+            if number - 1 not in seen:
+                seen.add(number - 1)
+                selected.append(number - 1)
+    return selected
+
+
+def _format_page_numbers(indexes: List[int]) -> str:
+    """[0, 1, 2, 5] → "1-3, 6" """
+    groups: List[str] = []
+    position = 0
+    while position < len(indexes):
+        start = end = indexes[position]
+        while position + 1 < len(indexes) and indexes[position + 1] == end + 1:
+            position += 1
+            end = indexes[position]
+        groups.append(f"{start + 1}" if start == end else f"{start + 1}-{end + 1}")
+        position += 1
+    return ", ".join(groups)
+
+
+class _PdfPages:
+    """
+    Ленивый доступ к страницам PDF с кэшем текста по страницам.
+    PdfReader открывается только если нужной страницы нет в кэше.
+    """
+
+    def __init__(self, source: DocumentSource, content_hash: Optional[str]):
+        self._source = source
+        self._reader: Any = None
+        self._cache: Any = None
+        self._content_hash = content_hash or ""
+        if content_hash:
+            from api.utils.conversion_cache import conversion_cache
+
+            if conversion_cache.enabled:
+                self._cache = conversion_cache
+
+    def _key(self, part: str) -> str:
+        from api.utils.conversion_cache import conversion_cache_key
+
+        return conversion_cache_key(self._content_hash, "pdf-page", part)
+
+    def _get_reader(self):
+        if self._reader is None:
+            from pypdf import PdfReader
+
+            # PdfReader читает страницы из файла по мере обращения
+            self._reader = PdfReader(self._source)
+        return self._reader
+
+    @property
+    def page_count(self) -> int:
+        if self._cache is not None:
+            cached = self._cache.get(self._key("count"), "")
+            if cached is not None:
+                return int(cached)
+
+        count = len(self._get_reader().pages)
+        if self._cache is not None:
+            self._cache.put(self._key("count"), "", str(count))
+        return count
+
+    def iter_pages(self, indexes: List[int]) -> Iterator[Tuple[int, str]]:
+        """Генератор (index, text): страницы извлекаются только при обращении"""
+        for index in indexes:
+            if self._cache is not None:
+                cached = self._cache.get(self._key(str(index)), "")
+                if cached is not None:
+                    yield index, cached
+                    continue
+
+            try:
+                text = self._get_reader().pages[index].extract_text() or ""
+            except Exception as e:
+                # Ошибку страницы не кэшируем
+                yield index, f"(Page extraction failed: {str(e)})"
+                continue
+
+            if self._cache is not None:
+                self._cache.put(self._key(str(index)), "", text)
+            yield index, text
+
+
+def convert_pdf(
+    source: DocumentSource,
+    filename: str,
+    token_budget: int = DEFAULT_PDF_TOKEN_BUDGET,
+    pages: Optional[List[Tuple[int, Optional[int]]]] = None,
+    content_hash: Optional[str] = None,
+    **_options: Any,
+) -> str:
+    """
+    Конвертирует PDF файл в текст по страницам.
+
+    Страницы извлекаются лениво и только пока не исчерпан бюджет токенов;
+    оставшиеся страницы перечисляются в конце, чтобы их можно было запросить
+    диапазоном (pdf_pages). С content_hash текст страниц кэшируется.
+    """
+    pdf = _PdfPages(source, content_hash)
+    page_count = pdf.page_count
+    indexes = _select_pages(pages, page_count)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+
+    parts = [f"PDF Document: {filename}\n", f"Pages: {page_count}\n"]
+    if pages is not None:
+        parts.append(f"Selected pages: {_format_page_numbers(indexes) or 'none'}\n")
+    parts.append("\n")
+    used = sum(len(part) for part in parts)
+
+    included: List[int] = []
+    for index, text in pdf.iter_pages(indexes):
+        page_text = f"=== Page {index + 1} ===\n{text}\n\n"
+        if used + len(page_text) > budget_chars:
+            remaining = budget_chars - used
+            if remaining > 200:
+                # Часть страницы, которая помещается в бюджет
+                parts.append(page_text[:remaining] + "\n[Page truncated]\n\n")
+                included.append(index)
+            break
+        parts.append(page_text)
+        used += len(page_text)
+        included.append(index)
+
+    skipped = indexes[len(included) :]
+    if skipped:
+        parts.append(
+            f"[Token budget reached: pages {_format_page_numbers(skipped)} not included. "
+            f"Request them with a page range.]\n"
+        )
+    return "".join(parts)
+
+
+# Реестр конвертеров: kind -> функция конвертации
+CONVERTERS: Dict[str, Callable[..., str]] = {
+    "csv": convert_csv,
+    "excel": convert_excel,
+    "docx": convert_docx,
+    "pptx": convert_pptx,
+    "pdf": convert_pdf,
+}
+
+FALLBACK_LABELS: Dict[str, str] = {
+    "csv": "CSV file",
+    "excel": "Excel file",
+    "docx": "Word document",
+    "pptx": "PowerPoint file",
+    "pdf": "PDF file",
+}
+
+
+def conversion_fallback_text(kind: str, filename: str, error: str) -> str:
+    """Текст-заглушка вместо содержимого, если конвертация не удалась"""
+    return f"{FALLBACK_LABELS.get(kind, 'File')}: {filename} (conversion failed: {error})"
+
+
+def convert_path(kind: str, path: str, filename: str, options: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+    """
+    Точка входа для процесса пула: конвертирует файл по пути.
+    Ошибки парсера превращаются в fallback текст, MemoryError пробрасывается.
+
+    Args:
+        options: параметры конвертера (token_budget, inline_max_rows, table_id для таблиц)
+
+    Returns:
+        (текст, True) или (fallback текст, False) если конвертация не удалась
+    """
+    try:
+        return CONVERTERS[kind](path, filename, **(options or {})), True
+    except MemoryError:
+        raise
+    except Exception as e:
+        return conversion_fallback_text(kind, filename, str(e)), False
+
+
+def limit_worker_memory(memory_limit_bytes: int) -> None:
+    """Initializer процесса пула: ограничивает адресное пространство воркера (Linux)"""
+    if memory_limit_bytes <= 0:
+        return
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+    except (ImportError, ValueError, OSError):
+        # Платформа не поддерживает RLIMIT_AS - работаем без лимита
+        pass
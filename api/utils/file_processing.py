@@ -1,277 +1,435 @@
 """
 Утилиты для обработки файлов на основе agno playground.
 Максимально нативная интеграция с agno.
+
+Загрузки не читаются целиком в память: размер проверяется по spooled файлу
+до обработки, конвертеры читают файловый объект напрямую, а медиа сохраняются
+в media_store чанками и передаются в agno через filepath (в сессии - только путь).
 """
 
-import pandas as pd
-import io
-from docx import Document
-from pptx import Presentation
-from pypdf import PdfReader
-from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import HTTPException, UploadFile
 from agno.media import Audio, Image, Video, File as FileMedia
 from agno.utils.log import logger
 
+from agents.table_store import find_table, make_table_id, store_table
+from api.settings import api_settings
+from api.utils.conversion_cache import conversion_cache, conversion_cache_key
+from api.utils.conversion_pool import conversion_pool
+from api.utils.document_converters import (
+    CONVERTERS,
+    conversion_fallback_text,
+    parse_page_ranges,
+    replace_table_id,
+    strip_table_notes,
+)
+from api.utils.file_types import FileTypeMismatch, content_type_by_filename, resolve_file_type
+from api.utils.image_processing import IMAGE_PIPELINE_VERSION, preprocess_image
+from api.utils.media_store import media_extension, media_store
+
+# Таблицы: конвертируются сводкой в пределах бюджета токенов (api/utils/tabular.py)
+TABULAR_KINDS = ("csv", "excel")
+
+# Размер чанка при копировании загрузки на диск
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Лимиты размера загрузок по типу файла
+UPLOAD_SIZE_LIMITS = {
+    "image": api_settings.upload_max_image_bytes,
+    "audio": api_settings.upload_max_audio_bytes,
+    "video": api_settings.upload_max_video_bytes,
+    "document": api_settings.upload_max_document_bytes,
+}
+
+
+def get_upload_size(file: UploadFile) -> int:
+    """Размер загрузки без чтения содержимого (по spooled временному файлу)"""
+    if file.size is not None:
+        return file.size
+
+    position = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+
+def check_upload_size(file: UploadFile, kind: str) -> int:
+    """
+    Проверяет размер загрузки по лимиту типа до любой обработки.
+
+    Returns:
+        Размер файла в байтах
+    """
+    size = get_upload_size(file)
+    limit = UPLOAD_SIZE_LIMITS.get(kind)
+    if limit and size > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {file.filename} is too large for {kind}: {size} bytes (max {limit})"
+        )
+    return size
+
+
+def spool_upload_to_path(file: UploadFile, hasher=None) -> str:
+    """
+    Копирует загрузку во временный файл на диске чанками (без полной копии в памяти).
+    Файл нужно удалить после запуска агента через cleanup_spooled_files.
+
+    Args:
+        hasher: hashlib объект, обновляемый чанками при копировании (хэш без повторного чтения)
+
+    Returns:
+        Путь к временному файлу (с расширением исходного файла)
+    """
+    suffix = ""
+    if file.filename and "." in file.filename:
+        suffix = "." + file.filename.rsplit(".", 1)[-1].lower()
+
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=api_settings.upload_spool_dir)
+    file.file.seek(0)
+    with os.fdopen(fd, "wb") as spooled:
+        if hasher is None:
+            shutil.copyfileobj(file.file, spooled, UPLOAD_CHUNK_SIZE)
+        else:
+            while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                spooled.write(chunk)
+    file.file.seek(0)
+    return path
+
+
+def cleanup_spooled_files(paths: List[str]) -> None:
+    """Удаляет временные файлы загрузок после завершения запуска"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove spooled upload {path}: {e}")
+
+
+def read_upload_or_spool(file: UploadFile, kind: str, spooled_paths: Optional[List[str]]) -> tuple[Optional[bytes], Optional[str]]:
+    """
+    Возвращает (content, filepath): маленькие файлы читаются в bytes,
+    крупные копируются на диск и передаются в agno по пути.
+    """
+    size = check_upload_size(file, kind)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    if spooled_paths is not None and size > api_settings.upload_inline_max_bytes:
+        path = spool_upload_to_path(file)
+        spooled_paths.append(path)
+        return None, path
+
+    file.file.seek(0)
+    return file.file.read(), None
+
+
+def text_file_media(text_content: str) -> FileMedia:
+    """FileMedia с текстом конвертированного документа"""
+    return FileMedia(content=text_content.encode('utf-8'), mime_type='text/plain')
+
 
 def determine_content_type_by_filename(filename: str) -> Optional[str]:
     """Определяет content-type по расширению файла"""
-    if not filename:
-        return None
-    
-    extension = filename.lower().split('.')[-1] if '.' in filename else None
-    if not extension:
-        return None
-    
-    # Маппинг расширений на MIME типы
-    extension_map = {
-        # Изображения
-        'png': 'image/png',
-        'jpg': 'image/jpeg', 
-        'jpeg': 'image/jpeg',
-        'webp': 'image/webp',
-        
-        # Аудио
-        'wav': 'audio/wav',
-        'mp3': 'audio/mp3',
-        
-        # Видео
-        'mp4': 'video/mp4',
-        'webm': 'video/webm',
-        'mov': 'video/quicktime',
-        
-        # Документы
-        'pdf': 'application/pdf',
-        'csv': 'text/csv',
-        'json': 'application/json',
-        'txt': 'text/plain',
-        'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        'xls': 'application/vnd.ms-excel',
-        'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-    }
-    
-    return extension_map.get(extension)
-
-
-def process_image(file: UploadFile) -> Image:
-    """Обработка изображений как в agno playground"""
-    content = file.file.read()
-    if not content:
+    return content_type_by_filename(filename)
+
+
+def store_upload(file: UploadFile) -> str:
+    """
+    Сохраняет загрузку в media_store (дедупликация по SHA-256).
+    В сессии agno попадает только путь, а не байты медиа.
+    """
+    if get_upload_size(file) == 0:
         raise HTTPException(status_code=400, detail="Empty file")
+    return media_store.put_stream(file.file, media_extension(file.filename))
+
+
+def process_image(
+    file: UploadFile, spooled_paths: Optional[List[str]] = None, use_media_store: bool = True
+) -> Image:
+    """Обработка изображений как в agno playground"""
+    if use_media_store and media_store.enabled:
+        return Image(filepath=store_upload(file))
+    content, filepath = read_upload_or_spool(file, "image", spooled_paths)
+    if filepath:
+        return Image(filepath=filepath)
     return Image(content=content)
 
 
-def process_audio(file: UploadFile) -> Audio:
-    """Обработка аудио как в agno playground"""
-    content = file.file.read()
-    if not content:
+def hash_upload(file: UploadFile) -> str:
+    """SHA-256 содержимого загрузки (чтение чанками)"""
+    hasher = hashlib.sha256()
+    file.file.seek(0)
+    while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.file.seek(0)
+    return hasher.hexdigest()
+
+
+def _downscale_upload(file: UploadFile) -> Tuple[bytes, str]:
+    file.file.seek(0)
+    try:
+        return preprocess_image(
+            file.file,
+            max_long_side=api_settings.image_max_long_side,
+            max_short_side=api_settings.image_max_short_side,
+            jpeg_quality=api_settings.image_jpeg_quality,
+        )
+    finally:
+        file.file.seek(0)
+
+
+async def prepare_image(
+    file: UploadFile, spooled_paths: Optional[List[str]] = None, use_media_store: bool = True
+) -> Image:
+    """
+    Изображение для модели: уменьшенное и перекодированное без метаданных.
+    Обработка выполняется вне event loop, результат кэшируется по SHA-256 исходника.
+    Если Pillow не смог открыть файл - передается как есть (process_image).
+    """
+    if not api_settings.image_preprocess_enabled:
+        return await asyncio.to_thread(process_image, file, spooled_paths, use_media_store)
+    if get_upload_size(file) == 0:
         raise HTTPException(status_code=400, detail="Empty file")
+
+    content_hash = await asyncio.to_thread(hash_upload, file)
+    cache_key = conversion_cache_key(
+        content_hash,
+        "image",
+        f"{IMAGE_PIPELINE_VERSION}:{api_settings.image_max_long_side}:"
+        f"{api_settings.image_max_short_side}:{api_settings.image_jpeg_quality}",
+    )
+
+    content = await asyncio.to_thread(conversion_cache.get_bytes, cache_key)
+    if content is None:
+        try:
+            processed, _ = await asyncio.to_thread(_downscale_upload, file)
+        except Exception as e:
+            logger.warning(f"Image preprocessing failed for {file.filename}, sending original: {e}")
+            return await asyncio.to_thread(process_image, file, spooled_paths, use_media_store)
+        await asyncio.to_thread(conversion_cache.put_bytes, cache_key, processed)
+        content = processed
+
+    image_format = "png" if content.startswith(b"\x89PNG") else "jpeg"
+    if use_media_store and media_store.enabled:
+        filepath = await asyncio.to_thread(media_store.put_bytes, content, f".{image_format}")
+        return Image(filepath=filepath, format=image_format)
+    return Image(content=content, format=image_format)
+
+
+def process_audio(
+    file: UploadFile, spooled_paths: Optional[List[str]] = None, use_media_store: bool = True
+) -> Audio:
+    """Обработка аудио как в agno playground"""
     format = None
     if file.filename and "." in file.filename:
         format = file.filename.split(".")[-1].lower()
     elif file.content_type:
         format = file.content_type.split("/")[-1]
 
+    if use_media_store and media_store.enabled:
+        return Audio(filepath=store_upload(file), format=format)
+    content, filepath = read_upload_or_spool(file, "audio", spooled_paths)
+    if filepath:
+        return Audio(filepath=filepath, format=format)
     return Audio(content=content, format=format)
 
 
-def process_video(file: UploadFile) -> Video:
+def process_video(
+    file: UploadFile, spooled_paths: Optional[List[str]] = None, use_media_store: bool = True
+) -> Video:
     """Обработка видео как в agno playground"""
-    content = file.file.read()
-    if not content:
-        raise HTTPException(status_code=400, detail="Empty file")
+    if use_media_store and media_store.enabled:
+        return Video(filepath=store_upload(file), format=file.content_type)
+    content, filepath = read_upload_or_spool(file, "video", spooled_paths)
+    if filepath:
+        return Video(filepath=filepath, format=file.content_type)
     return Video(content=content, format=file.content_type)
 
 
-def process_document(file: UploadFile) -> Optional[FileMedia]:
+def process_document(
+    file: UploadFile, spooled_paths: Optional[List[str]] = None, use_media_store: bool = True
+) -> Optional[FileMedia]:
     """Обработка документов как в agno playground"""
     try:
-        content = file.file.read()
-        if not content:
-            raise HTTPException(status_code=400, detail="Empty file")
-
+        if use_media_store and media_store.enabled:
+            # Путь сохраняется в сессии - временный файл загрузки удаляется после запуска
+            return FileMedia(filepath=store_upload(file))
+        content, filepath = read_upload_or_spool(file, "document", spooled_paths)
+        if filepath:
+            return FileMedia(filepath=filepath)
         return FileMedia(content=content)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing document {file.filename}: {e}")
         return None
 
 
-def process_csv(file: UploadFile) -> Optional[FileMedia]:
-    """
-    Специальная обработка CSV файлов для обхода ограничения OpenAI API.
-    Конвертирует CSV в текстовое представление, удобное для LLM.
-    """
+def _convert_upload(kind: str, file: UploadFile) -> str:
+    """Синхронная конвертация загрузки в текущем процессе (без пула)"""
+    filename = file.filename or ""
     try:
-        content = file.file.read()
-        if not content:
-            raise HTTPException(status_code=400, detail="Empty CSV file")
-
-        # Декодируем как текст
-        csv_text = content.decode('utf-8')
-        lines = csv_text.strip().split('\n')
-        
-        if not lines:
-            raise HTTPException(status_code=400, detail="Empty CSV content")
-
-        # Создаем читаемое представление для LLM
-        headers = lines[0] if lines else ""
-        data_rows = lines[1:] if len(lines) > 1 else []
-        
-        formatted_content = f"""CSV Table Data from file: {file.filename}
-
-Headers: {headers}
-Total rows: {len(data_rows)}
-Data preview (first 10 rows):
-
-{chr(10).join(data_rows[:10])}"""
-
-        if len(data_rows) > 10:
-            formatted_content += f"\n\n... and {len(data_rows) - 10} more rows"
-
-        # Создаем FileMedia с mime_type text/plain чтобы OpenAI принял его
-        return FileMedia(content=formatted_content.encode('utf-8'), mime_type='text/plain')
-    except UnicodeDecodeError:
-        logger.error(f"Failed to decode CSV file {file.filename} as UTF-8")
-        return None
+        file.file.seek(0)
+        return CONVERTERS[kind](file.file, filename)
     except Exception as e:
-        logger.error(f"Error processing CSV {file.filename}: {e}")
-        return None
+        logger.error(f"Error converting {kind} {filename}: {e}")
+        return conversion_fallback_text(kind, filename, str(e))
+    finally:
+        file.file.seek(0)  # Возвращаем указатель в начало
 
 
 def convert_csv_to_text(file: UploadFile) -> str:
     """Конвертирует CSV файл в структурированный текст"""
-    try:
-        content = file.file.read()
-        file.file.seek(0)  # Возвращаем указатель в начало
-        df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-        
-        text_content = f"""CSV Table: {file.filename}
-
-Columns: {', '.join(df.columns.tolist())}
-Rows: {len(df)}
-
-Data Summary:
-{df.describe(include='all').to_string() if not df.empty else 'No data'}
-
-Full Data:
-{df.to_string(index=False)}"""
-        
-        return text_content
-    except Exception as e:
-        logger.error(f"Error converting CSV {file.filename}: {e}")
-        return f"CSV file: {file.filename} (conversion failed: {str(e)})"
+    return _convert_upload("csv", file)
 
 
 def convert_excel_to_text(file: UploadFile) -> str:
     """Конвертирует Excel файл в структурированный текст"""
-    try:
-        content = file.file.read()
-        file.file.seek(0)
-        
-        # Читаем все листы
-        excel_data = pd.read_excel(io.BytesIO(content), sheet_name=None)
-        
-        text_content = f"Excel File: {file.filename}\n"
-        text_content += f"Sheets: {len(excel_data)}\n\n"
-        
-        for sheet_name, df in excel_data.items():
-            text_content += f"=== Sheet: {sheet_name} ===\n"
-            text_content += f"Columns: {', '.join(df.columns.tolist())}\n"
-            text_content += f"Rows: {len(df)}\n\n"
-            
-            if not df.empty:
-                text_content += f"Data:\n{df.to_string(index=False)}\n\n"
-            else:
-                text_content += "No data in this sheet\n\n"
-        
-        return text_content
-    except Exception as e:
-        logger.error(f"Error converting Excel {file.filename}: {e}")
-        return f"Excel file: {file.filename} (conversion failed: {str(e)})"
+    return _convert_upload("excel", file)
 
 
 def convert_docx_to_text(file: UploadFile) -> str:
     """Конвертирует Word документ в текст"""
-    try:
-        content = file.file.read()
-        file.file.seek(0)
-        
-        doc = Document(io.BytesIO(content))
-        text_content = f"Word Document: {file.filename}\n\n"
-        
-        for i, paragraph in enumerate(doc.paragraphs):
-            if paragraph.text.strip():
-                text_content += f"{paragraph.text}\n"
-        
-        # Добавляем таблицы если есть
-        if doc.tables:
-            text_content += "\n=== Tables ===\n"
-            for i, table in enumerate(doc.tables):
-                text_content += f"\nTable {i+1}:\n"
-                for row in table.rows:
-                    row_text = " | ".join([cell.text.strip() for cell in row.cells])
-                    text_content += f"{row_text}\n"
-        
-        return text_content
-    except Exception as e:
-        logger.error(f"Error converting DOCX {file.filename}: {e}")
-        return f"Word document: {file.filename} (conversion failed: {str(e)})"
+    return _convert_upload("docx", file)
 
 
 def convert_pptx_to_text(file: UploadFile) -> str:
     """Конвертирует PowerPoint презентацию в текст"""
-    try:
-        content = file.file.read()
-        file.file.seek(0)
-        
-        prs = Presentation(io.BytesIO(content))
-        text_content = f"PowerPoint Presentation: {file.filename}\n"
-        text_content += f"Slides: {len(prs.slides)}\n\n"
-        
-        for i, slide in enumerate(prs.slides):
-            text_content += f"=== Slide {i+1} ===\n"
-            
-            for shape in slide.shapes:
-                if hasattr(shape, 'text') and shape.text.strip():
-                    text_content += f"{shape.text}\n"
-            
-            text_content += "\n"
-        
-        return text_content
-    except Exception as e:
-        logger.error(f"Error converting PPTX {file.filename}: {e}")
-        return f"PowerPoint file: {file.filename} (conversion failed: {str(e)})"
+    return _convert_upload("pptx", file)
 
 
 def convert_pdf_to_text(file: UploadFile) -> str:
     """Конвертирует PDF файл в текст"""
+    return _convert_upload("pdf", file)
+
+
+def conversion_options(
+    kind: str,
+    content_hash: str,
+    pdf_pages: Optional[List[Tuple[int, Optional[int]]]] = None,
+    table_owner: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Параметры конвертера: для таблиц - бюджет токенов и table_id владельца для запросов
+    к полным данным (без владельца полные данные не сохраняются), для PDF - бюджет токенов,
+    диапазон страниц и хэш для кэша текста страниц.
+    """
+    if kind in TABULAR_KINDS:
+        return {
+            "token_budget": api_settings.tabular_token_budget,
+            "inline_max_rows": api_settings.tabular_inline_max_rows,
+            "table_id": make_table_id(content_hash, table_owner) if table_owner else None,
+        }
+    if kind == "pdf":
+        return {
+            "token_budget": api_settings.pdf_token_budget,
+            "pages": pdf_pages,
+            "content_hash": content_hash,
+        }
+    return {}
+
+
+def _options_variant(options: Dict[str, Any]) -> str:
+    """
+    Часть ключа кэша конвертаций: параметры, влияющие на текст (без идентификаторов).
+    Есть ли в сводке ссылка table_id - входит в ключ, сам table_id подставляется при попадании.
+    """
+    variant = {name: value for name, value in options.items() if name not in ("table_id", "content_hash")}
+    if options.get("table_id"):
+        variant["table_ref"] = True
+    return json.dumps(variant, sort_keys=True)
+
+
+def _ensure_table_stored(
+    kind: str, path: str, filename: str, text: str, options: Dict[str, Any], table_owner: Optional[str]
+) -> None:
+    """При попадании в кэш таблицы владельца может не быть в хранилище - сохраняем"""
+    table_id = options.get("table_id")
+    if table_id and f"Table ID: {table_id}" in text and find_table(table_id, table_owner) is None:
+        extension = os.path.splitext(filename or "")[1].lower() or (".csv" if kind == "csv" else ".xlsx")
+        store_table(path, table_id, extension)
+
+
+async def convert_upload_in_pool(
+    kind: str,
+    file: UploadFile,
+    pdf_pages: Optional[List[Tuple[int, Optional[int]]]] = None,
+    table_owner: Optional[str] = None,
+) -> str:
+    """
+    Конвертирует загрузку в процессе пула: файл копируется на диск чанками,
+    процесс пула читает его по пути, временный файл удаляется сразу после.
+
+    SHA-256 считается при копировании; повторная загрузка того же файла
+    берется из conversion_cache без парсинга.
+    """
+    filename = file.filename or ""
+    hasher = hashlib.sha256()
+    path = await asyncio.to_thread(spool_upload_to_path, file, hasher)
     try:
-        content = file.file.read()
-        file.file.seek(0)
-        
-        reader = PdfReader(io.BytesIO(content))
-        text_content = f"PDF Document: {file.filename}\n"
-        text_content += f"Pages: {len(reader.pages)}\n\n"
-        
-        for i, page in enumerate(reader.pages):
-            text_content += f"=== Page {i+1} ===\n"
-            try:
-                text_content += page.extract_text()
-                text_content += "\n\n"
-            except Exception as e:
-                text_content += f"(Page extraction failed: {str(e)})\n\n"
-        
+        content_hash = hasher.hexdigest()
+        options = conversion_options(kind, content_hash, pdf_pages, table_owner)
+        cache_key = conversion_cache_key(content_hash, kind, _options_variant(options))
+        if conversion_cache.enabled:
+            cached_text = await asyncio.to_thread(conversion_cache.get, cache_key, filename)
+            if cached_text is not None:
+                logger.info(f"📦 Conversion cache hit: {filename}")
+                if kind in TABULAR_KINDS and options["table_id"]:
+                    cached_text = replace_table_id(cached_text, options["table_id"])
+                    await asyncio.to_thread(
+                        _ensure_table_stored, kind, path, filename, cached_text, options, table_owner
+                    )
+                return cached_text
+
+        text_content, converted = await conversion_pool.convert(kind, path, filename, options)
+        if converted and conversion_cache.enabled:
+            # Fallback тексты не кэшируем - следующая загрузка попробует снова
+            await asyncio.to_thread(conversion_cache.put, cache_key, filename, text_content)
         return text_content
-    except Exception as e:
-        logger.error(f"Error converting PDF {file.filename}: {e}")
-        return f"PDF file: {file.filename} (conversion failed: {str(e)})"
+    finally:
+        cleanup_spooled_files([path])
 
 
-def process_files(files: Optional[List[UploadFile]]) -> tuple[List[Image], List[Audio], List[Video], List[FileMedia]]:
+async def process_files(
+    files: Optional[List[UploadFile]],
+    spooled_paths: Optional[List[str]] = None,
+    pdf_pages: Optional[str] = None,
+    table_owner: Optional[str] = None,
+    keep_in_history: bool = True,
+) -> tuple[List[Image], List[Audio], List[Video], List[FileMedia]]:
     """
     Обработка файлов как в agno playground.
     Возвращает кортеж (images, audios, videos, documents)
+
+    Документы (CSV, Excel, Word, PowerPoint) конвертируются в пуле процессов,
+    все документы одного запроса - параллельно.
+
+    PDF передается в agno нативно, кроме случаев когда указан диапазон страниц
+    pdf_pages ("1-5,8,10-") или включен pdf_extract_text - тогда текст страниц
+    извлекается в пределах бюджета токенов.
+
+    Медиа и документы без конвертации сохраняются в media_store и передаются
+    в agno по пути. Без media_store при переданном spooled_paths крупные файлы
+    копируются на диск во временные файлы; пути добавляются в список, вызывающий
+    код удаляет их через cleanup_spooled_files после запуска агента.
+
+    keep_in_history - пути попадут в историю сессии агента (storage): тогда
+    media_store используется только с постоянным каталогом (media_store_dir),
+    иначе загрузки передаются байтами.
+
+    table_owner - у агента есть TabularQueryTools: полные данные больших таблиц
+    сохраняются под table_id этого владельца (user_id или session_id запуска),
+    сводка ссылается на него. Без владельца ссылка в сводке не выводится.
     """
     base64_images: List[Image] = []
     base64_audios: List[Audio] = []
@@ -281,110 +439,77 @@ def process_files(files: Optional[List[UploadFile]]) -> tuple[List[Image], List[
     if not files:
         return base64_images, base64_audios, base64_videos, input_files
 
+    try:
+        page_ranges = parse_page_ranges(pdf_pages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    extract_pdf_text = page_ranges is not None or api_settings.pdf_extract_text
+    use_media_store = media_store.persistent or not keep_in_history
+
+    # Документы для конвертации в пуле: (kind, file)
+    conversions: List[Tuple[str, UploadFile]] = []
+    # Изображения обрабатываются параллельно после разбора списка файлов
+    image_uploads: List[UploadFile] = []
+
     for file in files:
-        # Определяем content_type: используем оригинальный или определяем по расширению
-        content_type = file.content_type
-        
-        # Если content_type отсутствует или является generic типом, определяем по расширению
-        if not content_type or content_type in ["application/octet-stream", "text/plain"]:
-            filename_content_type = determine_content_type_by_filename(file.filename)
-            if filename_content_type:
-                content_type = filename_content_type
-        
-        # Обработка файла по типу
-        
-        # Изображения
-        if content_type in ["image/png", "image/jpeg", "image/jpg", "image/webp"]:
-            try:
-                base64_image = process_image(file)
-                base64_images.append(base64_image)
-                logger.info(f"✅ Image processed: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error processing image {file.filename}: {e}")
-            continue
-                
-        # Аудио
-        elif content_type in ["audio/wav", "audio/mp3", "audio/mpeg"]:
-            try:
-                base64_audio = process_audio(file)
-                base64_audios.append(base64_audio)
-                logger.info(f"✅ Audio processed: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error processing audio {file.filename}: {e}")
-            continue
-                
-        # Видео
-        elif content_type in [
-            "video/x-flv", "video/quicktime", "video/mpeg", "video/mpegs",
-            "video/mpgs", "video/mpg", "video/mp4", "video/webm", "video/wmv", "video/3gpp"
-        ]:
-            try:
-                base64_video = process_video(file)
-                base64_videos.append(base64_video)
-                logger.info(f"✅ Video processed: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error processing video {file.filename}: {e}")
-            continue
-                
-        # CSV файлы 
-        elif content_type == "text/csv":
-            try:
-                text_content = convert_csv_to_text(file)
-                text_file = FileMedia(content=text_content.encode('utf-8'))
-                input_files.append(text_file)
-                logger.info(f"✅ CSV converted to text: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error converting CSV {file.filename}: {e}")
-                continue
-                
-        # Excel файлы (.xlsx, .xls)
-        elif content_type in ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"]:
-            try:
-                text_content = convert_excel_to_text(file)
-                text_file = FileMedia(content=text_content.encode('utf-8'))
-                input_files.append(text_file)
-                logger.info(f"✅ Excel converted to text: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error converting Excel {file.filename}: {e}")
-                continue
-                
-        # Word документы (.docx)
-        elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            try:
-                text_content = convert_docx_to_text(file)
-                text_file = FileMedia(content=text_content.encode('utf-8'))
-                input_files.append(text_file)
-                logger.info(f"✅ Word document converted to text: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error converting Word document {file.filename}: {e}")
-                continue
-                
-        # PowerPoint презентации (.pptx)
-        elif content_type == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
-            try:
-                text_content = convert_pptx_to_text(file)
-                text_file = FileMedia(content=text_content.encode('utf-8'))
-                input_files.append(text_file)
-                logger.info(f"✅ PowerPoint converted to text: {file.filename}")
-            except Exception as e:
-                logger.error(f"Error converting PowerPoint {file.filename}: {e}")
-                continue
-                
-        # Остальные документы (PDF остается в нативной agno обработке)
-        elif content_type in [
-            "application/pdf", 
-            "text/plain", "application/json"
-        ]:
-            document_file = process_document(file)
-            if document_file is not None:
-                input_files.append(document_file)
-        else:
+        # Тип по сигнатуре содержимого, content_type клиента и расширению (api/utils/file_types.py)
+        try:
+            content_type, handler = resolve_file_type(file.file, file.content_type, file.filename)
+        except FileTypeMismatch as e:
+            logger.warning(str(e))
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if handler is None:
             # Если не удалось определить тип файла
             if content_type is None:
                 logger.warning(f"Could not determine content-type for file: {file.filename}")
                 raise HTTPException(status_code=400, detail=f"Could not determine file type for: {file.filename}")
-            else:
-                logger.warning(f"Unsupported content-type: {content_type} for file: {file.filename}")
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type}")
+            logger.warning(f"Unsupported content-type: {content_type} for file: {file.filename}")
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type}")
+
+        check_upload_size(file, handler.size_kind)
+        kind = handler.kind
+
+        if kind == "image":
+            image_uploads.append(file)
+        elif kind in ("audio", "video"):
+            try:
+                if kind == "audio":
+                    base64_audios.append(await asyncio.to_thread(process_audio, file, spooled_paths, use_media_store))
+                else:
+                    base64_videos.append(await asyncio.to_thread(process_video, file, spooled_paths, use_media_store))
+                logger.info(f"✅ {kind.capitalize()} processed: {file.filename}")
+            except Exception as e:
+                logger.error(f"Error processing {kind} {file.filename}: {e}")
+        elif kind in CONVERTERS and (kind != "pdf" or extract_pdf_text):
+            # CSV, Excel, Word, PowerPoint; PDF - при диапазоне страниц / pdf_extract_text
+            conversions.append((kind, file))
+        else:
+            # Остальные документы (PDF по умолчанию остается в нативной agno обработке)
+            document_file = await asyncio.to_thread(process_document, file, spooled_paths, use_media_store)
+            if document_file is not None:
+                input_files.append(document_file)
+
+    if image_uploads:
+        results = await asyncio.gather(
+            *(prepare_image(file, spooled_paths, use_media_store) for file in image_uploads), return_exceptions=True
+        )
+        for file, result in zip(image_uploads, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Error processing image {file.filename}: {result}")
+                continue
+            base64_images.append(result)
+            logger.info(f"✅ Image processed: {file.filename}")
+
+    if conversions:
+        # Параллельная конвертация; при сбое/таймауте конвертер возвращает fallback текст
+        texts = await asyncio.gather(
+            *(convert_upload_in_pool(kind, file, page_ranges, table_owner) for kind, file in conversions)
+        )
+        for (kind, file), text_content in zip(conversions, texts):
+            if kind in TABULAR_KINDS and not table_owner:
+                text_content = strip_table_notes(text_content)
+            input_files.append(text_file_media(text_content))
+            logger.info(f"✅ {kind} converted to text: {file.filename}")
 
     return base64_images, base64_audios, base64_videos, input_files 
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+Реестр типов загружаемых файлов: MIME → обработчик.
+
+Тип файла определяется один раз:
+1. сигнатура первых байтов (magic bytes) - дешево и не зависит от клиента
+2. content_type загрузки, если он не generic
+3. расширение файла
+
+Если содержимое документа не соответствует заявленному бинарному типу (например,
+.pdf без %PDF), файл отклоняется до дорогого парсинга. Для медиа несовпадение
+только логируется - сигнатуры покрывают не все варианты контейнеров и кодеков,
+файл обрабатывается по заявленному типу. Новые форматы добавляются
+через register_file_handler() без изменения process_files.
+"""
+
+import zipfile
+from dataclasses import dataclass
+from logging import getLogger
+from types import MappingProxyType
+from typing import BinaryIO, Dict, Iterable, Mapping, Optional, Tuple
+
+logger = getLogger(__name__)
+
+# Сколько байтов читается для определения сигнатуры
+SNIFF_BYTES = 64
+
+# Content-type, которые клиенты присылают "по умолчанию" - не несут информации о формате
+GENERIC_CONTENT_TYPES = frozenset({"", "application/octet-stream", "text/plain", "binary/octet-stream"})
+
+
+@dataclass(frozen=True)
+class FileHandler:
+    """
+    Обработчик типа файла.
+
+    kind: image | audio | video | pdf | document | ключ CONVERTERS (csv, excel, docx, pptx, ...)
+    size_kind: категория лимита размера (image | audio | video | document)
+    binary: у формата есть сигнатура - несовпадение содержимого считается ошибкой типа
+    """
+
+    kind: str
+    size_kind: str = "document"
+    binary: bool = True
+
+
+_IMAGE = FileHandler("image", "image")
+_AUDIO = FileHandler("audio", "audio")
+_VIDEO = FileHandler("video", "video")
+
+_mime_handlers: Dict[str, FileHandler] = {
+    # Изображения
+    "image/png": _IMAGE,
+    "image/jpeg": _IMAGE,
+    "image/webp": _IMAGE,
+    # Аудио
+    "audio/wav": _AUDIO,
+    "audio/mp3": _AUDIO,
+    "audio/mpeg": _AUDIO,
+    "audio/mp4": _AUDIO,
+    # Видео
+    "video/x-flv": _VIDEO,
+    "video/quicktime": _VIDEO,
+    "video/mpeg": _VIDEO,
+    "video/mpegs": _VIDEO,
+    "video/mpgs": _VIDEO,
+    "video/mpg": _VIDEO,
+    "video/mp4": _VIDEO,
+    "video/webm": _VIDEO,
+    "video/wmv": _VIDEO,
+    "video/3gpp": _VIDEO,
+    # Документы
+    "text/csv": FileHandler("csv", binary=False),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": FileHandler("excel"),
+    "application/vnd.ms-excel": FileHandler("excel"),
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": FileHandler("docx"),
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": FileHandler("pptx"),
+    "application/pdf": FileHandler("pdf"),
+    "text/plain": FileHandler("document", binary=False),
+    "application/json": FileHandler("document", binary=False),
+}
+
+_extension_types: Dict[str, str] = {
+    # Изображения
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    # Аудио
+    "wav": "audio/wav",
+    "mp3": "audio/mp3",
+    "m4a": "audio/mp4",
+    # Видео
+    "mp4": "video/mp4",
+    "webm": "video/webm",
+    "mov": "video/quicktime",
+    # Документы
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+    "json": "application/json",
+    "txt": "text/plain",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "xls": "application/vnd.ms-excel",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+# Синонимы content-type, которые присылают клиенты
+_content_type_aliases: Dict[str, str] = {
+    "image/jpg": "image/jpeg",
+    "audio/x-wav": "audio/wav",
+    "audio/wave": "audio/wav",
+    "audio/x-m4a": "audio/mp4",
+    "audio/m4a": "audio/mp4",
+    "application/csv": "text/csv",
+}
+
+# Сигнатуры: (смещение, байты, content-type); OOXML (zip) уточняется по содержимому архива
+_signatures: Tuple[Tuple[int, bytes, str], ...] = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"WAVE", "audio/wav"),
+    (0, b"ID3", "audio/mpeg"),
+    (4, b"ftypM4A", "audio/mp4"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftyp3g", "video/3gpp"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+    (0, b"FLV", "video/x-flv"),
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", "video/wmv"),
+    (0, b"\x00\x00\x01\xba", "video/mpeg"),
+    (0, b"\x00\x00\x01\xb3", "video/mpeg"),
+    (0, b"%PDF-", "application/pdf"),
+)
+
+# Медиа kind: несовпадение сигнатуры не отклоняет файл
+_MEDIA_KINDS = frozenset({"image", "audio", "video"})
+
+_ZIP_SIGNATURE = b"PK\x03\x04"
+# OLE2 контейнер: .xls, но также .doc/.ppt - доверяем только заявленному Excel
+_OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_OLE_CONTENT_TYPE = "application/x-ole-storage"
+# Каталог внутри OOXML архива → content-type
+_OOXML_PARTS: Tuple[Tuple[str, str], ...] = (
+    ("word/", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ("xl/", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    ("ppt/", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+)
+
+# Read-only представления реестра; изменяются только через register_file_handler
+MIME_HANDLERS: Mapping[str, FileHandler] = MappingProxyType(_mime_handlers)
+EXTENSION_TYPES: Mapping[str, str] = MappingProxyType(_extension_types)
+
+
+class FileTypeMismatch(ValueError):
+    """Содержимое файла не соответствует заявленному типу"""
+
+
+def register_file_handler(
+    content_type: str,
+    kind: str,
+    size_kind: str = "document",
+    extensions: Iterable[str] = (),
+    signatures: Iterable[Tuple[int, bytes]] = (),
+    binary: Optional[bool] = None,
+) -> None:
+    """
+    Регистрирует новый формат загрузки.
+
+    Args:
+        content_type: MIME тип
+        kind: обработчик (image, audio, video, pdf, document или ключ CONVERTERS)
+        size_kind: категория лимита размера
+        extensions: расширения файла без точки
+        signatures: сигнатуры (смещение, байты) для определения по содержимому
+        binary: есть ли у формата сигнатура (по умолчанию - если переданы signatures)
+    """
+    global _signatures
+
+    signatures = tuple(signatures)
+    _mime_handlers[content_type] = FileHandler(
+        kind=kind,
+        size_kind=size_kind,
+        binary=bool(signatures) if binary is None else binary,
+    )
+    for extension in extensions:
+        _extension_types[extension.lower().lstrip(".")] = content_type
+    if signatures:
+        # Новые сигнатуры проверяются первыми (могут уточнять общие, например ftyp)
+        _signatures = tuple((offset, magic, content_type) for offset, magic in signatures) + _signatures
+
+
+def content_type_by_filename(filename: Optional[str]) -> Optional[str]:
+    """Content-type по расширению файла"""
+    if not filename or "." not in filename:
+        return None
+    return _extension_types.get(filename.rsplit(".", 1)[-1].lower())
+
+
+def normalize_content_type(content_type: Optional[str]) -> str:
+    """Без параметров (charset) и с учетом синонимов"""
+    if not content_type:
+        return ""
+    base = content_type.split(";", 1)[0].strip().lower()
+    return _content_type_aliases.get(base, base)
+
+
+def sniff_content_type(source: BinaryIO) -> Optional[str]:
+    """Content-type по сигнатуре первых байтов (позиция файла сохраняется)"""
+    position = source.tell()
+    try:
+        source.seek(0)
+        head = source.read(SNIFF_BYTES)
+        if head.startswith(_ZIP_SIGNATURE):
+            return _sniff_ooxml(source)
+        if head.startswith(_OLE_SIGNATURE):
+            return _OLE_CONTENT_TYPE
+        for offset, magic, content_type in _signatures:
+            if head[offset : offset + len(magic)] == magic:
+                return content_type
+        if _is_mpeg_audio_frame(head):
+            return "audio/mpeg"
+        return None
+    finally:
+        source.seek(position)
+
+
+def _is_mpeg_audio_frame(head: bytes) -> bool:
+    """Кадр MPEG audio (MP3, MPEG-2/2.5): 11 бит синхронизации и допустимые версия/слой"""
+    if len(head) < 2 or head[0] != 0xFF or head[1] & 0xE0 != 0xE0:
+        return False
+    # 0b01 - зарезервированная версия, 0b00 - зарезервированный слой
+    return (head[1] >> 3) & 0x03 != 0x01 and (head[1] >> 1) & 0x03 != 0x00
+
+
+def _sniff_ooxml(source: BinaryIO) -> Optional[str]:
+    """Тип OOXML документа по каталогам архива (читается только центральный каталог zip)"""
+    try:
+        names = zipfile.ZipFile(source).namelist()
+    except (zipfile.BadZipFile, OSError):
+        return None
+    for prefix, content_type in _OOXML_PARTS:
+        if any(name.startswith(prefix) for name in names):
+            return content_type
+    return None
+
+
+def resolve_file_type(
+    source: BinaryIO, content_type: Optional[str], filename: Optional[str]
+) -> Tuple[Optional[str], Optional[FileHandler]]:
+    """
+    Определяет тип загрузки и ее обработчик.
+
+    Returns:
+        (content_type, handler) или (content_type, None) если тип не поддерживается
+
+    Raises:
+        FileTypeMismatch: заявлен бинарный формат документа, но сигнатура содержимого не совпадает
+    """
+    declared = normalize_content_type(content_type)
+    if declared in GENERIC_CONTENT_TYPES:
+        declared = content_type_by_filename(filename) or declared
+    if not declared:
+        declared = content_type_by_filename(filename) or ""
+
+    sniffed = sniff_content_type(source)
+    if sniffed == _OLE_CONTENT_TYPE:
+        sniffed = "application/vnd.ms-excel" if declared == "application/vnd.ms-excel" else None
+        if sniffed is None:
+            return declared or None, None
+    if sniffed:
+        # Содержимое надежнее заголовка клиента
+        return sniffed, _mime_handlers.get(sniffed)
+
+    handler = _mime_handlers.get(declared)
+    if handler is not None and handler.binary:
+        if handler.kind in _MEDIA_KINDS:
+            logger.warning(f"File {filename} content does not match its type {declared}, using declared type")
+            return declared, handler
+        raise FileTypeMismatch(f"File {filename} content does not match its type {declared}")
+    return declared or None, handler
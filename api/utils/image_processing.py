@@ -0,0 +1,65 @@
+"""
+Предобработка загруженных изображений перед передачей модели.
+
+Модель все равно уменьшает изображение до своего рабочего разрешения,
+поэтому 12MP JPEG в полном размере только раздувает запрос (base64) и историю
+сессии. Изображение:
+- поворачивается по EXIF и уменьшается до max_long_side / max_short_side
+- перекодируется без метаданных (JPEG с заданным качеством, PNG при прозрачности)
+
+Функции синхронные (Pillow) - вызываются вне event loop через asyncio.to_thread.
+"""
+
+from typing import BinaryIO, Tuple, Union
+
+# Путь к файлу или бинарный файловый объект
+ImageSource = Union[str, BinaryIO]
+
+# Версия пайплайна - входит в ключ кэша обработанных изображений
+IMAGE_PIPELINE_VERSION = "1"
+
+
+def _target_size(width: int, height: int, max_long_side: int, max_short_side: int) -> Tuple[int, int]:
+    """Размер после уменьшения с сохранением пропорций (без увеличения)"""
+    scale = 1.0
+    if max_long_side > 0:
+        scale = min(scale, max_long_side / max(width, height))
+    if max_short_side > 0:
+        scale = min(scale, max_short_side / min(width, height))
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def preprocess_image(
+    source: ImageSource,
+    max_long_side: int,
+    max_short_side: int,
+    jpeg_quality: int,
+) -> Tuple[bytes, str]:
+    """
+    Уменьшает и перекодирует изображение.
+
+    Returns:
+        (байты изображения, формат "jpeg" | "png")
+    """
+    from io import BytesIO
+
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+
+    with PILImage.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+
+    size = _target_size(image.width, image.height, max_long_side, max_short_side)
+    if size != (image.width, image.height):
+        image = image.resize(size, PILImage.Resampling.LANCZOS)
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    output = BytesIO()
+    # Новое изображение сохраняется без exif/icc/xmp - метаданные не переносятся
+    if has_alpha:
+        image.convert("RGBA").save(output, format="PNG", optimize=True)
+        return output.getvalue(), "png"
+
+    image.convert("RGB").save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+    return output.getvalue(), "jpeg"
@@ -0,0 +1,178 @@
+"""
+Content-addressed хранилище загруженных медиа (изображения, аудио, видео)
+и документов, передаваемых в agno без конвертации.
+
+Медиа передаются в agent.arun ссылкой (filepath), а не байтами: agno сохраняет
+в сессии (таблица sessions) только путь, поэтому строки сессий остаются
+маленькими, а чтение истории не тянет мегабайты base64 через Postgres.
+Байты читаются с диска только в момент отправки запроса модели.
+
+Файлы дедуплицируются по SHA-256 содержимого. Пути из хранилища попадают в историю
+сессий только если задан media_store_dir (общий для воркеров volume): каталог по
+умолчанию во временной директории не переживает рестарт пода, поэтому без него
+агенты со storage получают загрузки байтами (persistent=False). Файл, удаленный
+при вытеснении, в истории пропускается agno при формировании запроса модели
+(файл не найден - медиа не отправляется), сессия при этом продолжает работать.
+"""
+
+import hashlib
+import os
+import tempfile
+from logging import getLogger
+from threading import Lock
+from typing import BinaryIO, Dict, Optional
+
+from api.settings import api_settings
+
+logger = getLogger(__name__)
+
+# Размер чанка копирования
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+
+class MediaStore:
+    """Файловое хранилище медиа с дедупликацией по хэшу и ограничением объема"""
+
+    def __init__(self, store_dir: str, max_bytes: int, enabled: bool = True, persistent: bool = False):
+        self._dir = store_dir
+        self._max_bytes = max_bytes
+        self._enabled = enabled
+        self._persistent = persistent
+        self._lock = Lock()
+        self._stored = 0
+        self._deduplicated = 0
+        self._pruned = 0
+        self._bytes_since_prune = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @property
+    def persistent(self) -> bool:
+        """Каталог задан явно (volume) - пути можно сохранять в истории сессий"""
+        return self._persistent
+
+    def _path(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self._dir, content_hash[:2], f"{content_hash}{extension}")
+
+    def _commit(self, tmp_path: str, content_hash: str, extension: str, size: int) -> str:
+        """Переносит временный файл под имя хэша (или удаляет, если такой файл уже есть)"""
+        path = self._path(content_hash, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)  # Медиа снова используется - не вытесняем первым
+            with self._lock:
+                self._deduplicated += 1
+            return path
+
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._stored += 1
+            self._bytes_since_prune += size
+            need_prune = self._bytes_since_prune > self._max_bytes // 10
+            if need_prune:
+                self._bytes_since_prune = 0
+        if need_prune:
+            self._prune()
+        return path
+
+    def put_stream(self, source: BinaryIO, extension: str = "") -> str:
+        """
+        Сохраняет файловый объект чанками, хэш считается при копировании.
+
+        Returns:
+            Путь к файлу в хранилище
+        """
+        os.makedirs(self._dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                source.seek(0)
+                while chunk := source.read(MEDIA_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            source.seek(0)
+            return self._commit(tmp_path, hasher.hexdigest(), extension, size)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_bytes(self, data: bytes, extension: str = "") -> str:
+        """Сохраняет байты (например, обработанное изображение)"""
+        os.makedirs(self._dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            return self._commit(tmp_path, hashlib.sha256(data).hexdigest(), extension, len(data))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune(self) -> None:
+        """Удаляет давно не использованные файлы сверх лимита объема"""
+        if self._max_bytes <= 0:
+            return
+
+        entries = []
+        for root, _, names in os.walk(self._dir):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            with self._lock:
+                self._pruned += removed
+            logger.info(f"Media store pruned {removed} files, {total} bytes left")
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self._enabled,
+            "persistent": self._persistent,
+            "directory": self._dir,
+            "max_bytes": self._max_bytes,
+            "stored": self._stored,
+            "deduplicated": self._deduplicated,
+            "pruned": self._pruned,
+        }
+
+
+def media_extension(filename: Optional[str], default: str = "") -> str:
+    """Расширение файла из имени загрузки (в нижнем регистре, с точкой)"""
+    if filename and "." in filename:
+        return "." + filename.rsplit(".", 1)[-1].lower()
+    return default
+
+
+# Глобальное хранилище медиа воркера
+media_store = MediaStore(
+    store_dir=api_settings.media_store_dir or os.path.join(tempfile.gettempdir(), "crafty_media_store"),
+    max_bytes=api_settings.media_store_max_mb * 1024 * 1024,
+    enabled=api_settings.media_store_enabled,
+    persistent=api_settings.media_store_dir is not None,
+)
@@ -0,0 +1,338 @@
+"""
+Кэш ответов детерминированных агентов.
+
+Для агентов с включенной секцией response_cache конфигурации одинаковое
+сообщение дает практически одинаковый ответ, а каждый запрос платит за
+полный проход LLM и инструментов. Ответ кэшируется по ключу:
+(строка агента, версия конфигурации, модель, нормализованное сообщение,
+SHA-256 файлов, pdf_pages, stream).
+
+Кэш включается только если агент детерминирован и не зависит от истории:
+- agent_config: {"response_cache": {"enabled": true, "ttl_seconds": 3600}}
+- model_config.temperature == 0 и задан model_config.seed
+- storage и memory выключены (ответ не зависит от сессии и пользователя)
+
+Версия конфигурации - updated_at агента и updated_at/is_active его инструментов
+(tool_ids): после изменения агента или любого его инструмента старые записи
+просто перестают находиться и вытесняются по TTL/LRU.
+
+Потоковый ответ хранится как список событий и воспроизводится стримом,
+обычный - как dict ответа. Ответ из кэша отдается с идентификаторами текущего
+запроса: session_id запроса (или новый), новый run_id и created_at. Кэш в памяти воркера, ограничен числом записей
+и объемом.
+
+Перефразированные запросы находит семантический кэш (api/utils/semantic_cache.py),
+включаемый той же секцией: {"response_cache": {"enabled": true, "semantic": {"threshold": 0.92}}}
+"""
+
+import hashlib
+import json
+import re
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from logging import getLogger
+from threading import Lock
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from agents.agent_cache import agent_cache
+from api.settings import api_settings
+from db.models.agent import DynamicAgent
+from db.models.tool import Tool
+
+logger = getLogger(__name__)
+
+# Заголовок ответа: hit - ответ из кэша, miss - ответ сохранен в кэш
+RESPONSE_CACHE_HEADER = "X-Response-Cache"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class ResponseCachePolicy:
+    """Параметры кэша ответов агента"""
+
+    agent_row_id: str
+    version: str
+    ttl_seconds: float
+    # Порог близости семантического кэша (None - семантический кэш выключен)
+    semantic_threshold: Optional[float] = None
+
+
+@dataclass
+class _CachedResponse:
+    value: Any
+    size: int
+    expires_at: float
+
+
+def _is_deterministic(row: Any) -> bool:
+    """row - строка запроса колонок DynamicAgent (agent_config, model_config)"""
+    agent_config: Dict[str, Any] = row.agent_config or {}
+    model_config: Dict[str, Any] = row.model_config or {}
+    storage_config = agent_config.get("storage")
+    if storage_config is not None and storage_config.get("enabled", True):
+        return False
+    if agent_config.get("memory", {}).get("enabled", False):
+        return False
+    return model_config.get("temperature") == 0 and model_config.get("seed") is not None
+
+
+def _config_version(db: Session, row: Any) -> str:
+    """Версия агента вместе с версиями его инструментов (изменение инструмента не меняет updated_at агента)"""
+    parts = [agent_cache.version_hash(row.agent_id, row.updated_at)]
+    tool_ids = row.tool_ids or []
+    if tool_ids:
+        tools = db.query(Tool.id, Tool.updated_at, Tool.is_active).filter(Tool.id.in_(tool_ids)).all()
+        parts.extend(
+            f"{tool.id}:{tool.updated_at.isoformat() if tool.updated_at else ''}:{tool.is_active}"
+            for tool in sorted(tools, key=lambda tool: str(tool.id))
+        )
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+def get_response_cache_policy(
+    agent_id: str, user_id: Optional[str] = None, db: Optional[Session] = None
+) -> Optional[ResponseCachePolicy]:
+    """
+    Политика кэша ответов агента или None, если кэш для агента не включен.
+
+    Статические агенты не кэшируются. Читается только строка агента (без построения).
+    """
+    if db is None or not (response_cache.enabled or api_settings.semantic_cache_enabled):
+        return None
+
+    # Тот же приоритет, что и в get_agent: пользовательский агент, потом глобальный
+    row = (
+        db.query(
+            DynamicAgent.id,
+            DynamicAgent.agent_id,
+            DynamicAgent.updated_at,
+            DynamicAgent.agent_config,
+            DynamicAgent.model_config,
+            DynamicAgent.tool_ids,
+        )
+        .filter(DynamicAgent.agent_id == agent_id, DynamicAgent.is_active == True)
+        .order_by(DynamicAgent.user_id == user_id, DynamicAgent.user_id.is_(None))
+        .first()
+    )
+
+    if not row:
+        return None
+    cache_config = (row.agent_config or {}).get("response_cache") or {}
+    if not cache_config.get("enabled", False):
+        return None
+    if not _is_deterministic(row):
+        logger.debug(f"Response cache skipped for {agent_id}: agent is not deterministic")
+        return None
+
+    # semantic: true или {"enabled": true, "threshold": 0.9}
+    semantic_config = cache_config.get("semantic") or {}
+    if semantic_config is True:
+        semantic_config = {"enabled": True}
+    semantic_threshold = None
+    if semantic_config and semantic_config.get("enabled", True) and api_settings.semantic_cache_enabled:
+        semantic_threshold = float(semantic_config.get("threshold", api_settings.semantic_cache_threshold))
+
+    return ResponseCachePolicy(
+        agent_row_id=str(row.id),
+        version=_config_version(db, row),
+        ttl_seconds=float(cache_config.get("ttl_seconds", api_settings.response_cache_ttl_seconds)),
+        semantic_threshold=semantic_threshold,
+    )
+
+
+def normalize_message(message: str) -> str:
+    """Сообщение без различий в пробелах и форме Unicode"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", message)).strip()
+
+
+def response_cache_key(
+    policy: ResponseCachePolicy,
+    model: str,
+    message: str,
+    file_hashes: List[str],
+    pdf_pages: Optional[str],
+    stream: bool,
+) -> str:
+    """Ключ записи кэша ответов"""
+    payload = json.dumps(
+        [
+            policy.agent_row_id,
+            policy.version,
+            model,
+            normalize_message(message),
+            file_hashes,
+            pdf_pages,
+            stream,
+        ]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU кэш ответов в памяти воркера с TTL записей и ограничением объема"""
+
+    def __init__(self, max_entries: int, max_bytes: int, enabled: bool = True):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._enabled = enabled and max_entries > 0 and max_bytes > 0
+        self._entries: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.time():
+                if entry is not None:
+                    self._forget(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def put(self, key: str, value: Any, ttl_seconds: float) -> None:
+        # Размер по JSON представлению - события стрима и dict ответа
+        size = len(json.dumps(value, default=str))
+        if not self._enabled or ttl_seconds <= 0 or size > self._max_bytes:
+            return
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = _CachedResponse(value=value, size=size, expires_at=time.time() + ttl_seconds)
+            self._total_bytes += size
+            self._stores += 1
+            while len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self._forget(oldest)
+                self._evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self._enabled,
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_mb": round(self._max_bytes / (1024 * 1024), 2),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+            }
+
+
+def is_complete_response(response: Dict[str, Any]) -> bool:
+    """Ответ завершен без ошибки и паузы (подтверждение инструментов не кэшируется)"""
+    return response.get("status") in (None, "COMPLETED")
+
+
+async def record_stream(
+    stream: AsyncGenerator,
+    key: str,
+    policy: ResponseCachePolicy,
+    on_complete: Optional[Callable[[List[str]], Awaitable[None]]] = None,
+) -> AsyncGenerator:
+    """
+    Отдает события стрима и сохраняет их в кэш, если запуск завершился RunCompleted.
+
+    on_complete вызывается с событиями завершенного запуска (семантический кэш).
+    """
+    events: List[str] = []
+    completed = False
+    failed = False
+    async for chunk in stream:
+        events.append(chunk)
+        try:
+            event = json.loads(chunk).get("event")
+        except (TypeError, ValueError, AttributeError):
+            event = None
+        if event in ("RunError", "RunPaused", "RunCancelled"):
+            failed = True
+        elif event == "RunCompleted":
+            completed = True
+        yield chunk
+    if completed and not failed:
+        response_cache.put(key, events, policy.ttl_seconds)
+        if on_complete is not None:
+            await on_complete(events)
+
+
+def _run_identity(session_id: Optional[str]) -> Dict[str, Any]:
+    """Идентификаторы запуска, отдаваемого из кэша"""
+    return {
+        "session_id": session_id or str(uuid.uuid4()),
+        "run_id": str(uuid.uuid4()),
+        "created_at": int(time.time()),
+    }
+
+
+def _rebind(value: Any, identity: Dict[str, Any]) -> Any:
+    # session_id/run_id вложенных объектов (события в ответе) - тоже первого запроса
+    if isinstance(value, dict):
+        return {
+            key: identity[key] if key in ("session_id", "run_id") and item is not None else _rebind(item, identity)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_rebind(item, identity) for item in value]
+    return value
+
+
+def _rebind_top(response: Dict[str, Any], identity: Dict[str, Any]) -> Dict[str, Any]:
+    result = _rebind(response, identity)
+    if "created_at" in result:
+        result["created_at"] = identity["created_at"]
+    return result
+
+
+def rebind_response(response: Dict[str, Any], session_id: Optional[str]) -> Dict[str, Any]:
+    """Копия ответа из кэша с session_id, run_id и created_at текущего запроса"""
+    return _rebind_top(response, _run_identity(session_id))
+
+
+async def replay_stream(events: List[str], session_id: Optional[str]) -> AsyncGenerator:
+    """Воспроизводит сохраненные события стрима с идентификаторами текущего запроса"""
+    identity = _run_identity(session_id)
+    for chunk in events:
+        try:
+            event = json.loads(chunk)
+        except (TypeError, ValueError):
+            yield chunk
+            continue
+        yield json.dumps(_rebind_top(event, identity)) if isinstance(event, dict) else chunk
+
+
+# Глобальный кэш ответов воркера
+response_cache = ResponseCache(
+    max_entries=api_settings.response_cache_max_entries,
+    max_bytes=api_settings.response_cache_max_mb * 1024 * 1024,
+    enabled=api_settings.response_cache_enabled,
+)
@@ -0,0 +1,170 @@
+"""
+Фоновая задача компактизации и retention сессий.
+
+Раз в retention_interval_seconds для каждого агента со storage:
+1. обрезает runs сессий до retention_keep_runs последних; если у агента
+   включены enable_session_summaries, сессии с готовым summary обрезаются
+   сильнее (retention_summary_keep_runs) - старые runs заменяет summary
+2. переносит сессии без обновлений дольше retention_archive_after_days
+   в архивную таблицу <table>_archive
+
+Настройки переопределяются секцией retention конфигурации агента:
+{"enabled": false, "keep_runs": 20, "summary_keep_runs": 5, "archive_after_days": 30}
+
+В нескольких воркерах задача безопасна (FOR UPDATE SKIP LOCKED), но
+выполнять ее достаточно в одном - retention_enabled включается отдельно.
+"""
+
+import asyncio
+import time
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+from agents.storage_resolver import AgentStorageConfig, get_agent_storage_config, list_agent_storage_configs
+from api.settings import api_settings
+from db.retention import archive_old_sessions, table_exists, trim_session_runs
+from db.session import db_engine
+
+logger = getLogger(__name__)
+
+
+class RetentionJob:
+    """Периодическая компактизация сессий всех агентов"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._runs = 0
+        self._last_run_at: Optional[float] = None
+        self._last_duration: Optional[float] = None
+        self._last_result: List[Dict[str, Any]] = []
+        self._last_error: Optional[str] = None
+
+    def _policy(self, config: AgentStorageConfig) -> Dict[str, Any]:
+        overrides = config.retention
+        return {
+            "enabled": overrides.get("enabled", True),
+            "keep_runs": int(overrides.get("keep_runs", api_settings.retention_keep_runs)),
+            "summary_keep_runs": int(overrides.get("summary_keep_runs", api_settings.retention_summary_keep_runs)),
+            "archive_after_days": int(overrides.get("archive_after_days", api_settings.retention_archive_after_days)),
+        }
+
+    def compact_agent(self, config: AgentStorageConfig) -> Dict[str, Any]:
+        """Компактизация сессий одного агента (синхронно)"""
+        result: Dict[str, Any] = {"agent_id": config.storage_agent_id, "table": config.storage_table}
+        policy = self._policy(config)
+        if config.storage_table is None or not policy["enabled"]:
+            result["skipped"] = True
+            return result
+        with db_engine.connect() as conn:
+            if not table_exists(conn, config.storage_table):
+                # agno создает таблицу при первом запуске агента со storage
+                result["skipped"] = True
+                return result
+
+        batch_size = api_settings.retention_batch_size
+        trimmed = 0
+        if config.enable_session_summaries and policy["summary_keep_runs"] < policy["keep_runs"]:
+            # Сначала сессии с summary - старые runs в них уже отражены в summary
+            trimmed += trim_session_runs(
+                db_engine,
+                config.storage_table,
+                config.storage_agent_id,
+                keep_runs=policy["summary_keep_runs"],
+                summarized_only=True,
+                batch_size=batch_size,
+            )
+        trimmed += trim_session_runs(
+            db_engine,
+            config.storage_table,
+            config.storage_agent_id,
+            keep_runs=policy["keep_runs"],
+            batch_size=batch_size,
+        )
+        result["trimmed_sessions"] = trimmed
+        result["archived_sessions"] = archive_old_sessions(
+            db_engine,
+            config.storage_table,
+            config.storage_agent_id,
+            older_than_days=policy["archive_after_days"],
+            batch_size=batch_size,
+        )
+        return result
+
+    def run_once(self, agent_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Один проход компактизации (синхронно - вызывается через asyncio.to_thread).
+
+        Raises:
+            ValueError: agent_id не найден
+        """
+        if agent_id:
+            configs = [get_agent_storage_config(agent_id)]
+        else:
+            configs = list_agent_storage_configs()
+
+        started = time.time()
+        results = []
+        for config in configs:
+            try:
+                results.append(self.compact_agent(config))
+            except Exception as e:
+                # Таблица еще не создана agno или нет прав - остальные агенты продолжаем
+                logger.warning(f"Retention failed for {config.storage_agent_id}: {e}")
+                results.append({"agent_id": config.storage_agent_id, "table": config.storage_table, "error": str(e)})
+
+        self._runs += 1
+        self._last_run_at = started
+        self._last_duration = time.time() - started
+        self._last_result = results
+        logger.info(f"Retention pass finished in {self._last_duration:.1f}s for {len(results)} agents")
+        return results
+
+    async def run(self, agent_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Проход компактизации вне event loop (не параллельно с фоновым проходом)"""
+        async with self._lock:
+            return await asyncio.to_thread(self.run_once, agent_id)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run()
+                self._last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"Retention pass failed: {e}")
+            await asyncio.sleep(api_settings.retention_interval_seconds)
+
+    def start(self) -> None:
+        if not api_settings.retention_enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Retention job started (every {api_settings.retention_interval_seconds}s)")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": api_settings.retention_enabled,
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": api_settings.retention_interval_seconds,
+            "runs": self._runs,
+            "last_run_at": self._last_run_at,
+            "last_duration_seconds": self._last_duration,
+            "last_error": self._last_error,
+            "last_result": self._last_result,
+        }
+
+
+# Глобальная задача retention воркера
+retention_job = RetentionJob()
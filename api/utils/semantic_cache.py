@@ -0,0 +1,326 @@
+"""
+Семантический кэш ответов агентов в pgvector.
+
+Точный кэш (api/utils/response_cache.py) не помогает, когда пользователи
+перефразируют один и тот же вопрос - типичная нагрузка FAQ/support агентов.
+Семантический кэш хранит ответ вместе с эмбеддингом запроса в таблице
+response_semantic_cache и отдает ответ на запрос, близкий к сохраненному
+не меньше порога (косинусная близость).
+
+Поиск ограничен областью (строка агента, версия конфигурации, модель, stream):
+после изменения агента старые ответы не находятся и удаляются при следующей
+записи в кэш агента. Область ограничена semantic_cache_max_scope_entries
+записями - поиск сортирует по расстоянию не больше этого числа строк, самые
+старые записи удаляются при записи новой. Запросы с файлами семантически не кэшируются.
+
+Порог подбирается по метрикам /v1/cache/stats (hit rate, распределение
+близости лучших кандидатов, near misses) и выборке попаданий для ручной
+проверки (/v1/cache/semantic/samples) - ложные попадания отмечаются через
+/v1/cache/semantic/false-hit, запись при этом удаляется.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from logging import getLogger
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from agents.embedding_cache import cached_embedder
+from api.settings import api_settings
+from api.utils.response_cache import ResponseCachePolicy, normalize_message
+from db.session import db_engine
+
+if TYPE_CHECKING:
+    from agno.embedder.base import Embedder
+
+logger = getLogger(__name__)
+
+# Размерность эмбеддингов - как у колонки response_semantic_cache.embedding
+SEMANTIC_CACHE_DIMENSIONS = 1536
+
+# Близость ниже порога не больше чем на это значение считается near miss
+NEAR_MISS_MARGIN = 0.05
+
+LOOKUP_QUERY = """
+    SELECT id, message, response, 1 - (embedding <=> CAST(:embedding AS vector)) AS similarity
+    FROM response_semantic_cache
+    WHERE agent_row_id = CAST(:agent_row_id AS uuid)
+      AND version = :version
+      AND model = :model
+      AND stream = :stream
+      AND expires_at > now()
+    ORDER BY embedding <=> CAST(:embedding AS vector)
+    LIMIT 1
+"""
+
+# Записи старых версий агента и просроченные больше не находятся
+PRUNE_QUERY = """
+    DELETE FROM response_semantic_cache
+    WHERE agent_row_id = CAST(:agent_row_id AS uuid)
+      AND (version <> :version OR expires_at <= now())
+"""
+
+# Самые старые записи области сверх лимита
+TRIM_SCOPE_QUERY = """
+    DELETE FROM response_semantic_cache
+    WHERE id IN (
+        SELECT id FROM response_semantic_cache
+        WHERE agent_row_id = CAST(:agent_row_id AS uuid)
+          AND version = :version
+          AND model = :model
+          AND stream = :stream
+        ORDER BY created_at DESC, id DESC
+        OFFSET :max_entries
+    )
+"""
+
+INSERT_QUERY = """
+    INSERT INTO response_semantic_cache
+        (agent_row_id, version, model, stream, message, embedding, response, expires_at)
+    VALUES (
+        CAST(:agent_row_id AS uuid), :version, :model, :stream, :message,
+        CAST(:embedding AS vector), CAST(:response AS jsonb),
+        now() + make_interval(secs => :ttl_seconds)
+    )
+"""
+
+
+@dataclass
+class SemanticCacheHit:
+    """Ответ из семантического кэша"""
+
+    entry_id: int
+    message: str
+    response: Any
+    similarity: float
+
+
+def _vector_literal(embedding: List[float]) -> str:
+    return "[" + ",".join(repr(float(value)) for value in embedding) + "]"
+
+
+class SemanticResponseCache:
+    """Поиск и запись ответов по эмбеддингу запроса, метрики для подбора порога"""
+
+    def __init__(self):
+        self._embedder: Optional["Embedder"] = None
+        self._lock = Lock()
+        self._lookups = 0
+        self._hits = 0
+        self._near_misses = 0
+        self._stores = 0
+        self._errors = 0
+        self._hit_similarity_sum = 0.0
+        # Распределение близости лучшего кандидата (корзины по 0.05)
+        self._similarity_buckets: Dict[str, int] = {}
+        self._samples: Deque[Dict[str, Any]] = deque(maxlen=max(api_settings.semantic_cache_max_samples, 1))
+        self._sampled = 0
+        # Выбранные в выборку попадания по записям: ложными считаются только они
+        self._sampled_entries: Dict[int, int] = {}
+        self._false_hits = 0
+        self._last_error: Optional[str] = None
+
+    def _get_embedder(self) -> "Embedder":
+        if self._embedder is None:
+            # Импорт OpenAI embedder - только если у какого-то агента включен семантический кэш
+            from agno.embedder.openai import OpenAIEmbedder
+
+            # Повторяющиеся запросы не эмбеддятся заново (кэш эмбеддингов общий с knowledge)
+            self._embedder = cached_embedder(
+                OpenAIEmbedder(
+                    id=api_settings.semantic_cache_embedder_model,
+                    dimensions=SEMANTIC_CACHE_DIMENSIONS,
+                )
+            )
+        return self._embedder
+
+    def _embed(self, message: str) -> List[float]:
+        embedding = self._get_embedder().get_embedding(normalize_message(message))
+        if len(embedding) != SEMANTIC_CACHE_DIMENSIONS:
+            # agno возвращает [] при ошибке API
+            raise ValueError(f"Embedding failed: got {len(embedding)} dimensions")
+        return embedding
+
+    def _find(
+        self, policy: ResponseCachePolicy, model: str, stream: bool, embedding: List[float]
+    ) -> Optional[SemanticCacheHit]:
+        with db_engine.connect() as conn:
+            row = (
+                conn.execute(
+                    text(LOOKUP_QUERY),
+                    {
+                        "embedding": _vector_literal(embedding),
+                        "agent_row_id": policy.agent_row_id,
+                        "version": policy.version,
+                        "model": model,
+                        "stream": stream,
+                    },
+                )
+                .mappings()
+                .first()
+            )
+        if row is None:
+            return None
+        return SemanticCacheHit(
+            entry_id=row["id"],
+            message=row["message"],
+            response=row["response"],
+            similarity=float(row["similarity"]),
+        )
+
+    def _record_error(self, action: str, error: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+            self._last_error = f"{action}: {error}"
+        logger.warning(f"Semantic cache {action} failed: {error}")
+
+    async def lookup(
+        self, policy: ResponseCachePolicy, threshold: float, model: str, stream: bool, message: str
+    ) -> Tuple[Optional[SemanticCacheHit], Optional[List[float]]]:
+        """
+        Ближайший сохраненный ответ не ниже порога близости threshold.
+
+        Returns:
+            (попадание или None, эмбеддинг запроса для записи ответа при промахе;
+             None, если эмбеддинг получить не удалось)
+        """
+        try:
+            embedding = await asyncio.to_thread(self._embed, message)
+            candidate = await asyncio.to_thread(self._find, policy, model, stream, embedding)
+        except Exception as e:
+            # Нет таблицы, расширения vector или ключа OpenAI - запрос идет мимо кэша
+            self._record_error("lookup", e)
+            return None, None
+
+        hit = candidate if candidate is not None and candidate.similarity >= threshold else None
+        with self._lock:
+            self._lookups += 1
+            if candidate is not None:
+                bucket = f"{max(int(candidate.similarity * 20), 0) / 20:.2f}"
+                self._similarity_buckets[bucket] = self._similarity_buckets.get(bucket, 0) + 1
+            if hit is not None:
+                self._hits += 1
+                self._hit_similarity_sum += hit.similarity
+                if random.random() < api_settings.semantic_cache_sample_rate:
+                    self._sampled += 1
+                    self._sampled_entries[hit.entry_id] = self._sampled_entries.get(hit.entry_id, 0) + 1
+                    self._samples.append(
+                        {
+                            "entry_id": hit.entry_id,
+                            "agent_row_id": policy.agent_row_id,
+                            "query": message,
+                            "cached_query": hit.message,
+                            "similarity": round(hit.similarity, 4),
+                            "threshold": threshold,
+                            "ts": time.time(),
+                        }
+                    )
+            elif candidate is not None and candidate.similarity >= threshold - NEAR_MISS_MARGIN:
+                self._near_misses += 1
+        return hit, embedding
+
+    def _store(
+        self,
+        policy: ResponseCachePolicy,
+        model: str,
+        stream: bool,
+        message: str,
+        embedding: List[float],
+        response: Any,
+    ) -> None:
+        with db_engine.begin() as conn:
+            conn.execute(text(PRUNE_QUERY), {"agent_row_id": policy.agent_row_id, "version": policy.version})
+            conn.execute(
+                text(INSERT_QUERY),
+                {
+                    "agent_row_id": policy.agent_row_id,
+                    "version": policy.version,
+                    "model": model,
+                    "stream": stream,
+                    "message": normalize_message(message),
+                    "embedding": _vector_literal(embedding),
+                    "response": json.dumps(response, default=str),
+                    "ttl_seconds": policy.ttl_seconds,
+                },
+            )
+            conn.execute(
+                text(TRIM_SCOPE_QUERY),
+                {
+                    "agent_row_id": policy.agent_row_id,
+                    "version": policy.version,
+                    "model": model,
+                    "stream": stream,
+                    "max_entries": max(api_settings.semantic_cache_max_scope_entries, 1),
+                },
+            )
+
+    async def store(
+        self,
+        policy: ResponseCachePolicy,
+        model: str,
+        stream: bool,
+        message: str,
+        embedding: List[float],
+        response: Any,
+    ) -> None:
+        """Сохраняет завершенный ответ (ошибки записи не влияют на запрос)"""
+        try:
+            await asyncio.to_thread(self._store, policy, model, stream, message, embedding, response)
+        except Exception as e:
+            self._record_error("store", e)
+            return
+        with self._lock:
+            self._stores += 1
+
+    def _delete(self, entry_id: int) -> bool:
+        with db_engine.begin() as conn:
+            result = conn.execute(text("DELETE FROM response_semantic_cache WHERE id = :id"), {"id": entry_id})
+            return result.rowcount > 0
+
+    async def report_false_hit(self, entry_id: int) -> bool:
+        """
+        Отмечает попадание ложным и удаляет запись; False - запись уже удалена.
+
+        В false_hits учитываются попадания выборки на удаленную запись -
+        повторная отметка и записи вне выборки не искажают false_hit_rate.
+        """
+        deleted = await asyncio.to_thread(self._delete, entry_id)
+        if deleted:
+            with self._lock:
+                self._false_hits += self._sampled_entries.pop(entry_id, 0)
+        return deleted
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._samples)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": api_settings.semantic_cache_enabled,
+                "embedder_model": api_settings.semantic_cache_embedder_model,
+                "default_threshold": api_settings.semantic_cache_threshold,
+                "max_scope_entries": api_settings.semantic_cache_max_scope_entries,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                "avg_hit_similarity": round(self._hit_similarity_sum / self._hits, 4) if self._hits else None,
+                "near_misses": self._near_misses,
+                "similarity_buckets": dict(sorted(self._similarity_buckets.items())),
+                "stores": self._stores,
+                "sampled": self._sampled,
+                "false_hits": self._false_hits,
+                "false_hit_rate": round(self._false_hits / self._sampled, 3) if self._sampled else None,
+                "errors": self._errors,
+                "last_error": self._last_error,
+            }
+
+
+# Глобальный семантический кэш воркера (записи - в общей таблице БД)
+semantic_cache = SemanticResponseCache()
@@ -0,0 +1,316 @@
+"""
+Сводка таблиц (CSV/Excel) в пределах бюджета токенов.
+
+Вместо полного df.to_string() по каждой строке:
+- CSV читается чанками (read_csv chunksize), в памяти только агрегаты
+- статистика по колонкам считается векторно на чанк и объединяется
+- вывод типов колонок (integer/float/boolean/datetime/text)
+- репрезентативные строки: первые строки + воспроизводимая случайная выборка
+- текст укладывается в бюджет токенов (~4 символа на токен)
+
+Маленькие таблицы, которые помещаются в бюджет, выводятся целиком, как раньше.
+Модуль импортируется в процессах пула конвертации - без FastAPI/agno.
+"""
+
+import warnings
+from typing import Dict, List, Optional, Tuple
+
+# Оценка длины текста в токенах
+CHARS_PER_TOKEN = 4
+
+# Размер чанка чтения CSV (строк)
+CSV_CHUNK_ROWS = 50_000
+# Сколько различных значений текстовой колонки отслеживается
+MAX_TRACKED_VALUES = 1_000
+# Сколько частых значений показывается для текстовой колонки
+TOP_VALUES = 5
+# Первые строки и размер случайной выборки
+HEAD_ROWS = 5
+SAMPLE_ROWS = 50
+# Seed выборки: одинаковый файл → одинаковая сводка (кэшируется по содержимому)
+SAMPLE_SEED = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов текста"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class _ColumnProfile:
+    """Агрегаты одной колонки, объединяемые по чанкам"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.kinds: set = set()
+        self.non_null = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.numeric_count = 0
+        self.value_counts: Dict[str, int] = {}
+        self.values_truncated = False
+
+    @property
+    def kind(self) -> str:
+        if not self.kinds:
+            return "empty"
+        if len(self.kinds) == 1:
+            return next(iter(self.kinds))
+        if self.kinds <= {"integer", "float"}:
+            return "float"
+        return "text"
+
+    def add_values(self, counts) -> None:
+        """Объединяет value_counts чанка с ограничением числа отслеживаемых значений"""
+        for value, count in counts.items():
+            key = str(value)
+            self.value_counts[key] = self.value_counts.get(key, 0) + int(count)
+        if len(self.value_counts) > MAX_TRACKED_VALUES:
+            self.values_truncated = True
+            top = sorted(self.value_counts.items(), key=lambda item: item[1], reverse=True)
+            self.value_counts = dict(top[:MAX_TRACKED_VALUES])
+
+    def describe(self) -> str:
+        parts = [f"- {self.name} ({self.kind}): non-null {self.non_null}"]
+        if self.nulls:
+            parts.append(f"nulls {self.nulls}")
+
+        if self.numeric_count:
+            mean = self.total / self.numeric_count
+            variance = max(self.total_sq / self.numeric_count - mean * mean, 0.0)
+            parts.append(
+                f"min {_format_number(self.minimum)}, max {_format_number(self.maximum)}, "
+                f"mean {_format_number(mean)}, std {_format_number(variance**0.5)}"
+            )
+        elif self.minimum is not None:
+            parts.append(f"min {self.minimum}, max {self.maximum}")
+
+        if self.value_counts and self.kind in ("text", "boolean"):
+            unique = f">{MAX_TRACKED_VALUES}" if self.values_truncated else str(len(self.value_counts))
+            top = sorted(self.value_counts.items(), key=lambda item: item[1], reverse=True)[:TOP_VALUES]
+            top_text = ", ".join(f"{_shorten(value)} ({count})" for value, count in top)
+            parts.append(f"unique {unique}, top: {top_text}")
+
+        return ", ".join(parts)
+
+
+class TableProfile:
+    """Потоковый профиль таблицы: агрегаты колонок + выборка строк"""
+
+    def __init__(self, inline_max_rows: int):
+        import numpy as np
+
+        self.rows = 0
+        self.columns: Dict[str, _ColumnProfile] = {}
+        self._inline_max_rows = inline_max_rows
+        self._inline_frames: Optional[List] = []
+        self._head = None
+        self._sample = None
+        self._datetime_columns: set = set()
+        self._rng = np.random.default_rng(SAMPLE_SEED)
+
+    def add_chunk(self, chunk) -> None:
+        import pandas as pd
+
+        if self._head is None:
+            self._head = chunk.head(HEAD_ROWS)
+            self._detect_datetimes(chunk)
+
+        # Пока таблица маленькая - держим ее целиком для полного вывода
+        if self._inline_frames is not None:
+            if self.rows + len(chunk) <= self._inline_max_rows:
+                self._inline_frames.append(chunk)
+            else:
+                self._inline_frames = None
+
+        self.rows += len(chunk)
+        self._profile_columns(chunk)
+
+        # Приоритетная выборка: равномерная выборка строк без хранения всей таблицы
+        sampled = chunk.assign(_priority=self._rng.random(len(chunk)))
+        if self._sample is not None:
+            sampled = pd.concat([self._sample, sampled])
+        self._sample = sampled.nsmallest(SAMPLE_ROWS, "_priority")
+
+    def _detect_datetimes(self, chunk) -> None:
+        """Текстовые колонки, которые парсятся как даты (по первому чанку)"""
+        import pandas as pd
+        from pandas.api import types
+
+        for name in chunk.columns:
+            column = chunk[name]
+            if not (types.is_object_dtype(column) or types.is_string_dtype(column)):
+                continue
+            values = column.dropna().head(100)
+            if values.empty or not all(isinstance(value, str) for value in values):
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                parsed = pd.to_datetime(values, errors="coerce")
+            if parsed.notna().mean() >= 0.9:
+                self._datetime_columns.add(name)
+
+    def _profile_columns(self, chunk) -> None:
+        import pandas as pd
+        from pandas.api import types
+
+        counts = chunk.count()
+        numeric = chunk.select_dtypes(include="number")
+        if not numeric.empty:
+            numeric_stats = numeric.agg(["count", "sum", "min", "max"])
+            numeric_sq = (numeric.astype("float64") ** 2).sum()
+
+        for name in chunk.columns:
+            key = str(name)
+            profile = self.columns.get(key)
+            if profile is None:
+                profile = self.columns[key] = _ColumnProfile(key)
+
+            column = chunk[name]
+            non_null = int(counts[name])
+            profile.non_null += non_null
+            profile.nulls += len(column) - non_null
+            if non_null == 0:
+                continue
+
+            if types.is_bool_dtype(column):
+                profile.kinds.add("boolean")
+                profile.add_values(column.value_counts())
+            elif name in numeric.columns:
+                profile.kinds.add("integer" if types.is_integer_dtype(column) else "float")
+                stats = numeric_stats[name]
+                profile.numeric_count += int(stats["count"])
+                profile.total += float(stats["sum"])
+                profile.total_sq += float(numeric_sq[name])
+                profile.minimum = stats["min"] if profile.minimum is None else min(profile.minimum, stats["min"])
+                profile.maximum = stats["max"] if profile.maximum is None else max(profile.maximum, stats["max"])
+            elif name in self._datetime_columns:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    parsed = pd.to_datetime(column, errors="coerce").dropna()
+                if parsed.empty:
+                    continue
+                profile.kinds.add("datetime")
+                low, high = parsed.min(), parsed.max()
+                profile.minimum = low if profile.minimum is None else min(profile.minimum, low)
+                profile.maximum = high if profile.maximum is None else max(profile.maximum, high)
+            else:
+                profile.kinds.add("text")
+                profile.add_values(column.value_counts())
+
+    @property
+    def inline_frame(self):
+        """Вся таблица, если она не больше inline_max_rows"""
+        import pandas as pd
+
+        if not self._inline_frames:
+            return None
+        return pd.concat(self._inline_frames, ignore_index=True)
+
+    def render_summary(self, title: str, token_budget: int, table_note: str = "") -> str:
+        """Сводка таблицы, уложенная в бюджет токенов"""
+        budget_chars = token_budget * CHARS_PER_TOKEN
+        header = f"{title}\n\nRows: {self.rows}\nColumns: {len(self.columns)}\n"
+        if table_note:
+            header += f"{table_note}\n"
+
+        parts = [header, "\nColumn Profile:\n"]
+        used = sum(len(part) for part in parts)
+
+        descriptions = [profile.describe() for profile in self.columns.values()]
+        for index, description in enumerate(descriptions):
+            if used + len(description) + 1 > budget_chars * 0.6:
+                parts.append(f"... {len(descriptions) - index} more columns\n")
+                break
+            parts.append(description + "\n")
+            used += len(description) + 1
+
+        for label, frame in (("First Rows", self._head), ("Sample Rows", self._sample_frame())):
+            if frame is None or frame.empty:
+                continue
+            section = _fit_rows(f"\n{label}:\n", frame, budget_chars - used)
+            if section:
+                parts.append(section)
+                used += len(section)
+
+        return "".join(parts)
+
+    def _sample_frame(self):
+        if self._sample is None:
+            return None
+        # Выборка в исходном порядке строк
+        return self._sample.sort_index().drop(columns="_priority")
+
+
+def _fit_rows(label: str, frame, budget_chars: int) -> str:
+    """Сколько строк frame помещается в бюджет (по убыванию числа строк)"""
+    rows = len(frame)
+    while rows > 0:
+        text = f"{label}{frame.head(rows).to_string(index=False, max_colwidth=60)}\n"
+        if len(text) <= budget_chars:
+            return text
+        rows = rows // 2 if rows > 8 else rows - 1
+    return ""
+
+
+def _format_number(value) -> str:
+    try:
+        return f"{float(value):.6g}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _shorten(value: str, limit: int = 40) -> str:
+    return value if len(value) <= limit else value[: limit - 3] + "..."
+
+
+def _render_full(title: str, frame) -> str:
+    """Полный вывод маленькой таблицы (прежний формат конвертера)"""
+    return f"""{title}
+
+Columns: {", ".join(str(column) for column in frame.columns)}
+Rows: {len(frame)}
+
+Data Summary:
+{frame.describe(include="all").to_string() if not frame.empty else "No data"}
+
+Full Data:
+{frame.to_string(index=False)}"""
+
+
+def _render_profile(profile: TableProfile, title: str, token_budget: int, table_note: str) -> Tuple[str, bool]:
+    frame = profile.inline_frame
+    if frame is not None:
+        text = _render_full(title, frame)
+        if estimate_tokens(text) <= token_budget:
+            return text, False
+    return profile.render_summary(title, token_budget, table_note), True
+
+
+def summarize_csv(
+    source, title: str, token_budget: int, inline_max_rows: int, table_note: str = ""
+) -> Tuple[str, bool]:
+    """
+    Сводка CSV с чтением чанками.
+
+    Returns:
+        (текст, summarized) - summarized=False если таблица выведена целиком
+    """
+    import pandas as pd
+
+    profile = TableProfile(inline_max_rows)
+    for chunk in pd.read_csv(source, encoding="utf-8", chunksize=CSV_CHUNK_ROWS):
+        profile.add_chunk(chunk)
+    return _render_profile(profile, title, token_budget, table_note)
+
+
+def summarize_frame(
+    frame, title: str, token_budget: int, inline_max_rows: int, table_note: str = ""
+) -> Tuple[str, bool]:
+    """Сводка уже загруженной таблицы (лист Excel), обрабатывается срезами"""
+    profile = TableProfile(inline_max_rows)
+    for start in range(0, max(len(frame), 1), CSV_CHUNK_ROWS):
+        profile.add_chunk(frame.iloc[start : start + CSV_CHUNK_ROWS])
+    return _render_profile(profile, title, token_budget, table_note)
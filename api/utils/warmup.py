@@ -0,0 +1,173 @@
+"""
+Прогрев кэшей агентов и инструментов при старте воркера.
+
+После деплоя agent_cache и tools_cache пусты: первые запросы к каждому агенту
+платят за построение агента, запуск MCP серверов и exec custom инструментов -
+всплеск p99 на каждом rollout. Прогрев в фоне строит:
+1. самые используемые инструменты (по tool_ids активных агентов)
+2. агентов из warmup_agent_ids или самые активные пары (agent_id, user_id)
+   по сессиям за warmup_usage_window_hours - ключ кэша агента включает user_id
+
+/v1/ready отвечает 503, пока прогрев не завершен (или не истек
+warmup_timeout_seconds), /v1/health от прогрева не зависит.
+"""
+
+import asyncio
+import time
+from logging import getLogger
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from agents.selector import get_agent
+from agents.storage_resolver import STATIC_STORAGE_AGENT_IDS, list_agent_storage_configs
+from agents.tools_loader import load_tools_for_agent
+from api.settings import api_settings
+from db.retention import recent_session_activity
+from db.session import SessionLocal, db_engine
+
+logger = getLogger(__name__)
+
+# Самые используемые инструменты активных агентов
+TOP_TOOLS_QUERY = """
+    SELECT tool_id, COUNT(*) AS agents
+    FROM agents, unnest(tool_ids) AS tool_id
+    WHERE is_active = true
+    GROUP BY tool_id
+    ORDER BY agents DESC
+    LIMIT :limit
+"""
+
+
+class WarmupJob:
+    """Фоновый прогрев кэшей и состояние готовности воркера"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._state = "pending"
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._total = 0
+        self._done = 0
+        self._failed = 0
+        self._tools = 0
+        self._last_error: Optional[str] = None
+
+    def _top_tools(self) -> List[Any]:
+        with db_engine.connect() as conn:
+            return list(conn.execute(text(TOP_TOOLS_QUERY), {"limit": api_settings.warmup_max_tools}).scalars().all())
+
+    def _agent_targets(self) -> List[Tuple[str, Optional[str]]]:
+        """Пары (agent_id, user_id) для прогрева: из настройки или по активности сессий"""
+        if api_settings.warmup_agent_ids:
+            agent_ids = [agent_id.strip() for agent_id in api_settings.warmup_agent_ids.split(",") if agent_id.strip()]
+            targets: List[Tuple[str, Optional[str]]] = [(agent_id, None) for agent_id in agent_ids]
+            return targets[: api_settings.warmup_max_agents]
+
+        since = int(time.time()) - api_settings.warmup_usage_window_hours * 3600
+        tables = {config.storage_table for config in list_agent_storage_configs() if config.storage_table is not None}
+        activity: Dict[Tuple[str, Optional[str]], int] = {}
+        for table in tables:
+            for row in recent_session_activity(db_engine, table, since, limit=api_settings.warmup_max_agents):
+                # Статические агенты строятся без кэша - прогревать нечего
+                if row["agent_id"] and row["agent_id"] not in STATIC_STORAGE_AGENT_IDS.values():
+                    key = (row["agent_id"], row["user_id"])
+                    activity[key] = activity.get(key, 0) + row["sessions"]
+        ranked = sorted(activity, key=lambda key: activity[key], reverse=True)
+        return ranked[: api_settings.warmup_max_agents]
+
+    def _warm_tools(self) -> int:
+        tool_ids = self._top_tools()
+        if not tool_ids:
+            return 0
+        db = SessionLocal()
+        try:
+            return len(load_tools_for_agent(db, tool_ids))
+        finally:
+            db.close()
+
+    def _warm_agent(self, agent_id: str, user_id: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            get_agent(model_id=api_settings.warmup_model_id, agent_id=agent_id, user_id=user_id, db=db)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        self._state = "running"
+        self._started_at = time.time()
+        try:
+            self._tools = await asyncio.to_thread(self._warm_tools)
+            targets = await asyncio.to_thread(self._agent_targets)
+        except Exception as e:
+            # БД недоступна или таблицы не созданы - воркер готов без прогрева
+            self._last_error = str(e)
+            self._state = "failed"
+            self._finished_at = time.time()
+            logger.warning(f"Warm-up skipped: {e}")
+            return
+
+        self._total = len(targets)
+        semaphore = asyncio.Semaphore(max(api_settings.warmup_concurrency, 1))
+
+        async def warm(agent_id: str, user_id: Optional[str]) -> None:
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self._warm_agent, agent_id, user_id)
+                except Exception as e:
+                    self._failed += 1
+                    self._last_error = f"{agent_id}: {e}"
+                    logger.warning(f"Warm-up failed for agent {agent_id}: {e}")
+                finally:
+                    self._done += 1
+
+        await asyncio.gather(*(warm(agent_id, user_id) for agent_id, user_id in targets))
+        self._state = "done"
+        self._finished_at = time.time()
+        logger.info(
+            f"Warm-up finished in {self._finished_at - self._started_at:.1f}s: "
+            f"{self._tools} tools, {self._done - self._failed}/{self._total} agents"
+        )
+
+    def start(self) -> None:
+        if not api_settings.warmup_enabled:
+            self._state = "disabled"
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        if self._state in ("done", "failed", "disabled"):
+            return True
+        if self._started_at is not None:
+            return time.time() - self._started_at >= api_settings.warmup_timeout_seconds
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self._finished_at or time.time()
+        return {
+            "state": self._state,
+            "ready": self.ready,
+            "agents_total": self._total,
+            "agents_done": self._done,
+            "agents_failed": self._failed,
+            "tools_loaded": self._tools,
+            "elapsed_seconds": round(finished - self._started_at, 1) if self._started_at else None,
+            "timeout_seconds": api_settings.warmup_timeout_seconds,
+            "last_error": self._last_error,
+        }
+
+
+# Глобальная задача прогрева воркера
+warmup_job = WarmupJob()
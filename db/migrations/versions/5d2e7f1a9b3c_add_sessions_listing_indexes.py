@@ -0,0 +1,40 @@
+"""
+Добавить индексы для списка сессий агента (keyset пагинация).
+
+GET /agents/{agent_id}/sessions выбирает сессии по agent_id (и user_id),
+сортируя по (created_at DESC, session_id DESC). Таблицу sessions создает agno
+при первом запуске со storage, поэтому индексы создаются только если она есть.
+Таблицы, созданные позже (и таблицы с table_name из конфигурации агента),
+получают те же индексы при создании storage (agents/session_storage.py).
+"""
+
+from alembic import op
+
+
+# revision identifiers
+revision = "5d2e7f1a9b3c"
+down_revision = "8fbe5808c235"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Индексы (agent_id, created_at, session_id) и (agent_id, user_id, created_at, session_id)"""
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.sessions') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS ix_sessions_agent_created
+                    ON public.sessions (agent_id, created_at DESC, session_id DESC);
+                CREATE INDEX IF NOT EXISTS ix_sessions_agent_user_created
+                    ON public.sessions (agent_id, user_id, created_at DESC, session_id DESC);
+            END IF;
+        END
+        $$;
+    """)
+
+
+def downgrade():
+    """Удалить индексы списка сессий"""
+    op.execute("DROP INDEX IF EXISTS public.ix_sessions_agent_user_created;")
+    op.execute("DROP INDEX IF EXISTS public.ix_sessions_agent_created;")
@@ -0,0 +1,126 @@
+"""
+Statement-level триггеры инвалидации кэша вместо row-level.
+
+Row-level триггер отправляет NOTIFY на каждую строку: массовый импорт или
+удаление тысяч агентов/инструментов дает тысячи уведомлений, и listener
+каждого воркера обрабатывает их по одному. Statement-level триггер с
+transition таблицей отправляет одно уведомление на запрос со списком ids.
+
+pg_notify ограничивает payload ~8000 байт - если список не помещается,
+отправляется {"truncated": true} и listener сбрасывает кэш таблицы целиком.
+Transition таблицы не поддерживаются триггерами на несколько событий,
+поэтому INSERT и DELETE - отдельные триггеры.
+"""
+
+from alembic import op
+
+
+# revision identifiers
+revision = "9c4b1e7d2a6f"
+down_revision = "5d2e7f1a9b3c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Функция notify_cache_invalidation_batch() и statement-level триггеры agents/tools"""
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation_batch()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            payload TEXT;
+            row_count INTEGER;
+        BEGIN
+            -- Затронутые строки: new_rows для INSERT, old_rows для DELETE
+            IF TG_OP = 'INSERT' THEN
+                IF TG_TABLE_NAME = 'agents' THEN
+                    SELECT count(*), json_build_object(
+                        'operation', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'ids', json_agg(id::text),
+                        'agent_ids', json_agg(agent_id),
+                        'count', count(*),
+                        'ts', extract(epoch from clock_timestamp())
+                    )::text INTO row_count, payload FROM new_rows;
+                ELSE
+                    SELECT count(*), json_build_object(
+                        'operation', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'ids', json_agg(id::text),
+                        'count', count(*),
+                        'ts', extract(epoch from clock_timestamp())
+                    )::text INTO row_count, payload FROM new_rows;
+                END IF;
+            ELSE
+                IF TG_TABLE_NAME = 'agents' THEN
+                    SELECT count(*), json_build_object(
+                        'operation', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'ids', json_agg(id::text),
+                        'agent_ids', json_agg(agent_id),
+                        'count', count(*),
+                        'ts', extract(epoch from clock_timestamp())
+                    )::text INTO row_count, payload FROM old_rows;
+                ELSE
+                    SELECT count(*), json_build_object(
+                        'operation', TG_OP,
+                        'table', TG_TABLE_NAME,
+                        'ids', json_agg(id::text),
+                        'count', count(*),
+                        'ts', extract(epoch from clock_timestamp())
+                    )::text INTO row_count, payload FROM old_rows;
+                END IF;
+            END IF;
+
+            -- Запрос не затронул строк - уведомлять не о чем
+            IF row_count = 0 THEN
+                RETURN NULL;
+            END IF;
+
+            -- Лимит payload pg_notify - listener инвалидирует таблицу целиком
+            IF octet_length(payload) > 7900 THEN
+                payload = json_build_object(
+                    'operation', TG_OP,
+                    'table', TG_TABLE_NAME,
+                    'count', row_count,
+                    'truncated', true,
+                    'ts', extract(epoch from clock_timestamp())
+                )::text;
+            END IF;
+
+            PERFORM pg_notify('cache_invalidation', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("DROP TRIGGER IF EXISTS agents_cache_invalidation_trigger ON agents;")
+    op.execute("DROP TRIGGER IF EXISTS tools_cache_invalidation_trigger ON tools;")
+
+    for table in ("agents", "tools"):
+        op.execute(f"""
+            CREATE TRIGGER {table}_cache_invalidation_insert_trigger
+            AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation_batch();
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_cache_invalidation_delete_trigger
+            AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation_batch();
+        """)
+
+
+def downgrade():
+    """Возвращает row-level триггеры notify_cache_invalidation()"""
+    for table in ("agents", "tools"):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_invalidation_insert_trigger ON {table};")
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_invalidation_delete_trigger ON {table};")
+        op.execute(f"""
+            CREATE TRIGGER {table}_cache_invalidation_trigger
+            AFTER INSERT OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation();
+        """)
+
+    op.execute("DROP FUNCTION IF EXISTS notify_cache_invalidation_batch();")
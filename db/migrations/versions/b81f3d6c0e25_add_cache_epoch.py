@@ -0,0 +1,32 @@
+"""
+Добавить таблицу cache_epoch - общий epoch полной очистки кэшей.
+
+/v1/cache/clear увеличивает epoch и публикует команду через pg_notify.
+Listener каждого воркера сверяет epoch при проверке соединения и очищает
+кэши, если пропустил уведомление (был отключен в момент очистки).
+"""
+
+from alembic import op
+
+
+# revision identifiers
+revision = "b81f3d6c0e25"
+down_revision = "9c4b1e7d2a6f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Таблица из одной строки (id = 1)"""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS cache_epoch (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            epoch BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    """)
+    op.execute("INSERT INTO cache_epoch (id, epoch) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS cache_epoch;")
@@ -0,0 +1,97 @@
+"""
+Statement-level UPDATE триггеры инвалидации кэша agents/tools.
+
+Триггеры INSERT/DELETE не замечали деактивацию (is_active = false) и изменение
+конфигурации: закэшированный агент заменялся только при следующем чтении строки
+и сравнении updated_at, а список доступных агентов жил до 5 минут.
+
+Уведомление содержит по каждой измененной строке набор измененных колонок и
+новую версию (updated_at) - listener инвалидирует только то, что изменилось:
+список агентов - при смене is_active/agent_id, агента - если закэширована
+другая версия, агентов с инструментом - при изменении инструмента.
+"""
+
+from alembic import op
+
+
+# revision identifiers
+revision = "d2a7c5e9f041"
+down_revision = "b81f3d6c0e25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Функция notify_cache_update_batch() и триггеры AFTER UPDATE для agents/tools"""
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_update_batch()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            payload TEXT;
+            row_count INTEGER;
+        BEGIN
+            SELECT count(*), json_build_object(
+                'operation', TG_OP,
+                'table', TG_TABLE_NAME,
+                'rows', json_agg(json_strip_nulls(json_build_object(
+                    'id', c.id,
+                    'agent_id', c.new_row->>'agent_id',
+                    'old_agent_id', CASE WHEN 'agent_id' = ANY(c.changed) THEN c.old_row->>'agent_id' END,
+                    'changed', c.changed,
+                    'is_active', (c.new_row->>'is_active')::boolean,
+                    'version', c.new_row->>'updated_at'
+                ))),
+                'count', count(*),
+                'ts', extract(epoch from clock_timestamp())
+            )::text INTO row_count, payload
+            FROM (
+                SELECT
+                    n.id::text AS id,
+                    to_jsonb(o) AS old_row,
+                    to_jsonb(n) AS new_row,
+                    -- Измененные колонки (updated_at передается отдельно как version)
+                    ARRAY(
+                        SELECT e.key FROM jsonb_each(to_jsonb(n)) AS e
+                        WHERE e.key <> 'updated_at' AND e.value IS DISTINCT FROM to_jsonb(o)->e.key
+                    ) AS changed
+                FROM new_rows n
+                JOIN old_rows o ON o.id = n.id
+            ) c
+            WHERE c.old_row IS DISTINCT FROM c.new_row;
+
+            -- UPDATE без фактических изменений - уведомлять не о чем
+            IF row_count = 0 THEN
+                RETURN NULL;
+            END IF;
+
+            -- Лимит payload pg_notify - listener инвалидирует таблицу целиком
+            IF octet_length(payload) > 7900 THEN
+                payload = json_build_object(
+                    'operation', TG_OP,
+                    'table', TG_TABLE_NAME,
+                    'count', row_count,
+                    'truncated', true,
+                    'ts', extract(epoch from clock_timestamp())
+                )::text;
+            END IF;
+
+            PERFORM pg_notify('cache_invalidation', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    for table in ("agents", "tools"):
+        op.execute(f"""
+            CREATE TRIGGER {table}_cache_invalidation_update_trigger
+            AFTER UPDATE ON {table}
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_update_batch();
+        """)
+
+
+def downgrade():
+    for table in ("agents", "tools"):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_invalidation_update_trigger ON {table};")
+
+    op.execute("DROP FUNCTION IF EXISTS notify_cache_update_batch();")
@@ -0,0 +1,48 @@
+"""
+Добавить таблицу response_semantic_cache - семантический кэш ответов агентов.
+
+Ответ агента сохраняется вместе с эмбеддингом запроса; перефразированный
+запрос к той же версии агента находит ближайший сохраненный ответ по
+косинусной близости. Поиск всегда ограничен областью (агент, версия
+конфигурации, модель, stream), число записей в области ограничено
+(semantic_cache_max_scope_entries, старые удаляются при записи), поэтому
+используется B-tree индекс области и точная сортировка по расстоянию:
+HNSW индекс с фильтром по области может не вернуть ближайшую запись.
+"""
+
+from alembic import op
+
+
+# revision identifiers
+revision = "e6b3a9d1c570"
+down_revision = "d2a7c5e9f041"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Расширение vector, таблица и индекс области поиска"""
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS response_semantic_cache (
+            id BIGSERIAL PRIMARY KEY,
+            agent_row_id UUID NOT NULL REFERENCES agents(id) ON DELETE CASCADE,
+            version TEXT NOT NULL,
+            model TEXT NOT NULL,
+            stream BOOLEAN NOT NULL,
+            message TEXT NOT NULL,
+            embedding vector(1536) NOT NULL,
+            response JSONB NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            expires_at TIMESTAMP NOT NULL
+        );
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_response_semantic_cache_scope
+            ON response_semantic_cache (agent_row_id, version, model, stream);
+    """)
+
+
+def downgrade():
+    """Удалить таблицу семантического кэша (расширение vector используется knowledge)"""
+    op.execute("DROP TABLE IF EXISTS response_semantic_cache;")
@@ -0,0 +1,300 @@
+"""
+Компактизация и retention таблиц сессий agno.
+
+Каждый запуск агента с storage дописывает run в memory->'runs' сессии, а
+add_history_to_messages / read_chat_history десериализуют весь JSON сессии.
+Операции выполняются на стороне Postgres (jsonb функции), без чтения сессий
+в Python, пачками по session_id с FOR UPDATE SKIP LOCKED - активные сессии
+не блокируются, каждая пачка - отдельная короткая транзакция.
+
+- trim_session_runs: оставляет последние N runs сессии
+- archive_old_sessions: переносит давно не обновлявшиеся сессии в <table>_archive
+- session_size_report / memory_size_report: объем данных по агенту и пользователям
+- recent_session_activity: самые активные агенты и пользователи (прогрев кэшей)
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from db.session_transfer import SESSION_COLUMNS
+from db.sessions import SESSIONS_SCHEMA
+
+ARCHIVE_SUFFIX = "_archive"
+
+# Количество runs в сессии (memory->'runs' - массив для mode="agent")
+_RUNS_COUNT = "CASE WHEN jsonb_typeof(memory->'runs') = 'array' THEN jsonb_array_length(memory->'runs') ELSE 0 END"
+# Summary сессии: memory->'summaries'->user_id->session_id (Memory v2)
+_HAS_SUMMARY = "(memory->'summaries'->COALESCE(user_id, 'default')->session_id) IS NOT NULL"
+
+
+def _quoted(conn: Connection, table_name: str) -> str:
+    preparer = conn.dialect.identifier_preparer
+    return f"{preparer.quote_schema(SESSIONS_SCHEMA)}.{preparer.quote(table_name)}"
+
+
+def archive_table_name(table_name: str) -> str:
+    return f"{table_name}{ARCHIVE_SUFFIX}"
+
+
+def table_exists(conn: Connection, table_name: str) -> bool:
+    return bool(
+        conn.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"),
+            {"name": f"{SESSIONS_SCHEMA}.{table_name}"},
+        ).scalar()
+    )
+
+
+def trim_session_runs(
+    engine: Engine,
+    table_name: str,
+    agent_id: str,
+    keep_runs: int,
+    summarized_only: bool = False,
+    batch_size: int = 200,
+) -> int:
+    """
+    Удаляет старые runs сверх keep_runs последних.
+
+    Args:
+        summarized_only: обрезать только сессии с summary (summary заменяет старые runs)
+
+    Returns:
+        Количество обрезанных сессий
+    """
+    if keep_runs < 0:
+        return 0
+
+    trimmed = 0
+    after = ""
+    while True:
+        with engine.begin() as conn:
+            table = _quoted(conn, table_name)
+            summary_filter = f"AND {_HAS_SUMMARY}" if summarized_only else ""
+            # updated_at не меняется - компактизация не считается активностью сессии
+            rows = (
+                conn.execute(
+                    text(f"""
+                WITH candidates AS (
+                    SELECT session_id FROM {table}
+                    WHERE agent_id = :agent_id
+                      AND session_id > :after
+                      AND {_RUNS_COUNT} > :keep_runs
+                      {summary_filter}
+                    ORDER BY session_id
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE {table} AS s
+                SET memory = jsonb_set(s.memory, '{{runs}}', COALESCE((
+                    SELECT jsonb_agg(run ORDER BY position)
+                    FROM jsonb_array_elements(s.memory->'runs') WITH ORDINALITY AS r(run, position)
+                    WHERE position > jsonb_array_length(s.memory->'runs') - :keep_runs
+                ), '[]'::jsonb))
+                FROM candidates
+                WHERE s.session_id = candidates.session_id
+                RETURNING s.session_id
+            """),
+                    {
+                        "agent_id": agent_id,
+                        "after": after,
+                        "keep_runs": keep_runs,
+                        "batch_size": batch_size,
+                    },
+                )
+                .scalars()
+                .all()
+            )
+
+        trimmed += len(rows)
+        if len(rows) < batch_size:
+            return trimmed
+        after = max(rows)
+
+
+def ensure_archive_table(conn: Connection, table_name: str) -> str:
+    """Создает архивную таблицу по структуре таблицы сессий (если ее нет)"""
+    archive_name = archive_table_name(table_name)
+    archive = _quoted(conn, archive_name)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE {_quoted(conn, table_name)} INCLUDING ALL)"))
+    conn.execute(text(f"ALTER TABLE {archive} ADD COLUMN IF NOT EXISTS archived_at BIGINT"))
+    return archive_name
+
+
+def archive_old_sessions(
+    engine: Engine,
+    table_name: str,
+    agent_id: str,
+    older_than_days: int,
+    batch_size: int = 200,
+) -> int:
+    """
+    Переносит сессии без обновлений дольше older_than_days в архивную таблицу.
+
+    Returns:
+        Количество перенесенных сессий
+    """
+    if older_than_days <= 0:
+        return 0
+
+    now = int(time.time())
+    cutoff = now - older_than_days * 86400
+    columns = ", ".join(SESSION_COLUMNS)
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in SESSION_COLUMNS if name != "session_id")
+
+    with engine.begin() as conn:
+        archive = _quoted(conn, ensure_archive_table(conn, table_name))
+
+    archived = 0
+    while True:
+        with engine.begin() as conn:
+            table = _quoted(conn, table_name)
+            moved = conn.execute(
+                text(f"""
+                WITH moved AS (
+                    DELETE FROM {table}
+                    WHERE session_id IN (
+                        SELECT session_id FROM {table}
+                        WHERE agent_id = :agent_id
+                          AND COALESCE(updated_at, created_at) < :cutoff
+                        ORDER BY session_id
+                        LIMIT :batch_size
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING {columns}
+                )
+                INSERT INTO {archive} ({columns}, archived_at)
+                SELECT {columns}, :now FROM moved
+                ON CONFLICT (session_id) DO UPDATE SET {updates}, archived_at = EXCLUDED.archived_at
+            """),
+                {
+                    "agent_id": agent_id,
+                    "cutoff": cutoff,
+                    "batch_size": batch_size,
+                    "now": now,
+                },
+            ).rowcount
+
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def session_size_report(
+    engine: Engine,
+    table_name: str,
+    agent_id: str,
+    by_user: bool = False,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """
+    Объем сессий агента: количество, runs, байты (pg_column_size - размер с TOAST сжатием).
+
+    При by_user - дополнительно пользователи с наибольшим объемом.
+    """
+    aggregates = f"""
+        COUNT(*) AS sessions,
+        COALESCE(SUM({_RUNS_COUNT}), 0) AS runs,
+        COALESCE(MAX({_RUNS_COUNT}), 0) AS max_runs,
+        COALESCE(SUM(pg_column_size(memory)), 0) AS memory_bytes,
+        COALESCE(SUM(pg_column_size(t.*)), 0) AS total_bytes
+    """
+    with engine.connect() as conn:
+        if not table_exists(conn, table_name):
+            return {"table": table_name, "agent_id": agent_id, "totals": None, "archived": None}
+
+        table = _quoted(conn, table_name)
+        params = {"agent_id": agent_id, "limit": limit}
+        totals = (
+            conn.execute(text(f"SELECT {aggregates} FROM {table} AS t WHERE agent_id = :agent_id"), params)
+            .mappings()
+            .one()
+        )
+
+        report: Dict[str, Any] = {"table": table_name, "agent_id": agent_id, "totals": dict(totals)}
+
+        archive_name = archive_table_name(table_name)
+        report["archived"] = None
+        if table_exists(conn, archive_name):
+            archived = (
+                conn.execute(
+                    text(f"SELECT {aggregates} FROM {_quoted(conn, archive_name)} AS t WHERE agent_id = :agent_id"),
+                    params,
+                )
+                .mappings()
+                .one()
+            )
+            report["archived"] = dict(archived)
+
+        if by_user:
+            users = (
+                conn.execute(
+                    text(f"""
+                SELECT user_id, {aggregates}
+                FROM {table} AS t
+                WHERE agent_id = :agent_id
+                GROUP BY user_id
+                ORDER BY total_bytes DESC
+                LIMIT :limit
+            """),
+                    params,
+                )
+                .mappings()
+                .all()
+            )
+            report["users"] = [dict(row) for row in users]
+
+    return report
+
+
+def memory_size_report(
+    engine: Engine,
+    memory_table: str,
+    user_ids: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Количество и объем памяти по пользователям"""
+    with engine.connect() as conn:
+        if not table_exists(conn, memory_table):
+            return {}
+        query = f"""
+            SELECT user_id, COUNT(*) AS memories, COALESCE(SUM(pg_column_size(memory)), 0) AS memory_bytes
+            FROM {_quoted(conn, memory_table)}
+        """
+        params: Dict[str, Any] = {}
+        if user_ids is not None:
+            query += " WHERE user_id = ANY(:user_ids)"
+            params["user_ids"] = list(user_ids)
+        query += " GROUP BY user_id"
+        rows = conn.execute(text(query), params).mappings().all()
+    return {row["user_id"]: {"memories": row["memories"], "memory_bytes": row["memory_bytes"]} for row in rows}
+
+
+def recent_session_activity(
+    engine: Engine,
+    table_name: str,
+    since: int,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """Пары (agent_id, user_id) с наибольшим числом сессий, обновленных после since (epoch)"""
+    with engine.connect() as conn:
+        if not table_exists(conn, table_name):
+            return []
+        rows = (
+            conn.execute(
+                text(f"""
+            SELECT agent_id, user_id, COUNT(*) AS sessions
+            FROM {_quoted(conn, table_name)}
+            WHERE COALESCE(updated_at, created_at) >= :since
+            GROUP BY agent_id, user_id
+            ORDER BY sessions DESC
+            LIMIT :limit
+        """),
+                {"since": since, "limit": limit},
+            )
+            .mappings()
+            .all()
+        )
+    return [dict(row) for row in rows]
@@ -0,0 +1,278 @@
+"""
+Экспорт и импорт сессий агента и памяти пользователей в формате NDJSON.
+
+Одна строка - одна запись: {"type": "session", ...колонки таблицы сессий}
+или {"type": "memory", ...колонки таблицы памяти}. Экспорт читает строки
+серверным курсором (stream_results) пачками, импорт пишет пачками
+INSERT ... ON CONFLICT - память процесса не зависит от числа строк.
+
+Таблицы сессий и памяти общие для агентов и пользователей: импорт
+перезаписывает только строки, которые уже принадлежат целевому агенту
+и пользователю, строки с чужими ключами пропускаются.
+"""
+
+import gzip
+import io
+import json
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from sqlalchemy import BigInteger, DateTime, String, and_, column, select, table
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.engine import Connection, Engine
+
+from db.sessions import SESSIONS_SCHEMA
+
+# Версия формата - в первой строке экспорта
+TRANSFER_FORMAT = "crafty-sessions"
+TRANSFER_VERSION = 1
+
+# Размер чанка ответа при стриминге экспорта
+EXPORT_CHUNK_BYTES = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Колонки таблицы сессий agno (PostgresAgentStorage, mode="agent")
+SESSION_COLUMNS = {
+    "session_id": String,
+    "user_id": String,
+    "agent_id": String,
+    "team_session_id": String,
+    "memory": JSONB,
+    "session_data": JSONB,
+    "extra_data": JSONB,
+    "agent_data": JSONB,
+    "created_at": BigInteger,
+    "updated_at": BigInteger,
+}
+
+# Колонки таблицы памяти agno (PostgresMemoryDb)
+MEMORY_COLUMNS = {
+    "id": String,
+    "user_id": String,
+    "memory": JSONB,
+    "created_at": DateTime(timezone=True),
+    "updated_at": DateTime(timezone=True),
+}
+
+
+def _table(table_name: str, columns: Dict[str, Any]):
+    return table(
+        table_name,
+        *(column(name, type_) for name, type_ in columns.items()),
+        schema=SESSIONS_SCHEMA,
+    )
+
+
+def _json_line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, default=_json_default, separators=(",", ":")) + "\n"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_export_lines(
+    engine: Engine,
+    table_name: str,
+    agent_id: str,
+    user_id: Optional[str] = None,
+    memory_table: Optional[str] = None,
+    batch_size: int = 500,
+) -> Iterator[str]:
+    """
+    Строки NDJSON экспорта: заголовок, сессии агента, затем память их пользователей.
+
+    Память в agno не привязана к агенту - выгружается память пользователей,
+    у которых есть сессии этого агента (или только user_id, если он задан).
+    """
+    sessions = _table(table_name, SESSION_COLUMNS)
+    session_filter = [sessions.c.agent_id == agent_id]
+    if user_id:
+        session_filter.append(sessions.c.user_id == user_id)
+
+    yield _json_line(
+        {
+            "type": "header",
+            "format": TRANSFER_FORMAT,
+            "version": TRANSFER_VERSION,
+            "agent_id": agent_id,
+            "user_id": user_id,
+        }
+    )
+
+    with engine.connect() as conn:
+        streaming = conn.execution_options(stream_results=True, yield_per=batch_size)
+
+        query = select(sessions).where(*session_filter).order_by(sessions.c.created_at, sessions.c.session_id)
+        for row in streaming.execute(query):
+            yield _json_line({"type": "session", **row._asdict()})
+
+        if memory_table:
+            memories = _table(memory_table, MEMORY_COLUMNS)
+            if user_id:
+                memory_filter = memories.c.user_id == user_id
+            else:
+                session_users = select(sessions.c.user_id).where(*session_filter).distinct()
+                memory_filter = memories.c.user_id.in_(session_users.scalar_subquery())
+            query = select(memories).where(memory_filter).order_by(memories.c.id)
+            for row in streaming.execute(query):
+                yield _json_line({"type": "memory", **row._asdict()})
+
+
+def iter_export_chunks(lines: Iterable[str], compress: bool = False) -> Iterator[bytes]:
+    """Склеивает строки в чанки ~EXPORT_CHUNK_BYTES, при compress - потоковый gzip"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def open_ndjson(source: BinaryIO) -> TextIO:
+    """Текстовый поток строк загруженного NDJSON (gzip определяется по сигнатуре)"""
+    source.seek(0)
+    compressed = source.read(2) == GZIP_MAGIC
+    source.seek(0)
+    if compressed:
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=source, mode="rb"), encoding="utf-8")
+    return io.TextIOWrapper(source, encoding="utf-8")
+
+
+def _upsert(conn: Connection, target, key: str, rows: List[Dict[str, Any]], owner_columns: Sequence[str]) -> int:
+    """
+    INSERT ... ON CONFLICT DO UPDATE только для строк того же владельца.
+
+    Повтор ключа в одном INSERT ... ON CONFLICT Postgres не допускает - из строк
+    пачки с одним ключом записывается последняя (как при построчном импорте).
+
+    Returns:
+        Число записанных строк (конфликт со строкой другого владельца и
+        перекрытые повторы ключа строку не пишут)
+    """
+    rows = list({row[key]: row for row in rows}.values())
+    stmt = insert(target).values(rows)
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={name: stmt.excluded[name] for name in rows[0] if name != key},
+        where=and_(*(target.c[name].is_not_distinct_from(stmt.excluded[name]) for name in owner_columns)),
+    )
+    return len(conn.execute(upsert.returning(target.c[key])).fetchall())
+
+
+def _session_row(record: Dict[str, Any], agent_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    row = {name: record.get(name) for name in SESSION_COLUMNS}
+    if not row["session_id"]:
+        raise ValueError("session record without session_id")
+    # Сессии переносятся под agent_id целевого агента (и user_id, если он задан)
+    row["agent_id"] = agent_id
+    if user_id:
+        row["user_id"] = user_id
+    # NULL в явном INSERT перекрыл бы server_default колонки
+    if row["created_at"] is None:
+        row["created_at"] = int(time.time())
+    return row
+
+
+def _memory_row(record: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
+    row = {name: record.get(name) for name in MEMORY_COLUMNS}
+    if not row["id"]:
+        raise ValueError("memory record without id")
+    if user_id:
+        row["user_id"] = user_id
+    for name in ("created_at", "updated_at"):
+        value = row[name]
+        if isinstance(value, str):
+            row[name] = datetime.fromisoformat(value)
+    if row["created_at"] is None:
+        row["created_at"] = datetime.now(timezone.utc)
+    return row
+
+
+def import_lines(
+    engine: Engine,
+    lines: Iterable[str],
+    table_name: str,
+    agent_id: str,
+    user_id: Optional[str] = None,
+    memory_table: Optional[str] = None,
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """
+    Импортирует NDJSON экспорта в одной транзакции (ошибка в любой строке откатывает все).
+
+    Записи переносятся под agent_id целевого агента, при заданном user_id -
+    и под этого пользователя. Существующая сессия с тем же session_id
+    перезаписывается, только если принадлежит тому же агенту и пользователю,
+    память с тем же id - тому же пользователю; остальные записи считаются
+    в skipped. Из повторов одного session_id/id в файле записывается последний,
+    предыдущие в той же пачке считаются в skipped. Память пропускается, если у целевого агента memory выключена.
+
+    Raises:
+        ValueError: некорректная строка (с номером строки)
+    """
+    sessions = _table(table_name, SESSION_COLUMNS)
+    memories = _table(memory_table, MEMORY_COLUMNS) if memory_table else None
+    counts = {"sessions": 0, "memories": 0, "skipped": 0}
+    session_batch: List[Dict[str, Any]] = []
+    memory_batch: List[Dict[str, Any]] = []
+
+    def flush_sessions() -> None:
+        written = _upsert(conn, sessions, "session_id", session_batch, ("agent_id", "user_id"))
+        counts["sessions"] += written
+        counts["skipped"] += len(session_batch) - written
+        session_batch.clear()
+
+    def flush_memories() -> None:
+        written = _upsert(conn, memories, "id", memory_batch, ("user_id",))
+        counts["memories"] += written
+        counts["skipped"] += len(memory_batch) - written
+        memory_batch.clear()
+
+    with engine.begin() as conn:
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                record_type = record.pop("type", None)
+                if record_type == "session":
+                    session_batch.append(_session_row(record, agent_id, user_id))
+                elif record_type == "memory" and memories is not None:
+                    memory_batch.append(_memory_row(record, user_id))
+                elif record_type == "header":
+                    if record.get("format") != TRANSFER_FORMAT:
+                        raise ValueError(f"unsupported format {record.get('format')}")
+                else:
+                    counts["skipped"] += 1
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"Invalid record at line {line_number}: {e}")
+
+            if len(session_batch) >= batch_size:
+                flush_sessions()
+            if len(memory_batch) >= batch_size:
+                flush_memories()
+
+        if session_batch:
+            flush_sessions()
+        if memory_batch:
+            flush_memories()
+
+    return counts
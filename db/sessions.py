@@ -0,0 +1,129 @@
+"""
+Легкие запросы к таблице сессий agno (PostgresAgentStorage) без построения агента.
+
+agent.storage.get_all_sessions() читает строки целиком вместе с memory/session_data JSON.
+Для списка сессий нужны только id, имя и created_at - выбираем только эти колонки
+с keyset пагинацией по (created_at, session_id).
+
+Индексы списка создаются для каждой таблицы сессий при ее создании agno и при
+первом обращении к storage таблицы (agents/session_storage.py, agents/storage_resolver.py).
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import column, literal, select, table, text, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Схема таблиц agno storage (как в PostgresAgentStorage(schema="public"))
+SESSIONS_SCHEMA = "public"
+
+
+def _sessions_table(table_name: str):
+    """Описание нужных колонок таблицы сессий (без reflection)"""
+    return table(
+        table_name,
+        column("session_id"),
+        column("user_id"),
+        column("agent_id"),
+        column("session_data", JSONB),
+        column("created_at"),
+        schema=SESSIONS_SCHEMA,
+    )
+
+
+def ensure_session_list_indexes(engine: Engine, table_name: str) -> None:
+    """
+    Индексы (agent_id, created_at, session_id) и (agent_id, user_id, created_at, session_id).
+
+    CREATE INDEX CONCURRENTLY вне транзакции - построение индекса на существующей
+    таблице не блокирует запись сессий. Для таблицы sessions имена совпадают
+    с миграцией 5d2e7f1a9b3c.
+    """
+    quoted = engine.dialect.identifier_preparer.quote
+    target = f"{quoted(SESSIONS_SCHEMA)}.{quoted(table_name)}"
+    indexes = {
+        f"ix_{table_name}_agent_created": "agent_id, created_at DESC, session_id DESC",
+        f"ix_{table_name}_agent_user_created": "agent_id, user_id, created_at DESC, session_id DESC",
+    }
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index_name, columns in indexes.items():
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quoted(index_name)} ON {target} ({columns})"))
+
+
+def encode_cursor(created_at: int, session_id: str) -> str:
+    """Непрозрачный курсор страницы: позиция последней выданной сессии"""
+    raw = json.dumps([created_at, session_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    """
+    Raises:
+        ValueError: некорректный курсор
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, session_id = json.loads(raw)
+        return int(created_at), str(session_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def list_session_summaries(
+    db: Session,
+    table_name: str,
+    agent_id: str,
+    user_id: Optional[str] = None,
+    limit: Optional[int] = 100,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Страница сессий агента, новые первыми (limit=None - все сессии одним списком).
+
+    Returns:
+        (сессии, курсор следующей страницы или None)
+    """
+    sessions = _sessions_table(table_name)
+    created_at = sessions.c.created_at
+    session_id = sessions.c.session_id
+
+    query = (
+        select(
+            session_id,
+            sessions.c.session_data["session_name"].astext.label("session_name"),
+            created_at,
+        )
+        .where(sessions.c.agent_id == agent_id)
+        .order_by(created_at.desc(), session_id.desc())
+    )
+    if limit is not None:
+        query = query.limit(limit + 1)  # +1 строка - признак следующей страницы
+    if user_id:
+        query = query.where(sessions.c.user_id == user_id)
+    if cursor:
+        last_created_at, last_session_id = decode_cursor(cursor)
+        # Сравнение строк (created_at, session_id) - использует индекс без OFFSET
+        query = query.where(tuple_(created_at, session_id) < tuple_(literal(last_created_at), literal(last_session_id)))
+
+    rows = db.execute(query).all()
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at or 0, last.session_id)
+
+    return [
+        {
+            "session_id": row.session_id,
+            "session_name": row.session_name,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ], next_cursor